@@ -0,0 +1,114 @@
+" --------------------------------
+" Add our plugin to the path
+" --------------------------------
+python import sys
+python import vim
+python sys.path.append(vim.eval('expand("<sfile>:p:h:h")') + '/plugin')
+
+" --------------------------------
+"  Change notifications
+" --------------------------------
+augroup TeamEditor
+    autocmd!
+    if exists('##TextChanged')
+        autocmd TextChanged,TextChangedI * py teamEditor.onChange()
+    endif
+    autocmd CursorMoved,CursorMovedI * py teamEditor.onChange()
+    if !has('timers')
+        " without timers, the packets received are only applied when the editor reports activity
+        autocmd CursorHold,CursorHoldI * py teamEditor.onChange()
+    endif
+augroup END
+
+" --------------------------------
+"  Function(s)
+" --------------------------------
+
+" Runs the :TeamEditor command
+function! TeamEditor#Execute (...)
+    py teamEditor.execute(*vim.eval('a:000'))
+endfunction
+
+function! TeamEditor#SetCursorColors ()
+    hi CursorUser gui=bold term=bold cterm=bold
+    hi Cursor1 ctermbg=DarkRed ctermfg=White guibg=DarkRed guifg=White gui=bold term=bold cterm=bold
+    hi Cursor2 ctermbg=DarkBlue ctermfg=White guibg=DarkBlue guifg=White gui=bold term=bold cterm=bold
+    hi Cursor3 ctermbg=DarkGreen ctermfg=White guibg=DarkGreen guifg=White gui=bold term=bold cterm=bold
+    hi Cursor4 ctermbg=DarkCyan ctermfg=White guibg=DarkCyan guifg=White gui=bold term=bold cterm=bold
+    hi Cursor5 ctermbg=DarkMagenta ctermfg=White guibg=DarkMagenta guifg=White gui=bold term=bold cterm=bold
+    hi Cursor6 ctermbg=DarkYellow ctermfg=White guibg=DarkYellow guifg=White gui=bold term=bold cterm=bold
+    hi Cursor7 ctermbg=LightRed ctermfg=Black guibg=LightRed guifg=Black gui=bold term=bold cterm=bold
+    hi Cursor8 ctermbg=LightBlue ctermfg=Black guibg=LightBlue guifg=Black gui=bold term=bold cterm=bold
+    hi Cursor9 ctermbg=LightGreen ctermfg=Black guibg=LightGreen guifg=Black gui=bold term=bold cterm=bold
+    hi Cursor10 ctermbg=LightCyan ctermfg=Black guibg=LightCyan guifg=Black gui=bold term=bold cterm=bold
+    hi Cursor0 ctermbg=LightMagenta ctermfg=Black guibg=LightMagenta guifg=Black gui=bold term=bold cterm=bold
+endfunction
+
+" Changes made to the watched buffer since they were last taken, as [first changed line, line below the changed
+" ones before the change, number of lines added] entries, and the listener collecting them
+let s:changes = []
+let s:listener = 0
+let s:buffer = 0
+
+" Starts collecting the changes made to the current buffer, returns whether the editor reports them
+function! TeamEditor#WatchChanges ()
+    call TeamEditor#UnwatchChanges()
+    if !exists('*listener_add')
+        return 0
+    endif
+    let s:buffer = bufnr('%')
+    let s:listener = listener_add('TeamEditor#OnLinesChanged', s:buffer)
+    return 1
+endfunction
+
+function! TeamEditor#UnwatchChanges ()
+    if s:listener
+        call listener_remove(s:listener)
+        let s:listener = 0
+    endif
+    let s:changes = []
+endfunction
+
+function! TeamEditor#OnLinesChanged (bufnr, start, end, added, changes)
+    call add(s:changes, [a:start, a:end, a:added])
+endfunction
+
+" Returns and forgets the changes collected so far
+function! TeamEditor#TakeChanges ()
+    if s:listener
+        call listener_flush(s:buffer)
+    endif
+    let changes = s:changes
+    let s:changes = []
+    return changes
+endfunction
+
+" Called on the main thread while connected, to apply the packets received by the daemon thread
+function! TeamEditor#Tick (timer)
+    py teamEditor.onTimer()
+endfunction
+
+" Moves several cursors at once, given as a list of [match id, highlight group, column, line]
+function! TeamEditor#UpdateCursors (cursors)
+    for [id, group, x, y] in a:cursors
+        silent! call matchdelete(id)
+        if exists('*matchaddpos')
+            call matchaddpos(group, [[y, x]], 10, id)
+        else
+            call matchadd(group, '\%' . x . 'v.\%' . y . 'l', 10, id)
+        endif
+    endfor
+endfunction
+
+
+python << endOfPython
+
+###
+# Python starts from here.
+# Supported: python 2.7
+###
+from editorClient import *
+
+teamEditor = EditorController()
+
+endOfPython
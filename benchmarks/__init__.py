@@ -0,0 +1,11 @@
+"""
+Benchmarks of the collaborative text editor. The plugin modules import each other as top-level modules, so the
+plugin directory is put on the path.
+"""
+import os
+import sys
+
+PLUGIN_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugin')
+
+if PLUGIN_DIRECTORY not in sys.path:
+    sys.path.insert(0, PLUGIN_DIRECTORY)
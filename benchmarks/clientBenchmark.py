@@ -0,0 +1,264 @@
+"""
+Microbenchmarks of the client: the time spent inside the editor to turn local changes into an update packet, to
+apply the packets received from the server and to draw the cursors of the other users.
+
+The client runs against the fake vim module through VimUI, or with --view memory against an in-memory view, which
+leaves out the cost of the vim calls. Run from the repository root:
+
+    python -m benchmarks.clientBenchmark --sizes 1000,100000 --json client.json
+"""
+import argparse
+import random
+from timeit import default_timer
+
+from benchmarks import fakeVim
+from benchmarks.memoryEditor import MemoryEditorView, MemoryPlatform
+from benchmarks.report import environment, formatSummary, summarize, writeReport
+
+fakeVim.install()
+
+from documentStore import DocumentStore
+from editorClient import CursorManager, EditorModel
+from operations import INSERT_LINES, INSERT_TEXT
+from vimUI import VimUI
+from wireProtocol import BinaryCodec
+
+# Edit patterns of each benchmark
+UPDATE_PATTERNS = ('idle', 'keystroke', 'newline', 'paste')
+RECEIVE_PATTERNS = ('keystroke', 'newline', 'paste', 'batch')
+CURSOR_PATTERNS = ('still', 'moveOne', 'moveAll')
+
+# Number of lines of a paste and number of packets of a batch
+PASTE_LINES = 100
+BATCH_PACKETS = 10
+
+# Name of the user the received packets come from
+PEER = 'peer'
+
+
+class BenchmarkController(object):
+    """
+    The part of the editor controller the model uses
+    """
+    __slots__ = 'platform', 'changed'
+
+    def __init__(self):
+        self.platform = MemoryPlatform()
+        self.changed = False
+
+    def onChange(self):
+        self.changed = True
+
+    def startDaemonThread(self):
+        pass
+
+    def stopDaemonThread(self):
+        pass
+
+
+def createModel(lines, view):
+    """
+    Create a client model connected to nothing, showing a document
+    :param lines: the lines of the document
+    :param view: 'vim' for VimUI over the fake vim module, 'memory' for the in-memory view
+    :return: the model
+    """
+    if view == 'vim':
+        fakeVim.reset(lines)
+        ui = VimUI()
+    else:
+        ui = MemoryEditorView(lines)
+    model = EditorModel(BenchmarkController(), ui)
+    model.name = 'bench'
+    model.port = 0
+    model.prevBuffer = DocumentStore()
+    model.prevBuffer.setLines(lines)
+    model.cursorManager = CursorManager(model)
+    model.binaryCodec = model.codec = BinaryCodec()
+    model.sync.reset(0)
+    model.changeTick = ui.getChangeTick()
+    model.watchChanges()
+    # prevBuffer holds the lines shown, only the changed ones are compared
+    model.changedLines = []
+    return model
+
+
+def createDocument(size):
+    return ['line %d of the document, with some text to edit' % i for i in range(size)]
+
+
+def benchUpdatePacket(model, pattern, iterations, rng):
+    """
+    Time the creation of update packets after local edits
+    :param model: the client model
+    :param pattern: the edit made before each packet, one of UPDATE_PATTERNS
+    :param iterations: the number of packets
+    :param rng: the random number generator
+    :return: the list of times in seconds
+    """
+    ui = model.ui
+    createUpdatePacket = model._EditorModel__createUpdatePacket
+    samples = []
+    for i in range(iterations):
+        size = len(model.prevBuffer)
+        line = rng.randrange(size)
+        if pattern == 'keystroke':
+            text = model.prevBuffer.getLine(line)
+            col = rng.randint(0, len(text))
+            ui.replaceLines(line, line + 1, [text[:col] + 'x' + text[col:]])
+        elif pattern == 'newline':
+            ui.replaceLines(line, line, [''])
+        elif pattern == 'paste':
+            ui.replaceLines(line, line, ['pasted line %d' % j for j in range(PASTE_LINES)])
+        d = {'type': 'update', 'data': {'cursor': {'x': 1, 'y': 1}, 'name': model.name}}
+        begin = default_timer()
+        createUpdatePacket(d)
+        samples.append(default_timer() - begin)
+        if model.sync.inflight is not None:
+            model.sync.acknowledge(model.sync.revision + 1)
+    return samples
+
+
+def benchProcessData(model, pattern, iterations, rng):
+    """
+    Time the handling of the packets of another user
+    :param model: the client model
+    :param pattern: the received edits, one of RECEIVE_PATTERNS
+    :param iterations: the number of frames
+    :param rng: the random number generator
+    :return: the list of times in seconds
+    """
+    codec = BinaryCodec()
+    model.cursorManager.addCursor(PEER, 1, 1)
+    revision = [model.sync.revision]
+
+    def packet(ops):
+        revision[0] += 1
+        line = ops[0][1]
+        return {'type': 'update', 'data': {'name': PEER, 'ops': ops, 'revision': revision[0],
+                                           'updated_cursors': [{'name': PEER, 'cursor': {'x': 1, 'y': line + 1}}]}}
+
+    samples = []
+    for i in range(iterations):
+        size = len(model.prevBuffer)
+        if pattern == 'batch':
+            packets = [codec.encode(packet([[INSERT_TEXT, rng.randrange(size), 0, 'x']]))
+                       for j in range(BATCH_PACKETS)]
+            data = b''.join(codec.encodeBatch(packets))
+        elif pattern == 'keystroke':
+            data = codec.encode(packet([[INSERT_TEXT, rng.randrange(size), 0, 'x']]))
+        elif pattern == 'newline':
+            data = codec.encode(packet([[INSERT_LINES, rng.randrange(size), ['']]]))
+        else:
+            data = codec.encode(packet([[INSERT_LINES, rng.randrange(size),
+                                         ['pasted line %d' % j for j in range(PASTE_LINES)]]]))
+        begin = default_timer()
+        model.processData(data)
+        samples.append(default_timer() - begin)
+    return samples
+
+
+def benchCursors(model, pattern, users, iterations, rng):
+    """
+    Time the drawing of the cursors of other users
+    :param model: the client model
+    :param pattern: which cursors move between two updates, one of CURSOR_PATTERNS
+    :param users: the number of other users
+    :param iterations: the number of updates
+    :param rng: the random number generator
+    :return: the list of times in seconds
+    """
+    size = len(model.prevBuffer)
+    names = ['user%d' % i for i in range(users)]
+    positions = dict((name, (1, rng.randrange(size) + 1)) for name in names)
+    for name in names:
+        model.cursorManager.addCursor(name, positions[name][0], positions[name][1])
+    samples = []
+    for i in range(iterations):
+        if pattern == 'moveOne':
+            name = rng.choice(names)
+            positions[name] = (positions[name][0] + 1, positions[name][1])
+        elif pattern == 'moveAll':
+            for name in names:
+                positions[name] = (positions[name][0] + 1, positions[name][1])
+        updates = [(name, positions[name][0], positions[name][1]) for name in names]
+        begin = default_timer()
+        model.cursorManager.updateCursors(updates)
+        samples.append(default_timer() - begin)
+    return samples
+
+
+def runBenchmark(sizes=(1000, 10000, 100000, 1000000), iterations=50, users=(10, 100), view='vim', seed=0):
+    """
+    Run the client benchmarks
+    :param sizes: the numbers of lines of the documents
+    :param iterations: the number of timed calls of each benchmark
+    :param users: the numbers of other users of the cursor benchmark
+    :param view: 'vim' for VimUI over the fake vim module, 'memory' for the in-memory view
+    :param seed: the seed of the random number generator
+    :return: the report dictionary
+    """
+    rng = random.Random(seed)
+    results = []
+
+    def record(benchmark, pattern, lines, samples, **extra):
+        result = {'benchmark': benchmark, 'pattern': pattern, 'lines': lines,
+                  'microseconds': summarize(samples, 1e6)}
+        result.update(extra)
+        results.append(result)
+
+    for size in sizes:
+        document = createDocument(size)
+        for pattern in UPDATE_PATTERNS:
+            model = createModel(document, view)
+            record('createUpdatePacket', pattern, size, benchUpdatePacket(model, pattern, iterations, rng))
+        for pattern in RECEIVE_PATTERNS:
+            model = createModel(document, view)
+            record('processData', pattern, size, benchProcessData(model, pattern, iterations, rng))
+    document = createDocument(min(sizes))
+    for count in users:
+        for pattern in CURSOR_PATTERNS:
+            model = createModel(document, view)
+            record('updateCursors', pattern, len(document), benchCursors(model, pattern, count, iterations, rng),
+                   users=count)
+    return {
+        'benchmark': 'client',
+        'config': {'sizes': list(sizes), 'iterations': iterations, 'users': list(users), 'view': view, 'seed': seed},
+        'environment': environment(),
+        'results': results
+    }
+
+
+def printReport(report):
+    """
+    Print the results of a report
+    :param report: the report dictionary
+    :return: None
+    """
+    for result in report['results']:
+        name = '%s %s %d' % (result['benchmark'], result['pattern'], result['lines'])
+        if 'users' in result:
+            name += ' users=%d' % result['users']
+        print(formatSummary(name, result['microseconds'], 'us'))
+
+
+def _integers(text):
+    return [int(value) for value in text.split(',') if value]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmarks of the client')
+    parser.add_argument('--sizes', type=_integers, default=[1000, 10000, 100000, 1000000],
+                        help='comma separated numbers of lines of the documents')
+    parser.add_argument('--iterations', type=int, default=50, help='timed calls of each benchmark')
+    parser.add_argument('--users', type=_integers, default=[10, 100],
+                        help='comma separated numbers of other users of the cursor benchmark')
+    parser.add_argument('--view', choices=('vim', 'memory'), default='vim',
+                        help='run through VimUI over the fake vim module, or against an in-memory view')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator')
+    parser.add_argument('--json', default=None, help='write the report to this file as JSON')
+    args = parser.parse_args()
+    report = runBenchmark(args.sizes, args.iterations, args.users, args.view, args.seed)
+    printReport(report)
+    if args.json is not None:
+        writeReport(report, args.json)
@@ -0,0 +1,156 @@
+"""
+Stand-in for the vim module, so that the client modules can be imported and timed outside of vim. Only the parts
+of the vim API the plugin uses are provided: the current buffer with its change tick and the changes reported to
+the plugin's listener, the cursor of the current window, command and eval.
+
+install() must be called before the client modules are imported.
+"""
+import sys
+
+
+class error(Exception):
+    """
+    Raised for expressions the fake does not evaluate, like vim.error
+    """
+    pass
+
+
+class Buffer(list):
+    """
+    A buffer counting its changes like b:changedtick. As in vim, a buffer always has at least one line.
+    """
+    changedtick = 1
+
+    def __range(self, index):
+        if isinstance(index, slice):
+            return index.indices(len(self))[:2]
+        if index < 0:
+            index += len(self)
+        return index, index + 1
+
+    def __changed(self, start, end, size):
+        if not len(self):
+            list.append(self, '')
+            start, end = 0, size
+        self.changedtick += 1
+        if listening:
+            # as given to the listener callback: 1-based, the end being the line below the change before it
+            changes.append([str(start + 1), str(end + 1), str(len(self) - size)])
+
+    def __setitem__(self, index, value):
+        start, end = self.__range(index)
+        size = len(self)
+        list.__setitem__(self, index, value)
+        self.__changed(start, end, size)
+
+    def __delitem__(self, index):
+        start, end = self.__range(index)
+        size = len(self)
+        list.__delitem__(self, index)
+        self.__changed(start, end, size)
+
+    def __setslice__(self, start, end, value):
+        # slicing a list subclass goes through these on python 2
+        self.__setitem__(slice(start, end), value)
+
+    def __delslice__(self, start, end):
+        self.__delitem__(slice(start, end))
+
+    def append(self, lines, nr=None):
+        if not isinstance(lines, list):
+            lines = [lines]
+        if nr is None:
+            nr = len(self)
+        size = len(self)
+        list.__setitem__(self, slice(nr, nr), lines)
+        self.__changed(nr, nr, size)
+
+
+class Window(object):
+    """
+    A window, with its (line, column) cursor
+    """
+    __slots__ = 'cursor'
+
+    def __init__(self):
+        self.cursor = (1, 0)
+
+
+class Current(object):
+    """
+    The current buffer and window
+    """
+    __slots__ = 'buffer', 'window'
+
+    def __init__(self):
+        self.buffer = Buffer([''])
+        self.window = Window()
+
+
+current = Current()
+
+# Global variables read with eval
+vars = {
+    'TeamEditor_default_name': '0',
+    'TeamEditor_default_port': '0',
+    'TeamEditor_host_mode': 'process',
+    'TeamEditor_min_send_ms': '20',
+    'TeamEditor_max_send_ms': '500'
+}
+
+# Number of commands executed and the last one
+commandCount = 0
+lastCommand = None
+
+# Whether the plugin watches the changes of the buffer, and the changes not taken yet
+listening = False
+changes = []
+
+
+def command(cmd):
+    global commandCount, lastCommand, listening
+    commandCount += 1
+    lastCommand = cmd
+    if cmd == 'call TeamEditor#UnwatchChanges()':
+        listening = False
+        del changes[:]
+
+
+def eval(expr):
+    global listening
+    if expr == 'b:changedtick':
+        return str(current.buffer.changedtick)
+    if expr in vars:
+        return vars[expr]
+    if expr == 'TeamEditor#WatchChanges()':
+        listening = True
+        del changes[:]
+        return '1'
+    if expr == 'TeamEditor#TakeChanges()':
+        taken = changes[:]
+        del changes[:]
+        return taken
+    raise error('The fake vim module does not evaluate ' + expr)
+
+
+def reset(lines):
+    """
+    Replace the current buffer and window
+    :param lines: the lines of the new buffer
+    :return: None
+    """
+    global commandCount, lastCommand, listening
+    current.buffer = Buffer(lines or [''])
+    current.window = Window()
+    commandCount = 0
+    lastCommand = None
+    listening = False
+    del changes[:]
+
+
+def install():
+    """
+    Make this module importable as vim, unless the real one is loaded
+    :return: None
+    """
+    sys.modules.setdefault('vim', sys.modules[__name__])
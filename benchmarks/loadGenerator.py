@@ -0,0 +1,354 @@
+"""
+Simulated clients speaking the framed protocol of the server, typing into a shared document.
+
+Every client keeps its own copy of the document with the same synchronization engine as the editor client, so that
+the edits it sends are valid and the server sees realistic traffic. The latency of an edit is measured from the
+moment its client sends it to the moment each other client receives its broadcast.
+"""
+import errno
+import random
+import select
+import socket
+import time
+
+from documentStore import DocumentStore
+from framing import FrameReader, frame
+from operations import INSERT_LINES, INSERT_TEXT, DELETE_TEXT, applyOps
+from syncEngine import ClientSync
+from wireProtocol import BINARY, BinaryCodec, createHello
+
+# Where simulated clients type
+LOCALITIES = ('local', 'random', 'hot')
+
+# Characters typed by the simulated clients
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz      '
+
+# Time in seconds the generator waits for the edits in flight once the clients stopped typing
+DRAIN_TIMEOUT = 10
+
+
+class SimulatedClient(object):
+    """
+    A client typing into the document
+    """
+    __slots__ = 'name', 'generator', 'sock', 'codec', 'reader', 'sync', 'document', 'line', 'nextKeystroke', \
+                'sentAt', 'connectedAt', 'ready'
+
+    def __init__(self, name, generator):
+        """
+        Initializer
+        :param name: the user name
+        :param generator: the load generator collecting the measures
+        """
+        self.name = name
+        self.generator = generator
+        self.sock = None
+        self.codec = BinaryCodec()
+        self.reader = FrameReader()
+        self.sync = ClientSync()
+        self.document = DocumentStore()
+        # The line the client types on with a local edit pattern
+        self.line = 0
+        self.nextKeystroke = None
+        # The time the operations in flight were sent
+        self.sentAt = None
+        self.connectedAt = None
+        # Whether connect_success was received
+        self.ready = False
+
+    def connect(self, port, retries=0):
+        """
+        Connect to the server and send the hello
+        :param port: the port of the server
+        :param retries: the number of times to retry while the server is not listening yet
+        :return: None
+        """
+        while True:
+            try:
+                self.sock = socket.create_connection(('localhost', port))
+                break
+            except socket.error:
+                if retries <= 0:
+                    raise
+                retries -= 1
+                time.sleep(0.05)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connectedAt = time.time()
+        # the whole document comes with connect_success, the generator does not handle chunked joins
+        self.sock.sendall(frame(createHello(self.name, codecs=(BINARY,), features=())))
+
+    def close(self):
+        """
+        Disconnect from the server
+        :return: None
+        """
+        self.sock.close()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def receive(self):
+        """
+        Handle what the server sent, the socket being readable
+        :return: False if the connection was closed, True otherwise
+        """
+        try:
+            if not self.reader.readFrom(self.sock):
+                return False
+        except socket.error as e:
+            if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return True
+            return False
+        now = time.time()
+        for data in self.reader.frames():
+            packet = self.codec.decode(data)
+            if packet['type'] == 'batch':
+                for p in packet['data']:
+                    self.__handle(p, now)
+            else:
+                self.__handle(packet, now)
+        return True
+
+    def __handle(self, packet, now):
+        """
+        Handle a packet from the server
+        :param packet: the decoded packet
+        :param now: the time it was received
+        :return: None
+        """
+        data = packet['data']
+        if packet['type'] == 'message':
+            if data['message_type'] == 'connect_success':
+                self.sync.reset(data['revision'])
+                self.document.setLines(data.get('buffer', []))
+                self.ready = True
+                self.generator.onJoined(self, now)
+            elif data['message_type'] == 'resync':
+                self.sync.reset(data['revision'])
+                self.document.setLines(data['buffer'])
+                self.generator.resyncs += 1
+        elif packet['type'] == 'update' and 'ops' in data and data['revision'] > self.sync.revision:
+            if data['name'] == self.name:
+                self.sync.acknowledge(data['revision'])
+                self.generator.onCommitted(data['revision'], self.sentAt, now)
+                self.flush(now)
+            else:
+                applyOps(self.document, self.sync.receive(data['ops'], data['revision']))
+                self.generator.onBroadcast(data['revision'], now)
+
+    def keystroke(self, now):
+        """
+        Make a keystroke and send it unless operations are in flight
+        :param now: the current time
+        :return: None
+        """
+        locality = self.generator.locality
+        random = self.generator.random
+        size = len(self.document)
+        if size == 0:
+            op = [INSERT_LINES, 0, ['']]
+        else:
+            if locality == 'hot':
+                line = 0
+            elif locality == 'random':
+                line = random.randrange(size)
+            else:
+                if random.random() < 0.05:
+                    self.line += random.choice((-1, 1))
+                line = self.line = max(0, min(self.line, size - 1))
+            text = self.document.getLine(line)
+            col = random.randint(0, len(text))
+            draw = random.random()
+            if draw < 0.02:
+                op = [INSERT_LINES, line + 1, ['']]
+            elif draw < 0.12 and col > 0:
+                op = [DELETE_TEXT, line, col - 1, 1]
+            else:
+                op = [INSERT_TEXT, line, col, random.choice(ALPHABET)]
+        applyOps(self.document, [op])
+        self.sync.addLocal([op])
+        self.generator.keystrokes += 1
+        self.flush(now)
+
+    def flush(self, now):
+        """
+        Send the pending operations if nothing is in flight
+        :param now: the current time
+        :return: None
+        """
+        outgoing = self.sync.takeOutgoing()
+        if outgoing is None:
+            return
+        self.sentAt = now
+        ops, revision = outgoing
+        packet = {'type': 'update', 'data': {'name': self.name, 'ops': ops, 'revision': revision}}
+        self.sock.sendall(frame(self.codec.encode(packet)))
+
+
+class LoadGenerator(object):
+    """
+    Drives simulated clients against a server and collects the measures
+    """
+    __slots__ = 'port', 'clientCount', 'rate', 'locality', 'documentLines', 'lineLength', 'churnInterval', \
+                'random', 'clients', 'nameCount', 'keystrokes', 'commits', 'broadcasts', 'resyncs', 'sentTimes', \
+                'receipts', 'broadcastLatencies', 'ackLatencies', 'joinLatencies', 'leaves'
+
+    def __init__(self, port, clients=10, rate=5.0, locality='local', documentLines=1000, lineLength=60,
+                 churnInterval=0, seed=0):
+        """
+        Initializer
+        :param port: the port of the server
+        :param clients: the number of clients typing at any time
+        :param rate: the average number of keystrokes per second of each client
+        :param locality: where the clients type: 'local' around their own line, 'random' anywhere, 'hot' all on the
+                         first line
+        :param documentLines: the number of lines of the initial document
+        :param lineLength: the length of the lines of the initial document
+        :param churnInterval: the time in seconds between a client leaving and a new one joining, 0 for no churn
+        :param seed: the seed of the random number generator
+        """
+        if locality not in LOCALITIES:
+            raise ValueError('Unknown locality ' + str(locality))
+        self.port = port
+        self.clientCount = clients
+        self.rate = rate
+        self.locality = locality
+        self.documentLines = documentLines
+        self.lineLength = lineLength
+        self.churnInterval = churnInterval
+        self.random = random.Random(seed)
+        self.clients = []
+        self.nameCount = 0
+
+        self.keystrokes = 0
+        self.commits = 0
+        self.broadcasts = 0
+        self.resyncs = 0
+        self.leaves = 0
+        # Dictionary mapping revisions to the time their operations were sent
+        self.sentTimes = {}
+        # Dictionary mapping revisions to the times they were received by other clients before their sender's
+        # acknowledgement
+        self.receipts = {}
+        self.broadcastLatencies = []
+        self.ackLatencies = []
+        self.joinLatencies = []
+
+    def onJoined(self, client, now):
+        self.joinLatencies.append(now - client.connectedAt)
+        client.line = self.random.randrange(max(1, len(client.document)))
+        client.nextKeystroke = now + self.random.expovariate(self.rate)
+
+    def onCommitted(self, revision, sentAt, now):
+        self.commits += 1
+        self.ackLatencies.append(now - sentAt)
+        self.sentTimes[revision] = sentAt
+        for receivedAt in self.receipts.pop(revision, ()):
+            self.broadcastLatencies.append(receivedAt - sentAt)
+
+    def onBroadcast(self, revision, now):
+        self.broadcasts += 1
+        sentAt = self.sentTimes.get(revision)
+        if sentAt is None:
+            self.receipts.setdefault(revision, []).append(now)
+        else:
+            self.broadcastLatencies.append(now - sentAt)
+
+    def __newClient(self):
+        self.nameCount += 1
+        client = SimulatedClient('client' + str(self.nameCount), self)
+        client.connect(self.port, retries=100)
+        self.clients.append(client)
+        return client
+
+    def __poll(self, timeout):
+        """
+        Handle what the server sent, waiting at most timeout seconds for it
+        :param timeout: the time in seconds
+        :return: None
+        """
+        readable = select.select(self.clients, [], [], max(0, timeout))[0]
+        for client in readable:
+            if not client.receive():
+                raise IOError('The server closed the connection of ' + client.name)
+
+    def __waitUntil(self, condition, timeout):
+        deadline = time.time() + timeout
+        while not condition():
+            if time.time() > deadline:
+                raise IOError('Timed out waiting for the server')
+            self.__poll(deadline - time.time())
+
+    def setUp(self):
+        """
+        Connect the clients, the first one creating the document
+        :return: None
+        """
+        host = self.__newClient()
+        self.__waitUntil(lambda: host.ready, DRAIN_TIMEOUT)
+        text = ('x' * self.lineLength)
+        lines = [text[:self.lineLength - len(str(i))] + str(i) for i in range(self.documentLines)]
+        applyOps(host.document, [[INSERT_LINES, 0, lines]])
+        host.sync.addLocal([[INSERT_LINES, 0, lines]])
+        host.flush(time.time())
+        self.__waitUntil(lambda: host.sync.inflight is None, DRAIN_TIMEOUT)
+        for i in range(self.clientCount - 1):
+            self.__newClient()
+        self.__waitUntil(lambda: all(client.ready for client in self.clients), DRAIN_TIMEOUT)
+        # the set up is not part of the measures
+        self.commits = self.broadcasts = self.keystrokes = 0
+        self.sentTimes = {}
+        self.receipts = {}
+        del self.ackLatencies[:]
+        del self.broadcastLatencies[:]
+        del self.joinLatencies[:]
+
+    def run(self, duration):
+        """
+        Make the clients type during some time, then wait for their edits to be committed
+        :param duration: the time in seconds
+        :return: None
+        """
+        now = time.time()
+        end = now + duration
+        nextChurn = now + self.churnInterval if self.churnInterval else None
+        while now < end:
+            deadline = min([end] + [client.nextKeystroke for client in self.clients if client.ready])
+            if nextChurn is not None:
+                deadline = min(deadline, nextChurn)
+            self.__poll(deadline - time.time())
+            now = time.time()
+            for client in self.clients:
+                if client.ready and client.nextKeystroke <= now:
+                    client.keystroke(now)
+                    client.nextKeystroke += self.random.expovariate(self.rate)
+                    # a client falling behind its schedule does not type in bursts
+                    client.nextKeystroke = max(client.nextKeystroke, now)
+            if nextChurn is not None and nextChurn <= now:
+                self.__churn()
+                nextChurn += self.churnInterval
+
+        for client in self.clients:
+            client.nextKeystroke = float('inf')
+        self.__waitUntil(lambda: all(client.sync.inflight is None and not client.sync.pending
+                                     for client in self.clients if client.ready), DRAIN_TIMEOUT)
+
+    def __churn(self):
+        """
+        Make a client leave and a new one join. The first client stays, as the server stops once all clients left.
+        :return: None
+        """
+        if len(self.clients) > 1:
+            client = self.clients.pop(self.random.randrange(1, len(self.clients)))
+            client.close()
+            self.leaves += 1
+        self.__newClient()
+
+    def tearDown(self):
+        """
+        Disconnect all clients, which stops the server
+        :return: None
+        """
+        for client in self.clients:
+            client.close()
+        self.clients = []
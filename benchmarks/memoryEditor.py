@@ -0,0 +1,152 @@
+"""
+In-memory implementations of the editor view and platform, to drive the client model without an editor
+"""
+from hostServer import startServerThread
+from iEditorView import IEditorView
+from iPlatform import IPlatform
+
+
+class MemoryEditorView(IEditorView):
+    """
+    An editor view keeping the text and the cursors in memory
+    """
+    __slots__ = 'buffer', 'changeTick', 'cursor', 'cursors', 'calls', 'changes'
+
+    def __init__(self, lines=None):
+        """
+        Initializer
+        :param lines: the initial lines of the buffer
+        """
+        self.buffer = list(lines or [''])
+        self.changeTick = 1
+        # The (line, column) position of the user's cursor
+        self.cursor = (1, 0)
+        # Dictionary mapping cursor ids to their (color, x, y)
+        self.cursors = {}
+        # Number of calls that would have reached the editor
+        self.calls = 0
+        # The changes collected since they were last taken, None when not watched
+        self.changes = None
+
+    def getCursorX(self):
+        return self.cursor[1]
+
+    def getCursorY(self):
+        return self.cursor[0]
+
+    def getCursor(self):
+        return self.cursor[1], self.cursor[0]
+
+    def setCursor(self, x, y):
+        self.calls += 1
+        self.cursor = (y, x)
+
+    def setCursorColors(self):
+        self.calls += 1
+
+    def getCurrentBuffer(self):
+        return self.buffer[:]
+
+    def setCurrentBuffer(self, buffer):
+        self.replaceLines(0, len(self.buffer), buffer or [])
+
+    def getLines(self, start, end):
+        return self.buffer[start:end]
+
+    def getLineCount(self):
+        return len(self.buffer)
+
+    def replaceLines(self, start, end, lines):
+        self.calls += 1
+        size = len(self.buffer)
+        self.buffer[start:end] = lines
+        if not self.buffer:
+            self.buffer.append('')
+            start, end = 0, size
+        if self.changes is not None:
+            self.changes.append((start, end, len(self.buffer) - size))
+        self.changeTick += 1
+
+    def getChangeTick(self):
+        return self.changeTick
+
+    def watchChanges(self):
+        self.changes = []
+        return True
+
+    def unwatchChanges(self):
+        self.changes = None
+
+    def takeChanges(self):
+        changes = self.changes or []
+        if self.changes is not None:
+            self.changes = []
+        return changes
+
+    def printError(self, error):
+        pass
+
+    def printMessage(self, msg):
+        pass
+
+    def redraw(self):
+        self.calls += 1
+
+    def quit(self):
+        pass
+
+    def getNumberOfCursorColors(self):
+        return 11
+
+    def addCursor(self, cursorId, cursorColor, x, y):
+        self.updateCursors([(cursorId, cursorColor, x, y)])
+
+    def removeCursor(self, cursorId):
+        self.calls += 1
+        self.cursors.pop(cursorId, None)
+
+    def updateCursor(self, cursorId, cursorColor, x, y):
+        self.updateCursors([(cursorId, cursorColor, x, y)])
+
+    def updateCursors(self, cursors):
+        self.calls += 1
+        for cursorId, cursorColor, x, y in cursors:
+            self.cursors[cursorId] = (cursorColor, x, y)
+
+
+class MemoryPlatform(IPlatform):
+    """
+    A platform with the default settings, running the server of a hosting user on a thread of this process
+    """
+    __slots__ = 'defaultName', 'defaultPort'
+
+    def __init__(self, defaultName='0', defaultPort='0'):
+        """
+        Initializer
+        :param defaultName: the default user name, '0' for none
+        :param defaultPort: the default port, '0' for none
+        """
+        self.defaultName = defaultName
+        self.defaultPort = defaultPort
+
+    def getApplicationName(self):
+        return 'TeamEditor'
+
+    def getDefaultName(self):
+        return self.defaultName
+
+    def getDefaultPort(self):
+        return self.defaultPort
+
+    def getSendIntervals(self):
+        return 0.02, 0.5
+
+    def runServer(self, port, unixPath):
+        return startServerThread(port, unixPath)
+
+    def startTimer(self, interval):
+        # the model is driven directly
+        return False
+
+    def stopTimer(self):
+        pass
@@ -0,0 +1,88 @@
+"""
+Statistics and reports shared by the benchmarks. Reports are dictionaries written as JSON, so that runs on
+different commits can be compared by tools, and printed as text for humans.
+"""
+import json
+import os
+import platform
+import subprocess
+
+from benchmarks import PLUGIN_DIRECTORY
+
+
+def percentile(samples, fraction):
+    """
+    Get a percentile of samples, by the nearest-rank method
+    :param samples: the sorted list of samples
+    :param fraction: the percentile as a fraction, such as 0.99
+    :return: the sample, None if there are none
+    """
+    if not samples:
+        return None
+    index = max(0, min(len(samples) - 1, int(fraction * len(samples) + 0.5) - 1))
+    return samples[index]
+
+
+def summarize(samples, scale=1000.0):
+    """
+    Summarize the distribution of samples
+    :param samples: the list of samples, in seconds
+    :param scale: the factor applied to the samples, 1000 to report milliseconds
+    :return: a dictionary of the count, mean, p50, p99, p999 and max
+    """
+    samples = sorted(samples)
+    summary = {'count': len(samples)}
+    if samples:
+        summary['mean'] = scale * sum(samples) / len(samples)
+        summary['p50'] = scale * percentile(samples, 0.5)
+        summary['p99'] = scale * percentile(samples, 0.99)
+        summary['p999'] = scale * percentile(samples, 0.999)
+        summary['max'] = scale * samples[-1]
+    return summary
+
+
+def environment():
+    """
+    Describe where a benchmark ran
+    :return: a dictionary of the commit, python version and machine
+    """
+    commit = None
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=PLUGIN_DIRECTORY,
+                                         stderr=open(os.devnull, 'w')).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system()
+    }
+
+
+def writeReport(report, path):
+    """
+    Write a report as JSON
+    :param report: the report dictionary
+    :param path: the file to be written
+    :return: None
+    """
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, separators=(',', ': '), sort_keys=True)
+        f.write('\n')
+
+
+def formatSummary(name, summary, unit='ms'):
+    """
+    Format a distribution summary as a line of text
+    :param name: the name of the measure
+    :param summary: the dictionary returned by summarize
+    :param unit: the unit of the summary
+    :return: the line
+    """
+    if not summary['count']:
+        return '%-40s no samples' % name
+    return '%-40s n=%-8d p50=%.3f%s p99=%.3f%s p999=%.3f%s max=%.3f%s' % (
+        name, summary['count'], summary['p50'], unit, summary['p99'], unit, summary['p999'], unit,
+        summary['max'], unit)
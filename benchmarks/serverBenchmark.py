@@ -0,0 +1,273 @@
+"""
+Benchmark of the server under simulated clients.
+
+The server runs in a thread of the benchmark process, or with --server-process in a child process so that its CPU
+time and memory, and those of its worker processes, are measured apart from the load generator's. Run from the
+repository root:
+
+    python -m benchmarks.serverBenchmark --clients 20 --rate 8 --duration 10 --json server.json
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from benchmarks.loadGenerator import LOCALITIES, LoadGenerator
+from benchmarks.report import environment, formatSummary, summarize, writeReport
+from editorServer import EditorServer
+
+
+def freePort():
+    """
+    Get a TCP port nobody listens on
+    :return: the port number
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _statFields(pid):
+    """
+    Read the fields of /proc/<pid>/stat following the command name, which may contain spaces
+    """
+    with open('/proc/%d/stat' % pid) as f:
+        return f.read().rsplit(')', 1)[1].split()
+
+
+def _processTree(pid):
+    """
+    Get a process and its descendants from /proc, such as the worker processes of the server
+    :param pid: the process id
+    :return: the list of process ids
+    """
+    children = {}
+    try:
+        entries = os.listdir('/proc')
+    except OSError:
+        return [pid]
+    for entry in entries:
+        if entry.isdigit():
+            try:
+                children.setdefault(int(_statFields(int(entry))[1]), []).append(int(entry))
+            except (IOError, OSError, IndexError, ValueError):
+                # the process exited meanwhile
+                pass
+    pids = [pid]
+    for parent in pids:
+        pids.extend(children.get(parent, ()))
+    return pids
+
+
+def _processTimes(pid):
+    """
+    Get the CPU time and memory of a process and its descendants from /proc
+    :param pid: the process id
+    :return: the CPU time in seconds and the sum of the peak resident memory of the processes in kilobytes, None
+             when unknown
+    """
+    cpu = memory = None
+    for child in _processTree(pid):
+        try:
+            fields = _statFields(child)
+            cpu = (cpu or 0) + (int(fields[11]) + int(fields[12])) / float(os.sysconf('SC_CLK_TCK'))
+            with open('/proc/%d/status' % child) as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        memory = (memory or 0) + int(line.split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            pass
+    return cpu, memory
+
+
+class ServerUnderTest(object):
+    """
+    An editor server started for a benchmark
+    """
+    __slots__ = 'port', 'thread', 'process'
+
+    def __init__(self, port, batchInterval=0, workers=0, separateProcess=False):
+        """
+        Initializer
+        :param port: the port of the server
+        :param batchInterval: the batching window of the server, in seconds
+        :param workers: the number of worker processes of the server
+        :param separateProcess: whether to run the server in a child process rather than in a thread
+        """
+        self.port = port
+        self.thread = self.process = None
+        args = (port, batchInterval, None, workers)
+        if separateProcess:
+            # not a daemon, as daemonic processes may not start the worker processes of the server
+            self.process = multiprocessing.Process(target=EditorServer, args=args)
+            self.process.start()
+        else:
+            self.thread = threading.Thread(target=EditorServer, args=args)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def times(self):
+        """
+        Get the CPU time and memory used so far
+        :return: the CPU time in seconds and the peak resident memory in kilobytes, None when unknown. In a thread,
+                 they include the load generator.
+        """
+        if self.process is not None:
+            return _processTimes(self.process.pid)
+        times = os.times()
+        memory = None
+        if resource is not None:
+            memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return times[0] + times[1], memory
+
+    def join(self, timeout=10):
+        """
+        Wait for the server to stop, which it does once all clients disconnected. A server process still running
+        after the timeout is terminated, as it would keep the benchmark from exiting.
+        :param timeout: the maximum time to wait in seconds
+        :return: None
+        """
+        if self.process is not None:
+            self.process.join(timeout)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        else:
+            self.thread.join(timeout)
+
+
+def runBenchmark(clients=10, rate=5.0, locality='local', documentLines=1000, lineLength=60, churnInterval=0,
+                 duration=10, batchInterval=0, workers=0, separateProcess=False, seed=0):
+    """
+    Run the server benchmark
+    :param clients: the number of simulated clients
+    :param rate: the average number of keystrokes per second of each client
+    :param locality: where the clients type, one of LOCALITIES
+    :param documentLines: the number of lines of the initial document
+    :param lineLength: the length of the lines of the initial document
+    :param churnInterval: the time in seconds between a client leaving and a new one joining, 0 for no churn
+    :param duration: the time in seconds the clients type
+    :param batchInterval: the batching window of the server, in seconds
+    :param workers: the number of worker processes of the server
+    :param separateProcess: whether to run the server in a child process
+    :param seed: the seed of the random number generator
+    :return: the report dictionary
+    """
+    config = {
+        'clients': clients,
+        'rate': rate,
+        'locality': locality,
+        'documentLines': documentLines,
+        'lineLength': lineLength,
+        'churnInterval': churnInterval,
+        'duration': duration,
+        'batchInterval': batchInterval,
+        'workers': workers,
+        'serverProcess': separateProcess,
+        'seed': seed
+    }
+    server = ServerUnderTest(freePort(), batchInterval, workers, separateProcess)
+    generator = LoadGenerator(server.port, clients, rate, locality, documentLines, lineLength, churnInterval, seed)
+    try:
+        generator.setUp()
+
+        cpuBefore = server.times()[0]
+        begin = time.time()
+        generator.run(duration)
+        elapsed = time.time() - begin
+        cpuAfter, memory = server.times()
+    finally:
+        generator.tearDown()
+        server.join()
+
+    cpu = None
+    if cpuBefore is not None and cpuAfter is not None:
+        cpu = cpuAfter - cpuBefore
+    return {
+        'benchmark': 'server',
+        'config': config,
+        'environment': environment(),
+        'elapsed': elapsed,
+        'keystrokes': generator.keystrokes,
+        'revisions': generator.commits,
+        'broadcastsReceived': generator.broadcasts,
+        'resyncs': generator.resyncs,
+        'joins': len(generator.joinLatencies),
+        'leaves': generator.leaves,
+        'throughput': {
+            'keystrokesPerSecond': generator.keystrokes / elapsed,
+            'revisionsPerSecond': generator.commits / elapsed,
+            'broadcastsPerSecond': generator.broadcasts / elapsed
+        },
+        'cpu': {
+            'seconds': cpu,
+            'microsecondsPerRevision': 1e6 * cpu / generator.commits if cpu is not None and generator.commits
+            else None,
+            'includesLoadGenerator': not separateProcess
+        },
+        'memory': {
+            'peakRssKb': memory,
+            'includesLoadGenerator': not separateProcess
+        },
+        'latency': {
+            'editToBroadcast': summarize(generator.broadcastLatencies),
+            'editToAck': summarize(generator.ackLatencies),
+            'join': summarize(generator.joinLatencies)
+        }
+    }
+
+
+def printReport(report):
+    """
+    Print the main figures of a report
+    :param report: the report dictionary
+    :return: None
+    """
+    throughput = report['throughput']
+    print('%d revisions in %.1fs: %.0f revisions/s, %.0f keystrokes/s, %.0f broadcasts/s' % (
+        report['revisions'], report['elapsed'], throughput['revisionsPerSecond'], throughput['keystrokesPerSecond'],
+        throughput['broadcastsPerSecond']))
+    cpu = report['cpu']
+    if cpu['microsecondsPerRevision'] is not None:
+        print('CPU %.2fs, %.1fus per revision%s' % (cpu['seconds'], cpu['microsecondsPerRevision'],
+                                                    ' (with the load generator)' if cpu['includesLoadGenerator']
+                                                    else ''))
+    if report['memory']['peakRssKb'] is not None:
+        print('Peak RSS %d kB' % report['memory']['peakRssKb'])
+    for name in ('editToBroadcast', 'editToAck', 'join'):
+        print(formatSummary(name, report['latency'][name]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the server under simulated clients')
+    parser.add_argument('--clients', type=int, default=10, help='number of simulated clients')
+    parser.add_argument('--rate', type=float, default=5.0, help='keystrokes per second of each client')
+    parser.add_argument('--locality', choices=LOCALITIES, default='local',
+                        help='where the clients type: around their own line, anywhere, or all on the same line')
+    parser.add_argument('--lines', type=int, default=1000, help='number of lines of the initial document')
+    parser.add_argument('--line-length', type=int, default=60, help='length of the lines of the initial document')
+    parser.add_argument('--churn', type=float, default=0,
+                        help='seconds between a client leaving and a new one joining, 0 for no churn')
+    parser.add_argument('--duration', type=float, default=10, help='seconds the clients type')
+    parser.add_argument('--batch-ms', type=float, default=0, help='batching window of the server')
+    parser.add_argument('--workers', type=int, default=0, help='worker processes of the server')
+    parser.add_argument('--server-process', action='store_true',
+                        help='run the server in a child process, to measure its CPU time and memory alone')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random number generator')
+    parser.add_argument('--json', default=None, help='write the report to this file as JSON')
+    args = parser.parse_args()
+    report = runBenchmark(args.clients, args.rate, args.locality, args.lines, args.line_length, args.churn,
+                          args.duration, args.batch_ms / 1000.0, args.workers, args.server_process, args.seed)
+    printReport(report)
+    if args.json is not None:
+        writeReport(report, args.json)
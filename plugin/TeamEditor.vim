@@ -1,32 +1,13 @@
 " --------------------------------
-" Add our plugin to the path
+"  Only the command is defined on startup, the rest of the plugin and Python are loaded from
+"  autoload/TeamEditor.vim on its first use
 " --------------------------------
-python import sys
-python import vim
-python sys.path.append(vim.eval('expand("<sfile>:h")'))
-
-com! -nargs=* TeamEditor py teamEditor.execute(<f-args>)
-
-" --------------------------------
-"  Function(s)
-" --------------------------------
-
-function! SetCursorColors ()
-    hi CursorUser gui=bold term=bold cterm=bold
-    hi Cursor1 ctermbg=DarkRed ctermfg=White guibg=DarkRed guifg=White gui=bold term=bold cterm=bold
-    hi Cursor2 ctermbg=DarkBlue ctermfg=White guibg=DarkBlue guifg=White gui=bold term=bold cterm=bold
-    hi Cursor3 ctermbg=DarkGreen ctermfg=White guibg=DarkGreen guifg=White gui=bold term=bold cterm=bold
-    hi Cursor4 ctermbg=DarkCyan ctermfg=White guibg=DarkCyan guifg=White gui=bold term=bold cterm=bold
-    hi Cursor5 ctermbg=DarkMagenta ctermfg=White guibg=DarkMagenta guifg=White gui=bold term=bold cterm=bold
-    hi Cursor6 ctermbg=DarkYellow ctermfg=White guibg=DarkYellow guifg=White gui=bold term=bold cterm=bold
-    hi Cursor7 ctermbg=LightRed ctermfg=Black guibg=LightRed guifg=Black gui=bold term=bold cterm=bold
-    hi Cursor8 ctermbg=LightBlue ctermfg=Black guibg=LightBlue guifg=Black gui=bold term=bold cterm=bold
-    hi Cursor9 ctermbg=LightGreen ctermfg=Black guibg=LightGreen guifg=Black gui=bold term=bold cterm=bold
-    hi Cursor10 ctermbg=LightCyan ctermfg=Black guibg=LightCyan guifg=Black gui=bold term=bold cterm=bold
-    hi Cursor0 ctermbg=LightMagenta ctermfg=Black guibg=LightMagenta guifg=Black gui=bold term=bold cterm=bold
-endfunction
-
+if exists('g:loaded_TeamEditor')
+    finish
+endif
+let g:loaded_TeamEditor = 1
 
+com! -nargs=* TeamEditor call TeamEditor#Execute(<f-args>)
 
 if !exists("TeamEditor_default_name")
     let TeamEditor_default_name = 0
@@ -34,16 +15,14 @@ endif
 if !exists("TeamEditor_default_port")
     let TeamEditor_default_port = 0
 endif
-
-
-python << endOfPython
-
-###
-# Python starts from here.
-# Supported: python 2.7
-###
-from editorClient import *
-
-teamEditor = EditorController()
-
-endOfPython
+" Run the server of the hosting user as a separate 'process', or in vim on a background 'thread'
+if !exists("TeamEditor_host_mode")
+    let TeamEditor_host_mode = 'process'
+endif
+" Bounds of the interval between two updates while typing, which follows the round trip time to the server
+if !exists("TeamEditor_min_send_ms")
+    let TeamEditor_min_send_ms = 20
+endif
+if !exists("TeamEditor_max_send_ms")
+    let TeamEditor_max_send_ms = 500
+endif
@@ -0,0 +1,187 @@
+import random
+
+# Maximum number of lines kept in a single node when building a document
+CHUNK_SIZE = 64
+
+
+class _Node(object):
+    """
+    A node of the document tree holding a chunk of consecutive lines
+    """
+    __slots__ = 'lines', 'size', 'priority', 'left', 'right'
+
+    def __init__(self, lines, priority=None):
+        """
+        Initializer
+        :param lines: the chunk of lines held by this node
+        :param priority: the heap priority of the node, random if not given
+        """
+        self.lines = lines
+        self.size = len(lines)
+        self.priority = random.random() if priority is None else priority
+        self.left = None
+        self.right = None
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+def _update(node):
+    node.size = len(node.lines) + _size(node.left) + _size(node.right)
+
+
+def _merge(a, b):
+    """
+    Concatenate two trees
+    :param a: the tree holding the leading lines
+    :param b: the tree holding the trailing lines
+    :return: the root of the concatenated tree
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.priority > b.priority:
+        a.right = _merge(a.right, b)
+        _update(a)
+        return a
+    b.left = _merge(a, b.left)
+    _update(b)
+    return b
+
+
+def _split(node, k):
+    """
+    Split a tree after its first k lines
+    :param node: the root of the tree to be split
+    :param k: the number of lines that go to the left tree
+    :return: the roots of the left and right trees
+    """
+    if node is None:
+        return None, None
+    leftSize = _size(node.left)
+    if k <= leftSize:
+        left, node.left = _split(node.left, k)
+        _update(node)
+        return left, node
+    ownEnd = leftSize + len(node.lines)
+    if k >= ownEnd:
+        node.right, right = _split(node.right, k - ownEnd)
+        _update(node)
+        return node, right
+    # the split point falls inside this node's chunk
+    j = k - leftSize
+    right = _Node(node.lines[j:], node.priority)
+    right.right = node.right
+    _update(right)
+    node.lines = node.lines[:j]
+    node.right = None
+    _update(node)
+    return node, right
+
+
+def _build(lines):
+    """
+    Build a tree from a list of lines
+    :param lines: the lines of the document
+    :return: the root of the tree
+    """
+    root = None
+    for i in range(0, len(lines), CHUNK_SIZE):
+        root = _merge(root, _Node(lines[i:i + CHUNK_SIZE]))
+    return root
+
+
+def _collect(node, start, end, result):
+    """
+    Append the lines of the tree in range [start, end) to result
+    """
+    if node is None or start >= end:
+        return
+    leftSize = _size(node.left)
+    if start < leftSize:
+        _collect(node.left, start, min(end, leftSize), result)
+    ownEnd = leftSize + len(node.lines)
+    if start < ownEnd and end > leftSize:
+        result.extend(node.lines[max(0, start - leftSize):min(len(node.lines), end - leftSize)])
+    if end > ownEnd:
+        _collect(node.right, max(0, start - ownEnd), end - ownEnd, result)
+
+
+class DocumentStore(object):
+    """
+    Line based document storage with logarithmic range replacement.
+    The lines are kept in chunks inside a randomized balanced tree (treap) ordered by position,
+    so that replacing, slicing and indexing lines costs O(log n) plus the size of the range
+    involved instead of a copy of the whole document.
+    """
+    __slots__ = 'root'
+
+    def __init__(self, lines=None):
+        """
+        Initializer
+        :param lines: the initial lines of the document
+        """
+        self.root = _build(list(lines)) if lines else None
+
+    def __len__(self):
+        return _size(self.root)
+
+    def setLines(self, lines):
+        """
+        Replace the whole document
+        :param lines: the new lines of the document
+        :return: None
+        """
+        self.root = _build(list(lines)) if lines else None
+
+    def getLine(self, index):
+        """
+        Get a single line
+        :param index: the 0-based line number
+        :return: the line at the given index
+        """
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('line index out of range')
+        node = self.root
+        while True:
+            leftSize = _size(node.left)
+            if index < leftSize:
+                node = node.left
+            elif index < leftSize + len(node.lines):
+                return node.lines[index - leftSize]
+            else:
+                index -= leftSize + len(node.lines)
+                node = node.right
+
+    def getLines(self, start=0, end=None):
+        """
+        Get a range of lines
+        :param start: the first line of the range
+        :param end: the line after the last line of the range, the end of the document if None
+        :return: the list of lines in range [start, end)
+        """
+        size = len(self)
+        start = max(0, min(start, size))
+        end = size if end is None else max(start, min(end, size))
+        result = []
+        _collect(self.root, start, end, result)
+        return result
+
+    def replaceLines(self, start, end, lines):
+        """
+        Replace a range of lines
+        :param start: the first line to be replaced
+        :param end: the line after the last line to be replaced
+        :param lines: the lines replacing the range [start, end)
+        :return: None
+        """
+        size = len(self)
+        start = max(0, min(start, size))
+        end = max(start, min(end, size))
+        left, rest = _split(self.root, start)
+        middle, right = _split(rest, end - start)
+        self.root = _merge(_merge(left, _build(list(lines))), right)
@@ -1,18 +1,51 @@
-import json
+from collections import deque
 from threading import Thread
+import fcntl
+import os
 import time
+import select
 import socket
-import struct
+import tempfile
 
+from documentStore import DocumentStore
+from framing import FrameReader, frame
+from hostServer import hostSocketPath
+from transports import connect as openConnection
+from operations import applyOps
+from profiler import Profiler, ProfiledView
+from syncEngine import ClientSync
+from textDiff import diffLines
+from wireProtocol import MALFORMED_FRAME_ERRORS, BinaryCodec, JsonCodec, createHello, isBinary
 from vimPlatform import *
 from vimUI import *
 
+# Time in seconds before trying to reconnect to a lost server, doubling after each failed attempt up to the maximum,
+# and the number of attempts before disconnecting, as the server stops once its last client left
+RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 2
+MAX_RECONNECT_ATTEMPTS = 8
+
+# Interval in seconds at which the editor's main thread applies what the daemon thread received, and the maximum
+# number of callbacks run at each interval, the others waiting for the next one
+DISPATCH_INTERVAL = 0.02
+MAX_DISPATCH_BATCH = 50
+
+# Bounds in seconds of the interval between two updates while the user keeps typing, by default
+MIN_SEND_INTERVAL = 0.02
+MAX_SEND_INTERVAL = 0.5
+
+# Interval in seconds at which the buffer is checked for changes the editor did not report
+IDLE_CHECK_INTERVAL = 1.0
+
+# Weight of a new round trip time sample in the smoothed round trip time
+ROUND_TRIP_GAIN = 0.125
+
 
 class CursorManager:
     """
     The cursor manager
     """
-    __slots__ = 'nextCursorId', 'nextCursorColor', 'cursors', 'editorModel'
+    __slots__ = 'nextCursorId', 'nextCursorColor', 'cursors', 'positions', 'editorModel'
 
     def __init__(self, editorModel):
         """
@@ -30,6 +63,18 @@ class CursorManager:
         """
         self.nextCursorColor = 1
         self.cursors = {}
+        # Dictionary mapping user names to the (x, y) position their cursor is drawn at
+        self.positions = {}
+
+    def clear(self):
+        """
+        Removes the cursors of all users
+        :return: None
+        """
+        for name in self.cursors.keys():
+            if name != self.editorModel.name:
+                self.editorModel.ui.removeCursor(self.cursors[name][1])
+        self.reset()
 
     def addCursor(self, name, x, y):
         """
@@ -46,6 +91,7 @@ class CursorManager:
             self.nextCursorId += 1
             self.nextCursorColor = (self.nextCursorId) % self.editorModel.ui.getNumberOfCursorColors()
             self.editorModel.ui.addCursor(self.cursors[name][1], self.cursors[name][0], x, y)
+            self.positions[name] = (x, y)
 
     def removeCursor(self, name):
         """
@@ -53,25 +99,115 @@ class CursorManager:
         :param name: the user name of the cursor to be removed
         :return: None
         """
+        if name not in self.cursors:
+            # the user joined while its arrival was not received
+            return
         self.editorModel.ui.removeCursor(self.cursors[name][1])
         del (self.cursors[name])
+        self.positions.pop(name, None)
 
-    def updateCursor(self, name, x, y):
+    def updateCursors(self, updates):
         """
-        Updates cursor of the given user name
-        :param name: name of the user
-        :param x: column number of cursor
-        :param y: row number of cursor
+        Updates cursors of other users, with a single call to the user interface
+        :param updates: the list of (name, x, y) cursor positions
+        :return: None
+        """
+        cursors = []
+        for name, x, y in updates:
+            # cursors which did not move are not redrawn
+            if name in self.cursors and self.positions.get(name) != (x, y):
+                self.positions[name] = (x, y)
+                cursors.append((self.cursors[name][1], self.cursors[name][0], x, y))
+        if cursors:
+            self.editorModel.ui.updateCursors(cursors)
+
+
+class SendScheduler:
+    """
+    Decides when updates are sent: immediately on the first change after being idle, then at most once per round
+    trip time of our edits while the user keeps typing, within bounds, and at the maximum interval while frames
+    are queued faster than they are sent or handled, by us or by the server
+    """
+    __slots__ = 'minInterval', 'maxInterval', 'roundTripTime', 'lastSend', 'lastCheck', 'sentAt'
+
+    def __init__(self, minInterval=MIN_SEND_INTERVAL, maxInterval=MAX_SEND_INTERVAL):
+        """
+        Initializer
+        :param minInterval: the minimum interval in seconds between two updates
+        :param maxInterval: the maximum interval in seconds between two updates
+        """
+        self.minInterval = minInterval
+        self.maxInterval = max(minInterval, maxInterval)
+        # Smoothed round trip time of our edits, None until one was acknowledged
+        self.roundTripTime = None
+        # When the last update was sent, and when the buffer was last checked for changes
+        self.lastSend = 0
+        self.lastCheck = 0
+        # When the operations in flight were sent, None if there are none
+        self.sentAt = None
+
+    def interval(self, backedUp):
+        """
+        Get the current interval between two updates
+        :param backedUp: whether frames are queued faster than they are sent or handled, by us or by the server
+        :return: the interval in seconds
+        """
+        if backedUp:
+            return self.maxInterval
+        if self.roundTripTime is None:
+            return self.minInterval
+        return min(max(self.roundTripTime, self.minInterval), self.maxInterval)
+
+    def isDue(self, now, changed, backedUp):
+        """
+        Tell whether the buffer is to be checked for an update now
+        :param now: the current time
+        :param changed: whether the editor reported a change since the last update
+        :param backedUp: whether frames are queued faster than they are sent or handled
+        :return: True if an update may be sent
+        """
+        if changed:
+            return now - self.lastSend >= self.interval(backedUp)
+        return now - self.lastCheck >= IDLE_CHECK_INTERVAL
+
+    def onChecked(self, now, sent, withOps):
+        """
+        Record that the buffer was checked for an update
+        :param now: the current time
+        :param sent: whether an update was sent
+        :param withOps: whether the update carried operations
         :return: None
         """
-        self.editorModel.ui.updateCursor(self.cursors[name][1], self.cursors[name][0], x, y)
+        self.lastCheck = now
+        if sent:
+            self.lastSend = now
+        if withOps:
+            self.sentAt = now
+
+    def onAcknowledged(self, now):
+        """
+        Record the server committing the operations in flight, as a round trip time sample
+        :param now: the current time
+        :return: None
+        """
+        if self.sentAt is None:
+            return
+        sample = now - self.sentAt
+        self.sentAt = None
+        if self.roundTripTime is None:
+            self.roundTripTime = sample
+        else:
+            self.roundTripTime += ROUND_TRIP_GAIN * (sample - self.roundTripTime)
 
 
 class EditorModel:
     """
     The collaborative text editor client model
     """
-    __slots__ = 'addr', 'port', 'name', 'isHost' 'prevBuffer', 'isConnected', 'connection', 'cursorManager', 'controller', 'ui'
+    __slots__ = 'addr', 'port', 'name', 'isHost', 'prevBuffer', 'isConnected', 'connection', 'cursorManager', 'controller', 'ui', \
+                'codec', 'jsonCodec', 'binaryCodec', 'sync', 'syncSize', 'syncQueue', 'changeTick', 'lastCursor', \
+                'reader', 'document', 'token', 'resumeRevision', 'profiler', 'inbox', 'outbox', 'generation', \
+                'sendGeneration', 'scheduler', 'serverBackedUp', 'wakeup', 'watchingChanges', 'changedLines'
 
     def __init__(self, controller, ui):
         """
@@ -84,84 +220,226 @@ class EditorModel:
         self.addr = None
         self.port = None
         self.name = None
+        self.document = None
         self.isHost = False
         self.prevBuffer = None
         self.cursorManager = None
         self.controller = controller
         self.ui = ui
+        # Codec used for our packets, the one the server answered with
+        self.codec = None
+        self.jsonCodec = JsonCodec()
+        self.binaryCodec = None
+        # Local edits not yet acknowledged by the server
+        self.sync = ClientSync()
+        # Number of lines of the document being received in chunks, and the updates received meanwhile, None
+        # when no document is being received
+        self.syncSize = 0
+        self.syncQueue = None
+        # The change tick of the buffer when it was last compared to prevBuffer, and the last cursor sent
+        self.changeTick = None
+        self.lastCursor = None
+        # Whether the editor reports the lines it changes, and the [start, end) range of the lines of the editor
+        # which may differ from prevBuffer, the others being the same, empty if none may differ and None if any
+        # line may differ
+        self.watchingChanges = False
+        self.changedLines = None
+        # Reads the frames sent by the server
+        self.reader = None
+        # Token of our session on the server, to resume it after the connection was lost
+        self.token = None
+        # Revision of the server when our session was resumed, until we caught up with it
+        self.resumeRevision = None
+        # Times the handling of local changes, received packets and editor calls when started
+        self.profiler = Profiler()
+        # Callbacks posted by the daemon thread to be run on the editor's main thread, and the frames queued by the
+        # main thread for the daemon thread to send. Appending to and popping from a deque are atomic, so neither
+        # thread takes a lock.
+        self.inbox = deque()
+        self.outbox = deque()
+        # Number of times the daemon thread reconnected, and the same number as known by the main thread, which
+        # tags the frames it queues with it. Frames queued for a lost connection are not sent on the new one.
+        self.generation = 0
+        self.sendGeneration = 0
+        # Decides when updates are sent
+        self.scheduler = SendScheduler()
+        # Whether the server said it queues more for us than we receive
+        self.serverBackedUp = False
+        # Pipe waking the daemon thread up when frames are queued, created when first connecting
+        self.wakeup = None
 
     def createServer(self, port, name):
         """
-        Create and run the server
+        Create and run the server, connecting to it over its Unix domain socket as soon as it listens
         :param port: the server's listening port
         :param name: name of the host user
         :return: None
         """
-        self.controller.platform.runServer(port)
-        time.sleep(1)
+        unixPath = hostSocketPath(port)
+        connection = self.controller.platform.runServer(port, unixPath)
+        if connection is None:
+            self.ui.printError('Unable to start the server')
+            return
         self.isHost = True
-        self.connect('localhost', port, name)
+        # the host reconnects over the Unix domain socket, should its first connection be lost
+        self.connect(unixPath, port, name, connection=connection)
 
-    def connect(self, addr, port, name):
+    def connect(self, addr, port, name, document=None, connection=None):
         """
         Connect to the server with given user name
-        :param addr: IP address of the server
-        :param port: listening port of the server
+        :param addr: IP address of the server, or the path of its Unix domain socket
+        :param port: listening port of the server, None for a Unix domain socket
         :param name: user name
+        :param document: name of the document to be edited, None for the server's default document
+        :param connection: a socket already connected to the server, None to connect to addr
         :return: None
         """
         if self.isConnected is True:
             self.ui.printError('Already connected to a server. Please disconnect first')
             return
-        if not port and self.port:
-            port = self.port
         if not addr and self.addr:
             addr = self.addr
-        if not addr or not port or not name:
-            self.ui.printError('Wrong syntax. Usage: ' + self.platform.getApplicationName() + \
-                               ' connect <server address> <port> <name>')
+        if not port and self.port and not os.path.isabs(addr or ''):
+            port = self.port
+        if not addr or not name or (not port and not os.path.isabs(addr)):
+            self.ui.printError('Wrong syntax. Usage: ' + self.controller.platform.getApplicationName() + \
+                               ' connect <server address> <port> <name> [document]')
             return
 
-        port = int(port)
+        port = int(port) if port else None
         addr = str(addr)
         if self.connection is None:
             self.addr = addr
             self.port = port
             self.name = name
-            self.prevBuffer = []
+            self.document = document
+            self.prevBuffer = DocumentStore()
             self.cursorManager = CursorManager(self)
             self.ui.printMessage('Connecting...')
-            self.connection = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             try:
-                self.connection.connect((addr, port))
+                self.connection = connection or openConnection(self.__address())
             except socket.error:
                 self.ui.printError('Unable to connect to server')
                 return
             self.isConnected = True
-            self.send(self.connection, self.name)
+            self.codec = None
+            self.binaryCodec = BinaryCodec()
+            self.sync.reset(0)
+            self.syncQueue = None
+            self.changeTick = None
+            self.lastCursor = None
+            self.token = None
+            self.resumeRevision = None
+            self.reader = FrameReader()
+            self.inbox.clear()
+            self.outbox.clear()
+            self.generation = self.sendGeneration = 0
+            self.scheduler = SendScheduler(*self.controller.platform.getSendIntervals())
+            self.serverBackedUp = False
+            self.watchChanges()
+            if self.wakeup is None:
+                self.wakeup = os.pipe()
+                for fd in self.wakeup:
+                    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            self.send(createHello(self.name, document=self.document))
 
             self.controller.startDaemonThread()
         elif (port != self.port) or (addr != self.addr):
             self.ui.printError('Different address,port already used. You need to restart to try new ones')
 
+    def reconnect(self):
+        """
+        Connect again after the connection to the server was lost. Called from the daemon thread, the session is
+        resumed from the main thread.
+        :return: True if connected, False if the server could not be reached
+        """
+        try:
+            sock = openConnection(self.__address())
+        except socket.error:
+            return False
+        self.connection.close()
+        self.connection = sock
+        self.binaryCodec = BinaryCodec()
+        self.reader = FrameReader()
+        self.generation += 1
+        self.dispatch(self.__resume, self.generation)
+        return True
+
+    def __address(self):
+        """
+        Get the address of the server
+        :return: the path of its Unix domain socket, or its (address, port)
+        """
+        if os.path.isabs(self.addr):
+            return self.addr
+        return self.addr, self.port
+
+    def __location(self):
+        """
+        Describe where the server is, for the messages to the user
+        :return: the description
+        """
+        return 'Port ' + str(self.port) if self.port else self.addr
+
+    def __resume(self, generation):
+        """
+        Ask the server to resume our session on the new connection
+        :param generation: the generation of the new connection
+        :return: None
+        """
+        self.codec = None
+        self.lastCursor = None
+        self.resumeRevision = None
+        # the operations in flight are sent again once resumed
+        self.scheduler.sentAt = None
+        self.serverBackedUp = False
+        token = self.token
+        if self.syncQueue is not None:
+            # the document was not completely received, it is received again
+            token = None
+            self.syncQueue = None
+        self.sendGeneration = generation
+        self.send(createHello(self.name, document=self.document, token=token, revision=self.sync.revision))
+
     def disconnect(self):
         """
         Disconnect from the server
         :return: None
         """
         if self.connection is not None:
-            for name in self.cursorManager.cursors.keys():
-                if name != self.name:
-                    self.ui.removeCursor(self.cursorManager.cursors[name][1])
+            self.cursorManager.clear()
             self.controller.stopDaemonThread()
             self.connection.close()
             self.connection = None
+            self.inbox.clear()
+            self.outbox.clear()
+            self.ui.unwatchChanges()
+            self.watchingChanges = False
             self.isConnected = False
             self.isHost = False
-            self.cursorManager.reset()
             self.ui.printMessage('Successfully disconnected from the server!')
         else:
-            self.ui.printError(self.platform.getApplicationName() + ' must be running to use this command')
+            self.ui.printError(self.controller.platform.getApplicationName() + ' must be running to use this command')
+
+    def startProfiling(self, sampleEvery=1):
+        """
+        Start timing the handling of local changes, received packets and editor calls
+        :param sampleEvery: run one call in this many of each stage under cProfile
+        :return: None
+        """
+        if not self.profiler.enabled:
+            self.ui = ProfiledView(self.ui, self.profiler)
+        self.profiler.start(sampleEvery)
+
+    def stopProfiling(self, path):
+        """
+        Stop profiling and write the profile
+        :param path: the pstats file to be written, the stage timers being written next to it
+        :return: None
+        """
+        if self.profiler.enabled:
+            self.ui = self.ui.view
+            self.profiler.stop(path)
 
     def __addUsers(self, users):
         """
@@ -169,7 +447,21 @@ class EditorModel:
         :param users: the list of user data to be added
         :return: None
         """
-        map(self.__addUser, users)
+        for userData in users:
+            self.__addUser(userData)
+
+    def __setUsers(self, users):
+        """
+        Add the users we do not know of yet and remove those which are gone
+        :param users: the list of the data of all users
+        :return: None
+        """
+        names = set(user['name'] for user in users)
+        for name in list(self.cursorManager.cursors.keys()):
+            if name not in names:
+                self.__removeUser(name)
+        self.ui.setCursorColors()
+        self.__addUsers([user for user in users if user['name'] not in self.cursorManager.cursors])
 
     def __addUser(self, userData):
         """
@@ -189,22 +481,40 @@ class EditorModel:
 
     def update(self):
         """
-        Update the server about the user's current state
-        :return:
+        Update the server about the user's current state, if it changed
+        :return: None
         """
+        if self.codec is None or self.syncQueue is not None:
+            # not connected yet, or still receiving the document
+            return
+        cursor = {
+            "x": max(1, self.ui.getCursorX()),
+            "y": self.ui.getCursorY()
+        }
         d = {
             "type": "update",
             "data": {
-                "cursor": {
-                    "x": max(1, self.ui.getCursorX()),
-                    "y": self.ui.getCursorY()
-                },
+                "cursor": cursor,
                 "name": self.name
             }
         }
-        d = self.__createUpdatePacket(d)
-        data = json.dumps(d)
-        self.send(self.connection, data)
+        d = self.profiler.measure('createUpdatePacket', self.__createUpdatePacket, d)
+        if 'ops' not in d['data'] and cursor == self.lastCursor:
+            # nothing changed
+            self.scheduler.onChecked(time.time(), False, False)
+            return
+        self.lastCursor = cursor
+        self.send(self.codec.encode(d))
+        self.scheduler.onChecked(time.time(), True, 'ops' in d['data'])
+
+    def isBackedUp(self):
+        """
+        Tell whether frames are queued faster than the daemon thread sends them or the main thread handles them, or
+        than we receive them according to the server
+        :return: True if backed up
+        """
+        # the daemon thread is woken up to send the queued frames, until which one frame may be waiting
+        return self.serverBackedUp or len(self.outbox) > 1 or len(self.inbox) > MAX_DISPATCH_BATCH
 
     def __createUpdatePacket(self, d):
         """
@@ -212,58 +522,73 @@ class EditorModel:
         :param d: the packet data to which we need to append the text changes
         :return: the updated packet data
         """
-        currentBuffer = self.ui.getCurrentBuffer()
-        if currentBuffer != self.prevBuffer:
-            cursor_y = self.ui.getCursorY() - 1
-            change_y = len(currentBuffer) - len(self.prevBuffer)
-            change_x = 0
-            if cursor_y - change_y < len(self.prevBuffer) and cursor_y - change_y >= 0 \
-                    and cursor_y >= 0 and cursor_y < len(currentBuffer):
-                change_x = len(currentBuffer[cursor_y]) - len(self.prevBuffer[cursor_y - change_y])
-            limits = {
-                'from': max(0, cursor_y - abs(change_y)),
-                'to': min(len(currentBuffer) - 1, cursor_y + abs(change_y))
-            }
-            d_buffer = {
-                'start': limits['from'],
-                'end': limits['to'],
-                'change_y': change_y,
-                'change_x': change_x,
-                'buffer': currentBuffer[limits['from']:limits['to'] + 1],
-                'buffer_size': len(currentBuffer)
-            }
-            d['data']['buffer'] = d_buffer
-            self.prevBuffer = currentBuffer
+        self.__recordLocalChanges()
+        # only one list of operations is in flight at a time, the others wait for its acknowledgement
+        outgoing = self.sync.takeOutgoing()
+        if outgoing is not None:
+            d['data']['ops'], d['data']['revision'] = outgoing
         return d
 
-    def __toUtf8(self, data):
-        """
-        Encode received data to UTF-8
-        :param data: the data to be encoded
-        :return: the UTF-8 encoded data
-        """
-        if isinstance(data, dict):
-            d2 = {}
-            for key, value in data.iteritems():
-                d2[self.__toUtf8(key)] = self.__toUtf8(value)
-            return d2
-        elif isinstance(data, list):
-            return map(self.__toUtf8, data)
-        elif isinstance(data, unicode):
-            return data.encode('utf-8')
-        else:
-            return data
+    def watchChanges(self):
+        """
+        Have the editor report the lines it changes, so that only those are compared to prevBuffer
+        :return: None
+        """
+        self.watchingChanges = self.ui.watchChanges()
+        # the editor may not match prevBuffer yet, it is compared as a whole once
+        self.changedLines = None
+
+    def __recordLocalChanges(self):
+        """
+        Record the changes made to the text since the last call as local operations
+        :return: None
+        """
+        # the buffer is only copied and compared when vim counted a change
+        changeTick = self.ui.getChangeTick()
+        if changeTick == self.changeTick:
+            return
+        self.changeTick = changeTick
+        if self.watchingChanges:
+            self.__addChangedLines(self.ui.takeChanges())
+        currentLines = None
+        if self.changedLines is not None:
+            # only the changed range is copied, the lines after it are shifted by the number of lines added
+            start, end = self.changedLines or (0, 0)
+            prevEnd = end - (self.ui.getLineCount() - len(self.prevBuffer))
+            if start <= prevEnd <= len(self.prevBuffer):
+                currentLines = self.ui.getLines(start, end)
+                prevLines = self.prevBuffer.getLines(start, prevEnd)
+        if currentLines is None:
+            start = 0
+            currentLines = self.ui.getCurrentBuffer()
+            prevLines = self.prevBuffer.getLines()
+        self.changedLines = [] if self.watchingChanges else None
+        if currentLines != prevLines:
+            ops = diffLines(prevLines, currentLines, start)
+            self.sync.addLocal(ops)
+            applyOps(self.prevBuffer, ops)
 
-    def __cleanData(self, data):
+    def __addChangedLines(self, changes):
         """
-        Preprocess received data to remove unnecessary characters
-        :param data: the data to be cleaned
-        :return: the cleaned data
+        Widen the range of changed lines by the changes reported by the editor, ours included
+        :param changes: the list of (first changed line, line below the changed ones before the change, number of
+                        lines added) tuples
+        :return: None
         """
-        dirtyData = data.find("}{")
-        if dirtyData > -1:
-            data = data[:dirtyData + 1]
-        return data
+        for first, below, added in changes:
+            if self.changedLines is None:
+                return
+            if not self.changedLines:
+                start, end = first, below + added
+            else:
+                start, end = self.changedLines
+                # the end of the range moves with the lines added above it
+                if end >= below:
+                    end += added
+                elif end > first:
+                    end = below + added
+                start, end = min(start, first), max(end, below + added)
+            self.changedLines = [start, end]
 
     def processData(self, data_string):
         """
@@ -271,9 +596,40 @@ class EditorModel:
         :param data_string: the raw unprocessed data received
         :return: None
         """
-        data_string = self.__cleanData(data_string)
-        packet = self.__toUtf8(json.loads(data_string))
+        self.__processFrame(*self.__decode(data_string))
+        self.ui.redraw()
 
+    def __decode(self, data_string):
+        """
+        Decode a received frame
+        :param data_string: the frame
+        :return: the codec of the frame and the decoded packet
+        """
+        codec = self.binaryCodec if isBinary(data_string) else self.jsonCodec
+        return codec, codec.decode(data_string)
+
+    def __processFrame(self, codec, packet):
+        """
+        Take actions for a decoded frame
+        :param codec: the codec the frame was encoded with
+        :param packet: the decoded packet
+        :return: None
+        """
+        # the server answers in the encoding it picked from our hello, which we then use as well
+        self.codec = codec
+        if packet.get('type') == 'batch':
+            # several packets accumulated by the server during its batching window
+            for p in packet['data']:
+                self.__processPacket(p)
+        else:
+            self.__processPacket(packet)
+
+    def __processPacket(self, packet):
+        """
+        Take actions for a single received packet
+        :param packet: the decoded packet
+        :return: None
+        """
         if 'type' in packet.keys():
             data = packet['data']
             if packet['type'] == 'message':
@@ -290,28 +646,92 @@ class EditorModel:
                 """
                 if data['message_type'] == 'connect_success':
                     self.ui.setCursorColors()
-                    # if host has connected to server, don't reset the text buffer
-                    if self.isHost is False and 'buffer' in data.keys():
-                        self.prevBuffer = data['buffer']
-                        self.ui.setCurrentBuffer(self.prevBuffer)
-                    self.ui.printMessage('Success! You\'re now connected [Port ' + str(self.port) + ']')
+                    reconnected = self.token is not None
+                    self.token = data.get('token')
+                    if reconnected:
+                        self.cursorManager.clear()
+                    if data.get('resumed'):
+                        # the revisions we missed follow, after which our unacknowledged edits are known to be lost
+                        # or committed
+                        self.resumeRevision = data['revision']
+                        self.__addUsers(data['users'])
+                        self.__checkResumed()
+                        self.ui.printMessage('Reconnected [' + self.__location() + ']')
+                        return
+                    self.sync.reset(data.get('revision', 0))
+                    self.changedLines = None
+                    if reconnected and 'buffer' not in data.keys() and 'buffer_size' not in data.keys():
+                        # the server lost the document, ours is sent again
+                        self.prevBuffer.setLines([])
+                    # if host has connected to server, don't reset the text buffer unless the server recovered one
+                    if self.isHost is False or reconnected or data.get('revision'):
+                        if 'buffer' in data.keys():
+                            self.prevBuffer.setLines(data['buffer'])
+                            self.__setBuffer(data['buffer'])
+                        elif 'buffer_size' in data.keys():
+                            # the document follows in chunks
+                            self.prevBuffer.setLines([])
+                            self.__setBuffer([])
+                            self.syncSize = data['buffer_size']
+                            self.syncQueue = []
+                            if self.syncSize == 0:
+                                self.__finishSync()
+                    self.ui.printMessage('Success! You\'re now connected [' + self.__location() + ']')
                     self.__addUsers(data['users'])
+                elif data['message_type'] == 'sync_chunk':
+                    if self.syncQueue is not None:
+                        self.prevBuffer.replaceLines(data['start'], data['start'], data['chunk'])
+                        if data['start'] == 0:
+                            self.__setBuffer(data['chunk'])
+                        else:
+                            self.__replaceLines(data['start'], data['start'], data['chunk'])
+                        if len(self.prevBuffer) >= self.syncSize:
+                            self.__finishSync()
                 elif data['message_type'] == 'user_connected':
                     self.ui.printMessage(data['user']['name'] + ' connected to this document')
                     self.__addUsers([data['user']])
+                elif data['message_type'] == 'resync':
+                    # the server dropped updates we were too slow to receive and sent the whole document instead,
+                    # our unacknowledged edits are lost, the server discarding those it had not committed yet
+                    self.sync.reset(data.get('revision', 0))
+                    self.changedLines = None
+                    self.prevBuffer.setLines(data['buffer'])
+                    self.__setBuffer(data['buffer'])
+                    if self.syncQueue is not None:
+                        self.__finishSync()
+                    for user in data['users']:
+                        if user['name'] == self.name:
+                            self.ui.setCursor(user['cursor']['x'], user['cursor']['y'])
+                    # the arrivals and departures queued for us were dropped as well
+                    self.__setUsers(data['users'])
+                    self.cursorManager.updateCursors([(user['name'], user['cursor']['x'], user['cursor']['y'])
+                                                      for user in data['users'] if user['name'] != self.name])
+                elif data['message_type'] == 'backpressure':
+                    # the server queues more for us than we receive, our updates are sent less often meanwhile
+                    self.serverBackedUp = data['backed_up']
                 elif data['message_type'] == 'user_disconnected':
                     self.__removeUser(data['name'])
                     self.ui.printMessage(data['name'] + ' disconnected from this document')
                 else:
                     self.ui.printError('Received unknown message_type: ' + str(data['message_type']))
             elif packet['type'] == 'update':
-                if 'buffer' in data.keys() and data['name'] != self.name:
-                    b_data = data['buffer']
-                    currentBuffer = self.ui.getCurrentBuffer()
-                    self.prevBuffer = currentBuffer[:b_data['start']] \
-                                      + b_data['buffer'] \
-                                      + currentBuffer[b_data['end'] - b_data['change_y'] + 1:]
-                    self.ui.setCurrentBuffer(self.prevBuffer)
+                if self.syncQueue is not None:
+                    # the document is not complete yet, the update is applied once it is
+                    self.syncQueue.append(packet)
+                    return
+                if 'ops' in data.keys() and data.get('revision', 0) > self.sync.revision:
+                    if data['name'] == self.name:
+                        # our own operations coming back, already applied locally, the next ones can be sent
+                        self.sync.acknowledge(data['revision'])
+                        self.scheduler.onAcknowledged(time.time())
+                        self.controller.onChange()
+                    else:
+                        # record our local changes first, so that the remote operations are transformed against them
+                        self.__recordLocalChanges()
+                        ops = self.sync.receive(data['ops'], data['revision'])
+                        # only the lines touched by the operations are rewritten in the editor
+                        applyOps(self.prevBuffer, ops, self.__replaceLines)
+                    self.__checkResumed()
                 if 'updated_cursors' in data.keys():
                     # set our own cursor first
                     for updated_user in data['updated_cursors']:
@@ -319,54 +739,152 @@ class EditorModel:
                             self.ui.setCursor(updated_user['cursor']['x'], updated_user['cursor']['y'])
 
                     # then set others' cursors
-                    for updated_user in data['updated_cursors']:
-                        if self.name != updated_user['name']:
-                            self.cursorManager.updateCursor(updated_user['name'],
-                                                            updated_user['cursor']['x'], updated_user['cursor']['y'])
+                    self.cursorManager.updateCursors([(updated_user['name'], updated_user['cursor']['x'],
+                                                       updated_user['cursor']['y'])
+                                                      for updated_user in data['updated_cursors']
+                                                      if self.name != updated_user['name']])
             else:
                 self.ui.printError('Received unknown packet type: ' + str(packet['type']))
-            self.ui.redraw()
 
-    def send(self, sock, data):
+    def __checkResumed(self):
+        """
+        Send our unacknowledged edits again once the revisions missed while reconnecting were received, as the
+        server did not commit them if they were not among these
+        :return: None
+        """
+        if self.resumeRevision is not None and self.sync.revision >= self.resumeRevision:
+            self.resumeRevision = None
+            self.sync.resend()
+            self.controller.onChange()
+
+    def __setBuffer(self, lines):
         """
-        Send data through a socket
-        :param sock: the socket through which data is to be sent
+        Replace the text of the editor, without the change counting as a local edit
+        :param lines: the new lines
+        :return: None
+        """
+        self.ui.setCurrentBuffer(lines)
+        self.changeTick = self.ui.getChangeTick()
+
+    def __replaceLines(self, start, end, lines):
+        """
+        Replace a range of lines of the editor, without the change counting as a local edit
+        :param start: the first line to be replaced
+        :param end: the line after the last line to be replaced
+        :param lines: the lines replacing the range [start, end)
+        :return: None
+        """
+        if len(self.prevBuffer) == len(lines) - (end - start) or not len(self.prevBuffer):
+            # the editor always shows at least one line, which an empty document does not have
+            self.ui.setCurrentBuffer(self.prevBuffer.getLines())
+        else:
+            self.ui.replaceLines(start, end, lines)
+        self.changeTick = self.ui.getChangeTick()
+
+    def __finishSync(self):
+        """
+        Apply the updates received while the document was being received
+        :return: None
+        """
+        queued = self.syncQueue
+        self.syncQueue = None
+        for packet in queued:
+            self.__processPacket(packet)
+
+    def send(self, data):
+        """
+        Queue data to be sent to the server by the daemon thread
         :param data: the data to be sent
         :return: None
         """
-        data = struct.pack('>I', len(data)) + data
-        try:
-            sock.sendall(data)
-        except socket.error:
-            self.ui.printError('Socket error occurred when sending')
+        self.outbox.append((self.sendGeneration, data))
+        if self.wakeup is not None:
+            try:
+                os.write(self.wakeup[1], b'\0')
+            except OSError:
+                # the pipe is full, so the daemon thread is waking up anyway
+                pass
 
-    def recvall(self, sock, n):
+    def flush(self):
         """
-        Helper function to recv n bytes or return None if EOF is hit
-        :param sock: the socket through which data is to be received
-        :param n: the number of bytes of data to be received
-        :return: the received data of length n
+        Send the queued data, from the daemon thread
+        :return: None
         """
-        data = ''
-        while len(data) < n:
+        while self.outbox:
+            generation, data = self.outbox.popleft()
+            if generation != self.generation:
+                # queued for a lost connection, the session is resumed on the new one
+                continue
             try:
-                packet = sock.recv(n - len(data))
-            except socket.timeout:
-                #print('Timeout error occurred when receiving')
-                break
+                self.connection.sendall(frame(data))
             except socket.error:
-                print('Socket error occurred when receiving')
-                break
-            if not packet:
-                return None
-            data += packet
-        return data
+                self.dispatch(self.ui.printError, 'Socket error occurred when sending')
+                return
+
+    def receive(self, timeout):
+        """
+        Wait for data from the server and decode the frames received, from the daemon thread. The packets are
+        handled on the main thread.
+        :param timeout: the maximum time to wait in seconds, less if frames are queued to be sent
+        :return: False if the connection was closed or sent a malformed frame, True otherwise
+        """
+        readable = select.select([self.connection, self.wakeup[0]], [], [], timeout)[0]
+        if self.wakeup[0] in readable:
+            # frames were queued, they are sent before waiting again
+            try:
+                os.read(self.wakeup[0], 4096)
+            except OSError:
+                pass
+        if self.connection not in readable:
+            return True
+        try:
+            if not self.reader.readFrom(self.connection):
+                return False
+        except socket.error:
+            self.dispatch(self.ui.printError, 'Socket error occurred when receiving')
+            return False
+        for data in self.reader.frames():
+            # the frames are views of the reader's buffer, so they are decoded before the next read
+            try:
+                codec, packet = self.__decode(data)
+            except MALFORMED_FRAME_ERRORS as e:
+                # our codec may no longer match the server's, the session is resumed on a new connection
+                self.dispatch(self.ui.printError, 'Received a malformed frame, reconnecting: ' + repr(e))
+                return False
+            self.dispatch(self.__processFrame, codec, packet)
+        return True
+
+    def dispatch(self, function, *args):
+        """
+        Post a callback to be run on the editor's main thread
+        :param function: the callback
+        :param args: the arguments of the callback
+        :return: None
+        """
+        self.inbox.append((function, args))
+
+    def runDispatched(self, limit=MAX_DISPATCH_BATCH):
+        """
+        Run the callbacks posted by the daemon thread, from the editor's main thread, redrawing once
+        :param limit: the maximum number of callbacks run, the others being left for the next call
+        :return: None
+        """
+        if self.inbox:
+            self.profiler.measure('processData', self.__runBatch, limit)
+            self.ui.redraw()
+
+    def __runBatch(self, limit):
+        for i in range(limit):
+            if not self.inbox:
+                return
+            function, args = self.inbox.popleft()
+            function(*args)
 
 class EditorController:
     """
     The collaborative text editor controller
     """
-    __slots__ = 'daemonThread', 'runFlag', 'editorModel', 'platform', 'ui'
+    __slots__ = 'daemonThread', 'runFlag', 'changed', 'editorModel', 'platform', 'ui', 'hasTimer'
 
     def __init__(self):
         """
@@ -377,11 +895,15 @@ class EditorController:
         self.ui = VimUI()
         self.editorModel = EditorModel(self, self.ui)
         self.runFlag = False
+        # Whether the editor reported a change since the last update was sent
+        self.changed = False
+        # Whether the platform calls onTimer, otherwise it is called on every change notification
+        self.hasTimer = False
 
-    def execute(self, arg1=False, arg2=False, arg3=False, arg4=False):
+    def execute(self, arg1=False, arg2=False, arg3=False, arg4=False, arg5=False):
         """
         Execute the collaborative text editor command with the given command line arguments
-        :param arg1, arg2, arg3, arg4: command line arguments
+        :param arg1, arg2, arg3, arg4, arg5: command line arguments
         :return: None
         """
         default_name = self.platform.getDefaultName()
@@ -400,9 +922,20 @@ class EditorController:
                 self.ui.printMessage("usage :" + self.platform.getApplicationName() + \
                                      " host [port" + default_port_string + \
                                      "] [name" + default_name_string + "]")
+        elif arg1 == 'connect' and arg2 and os.path.isabs(arg2):
+            # connect to a server on this machine over its Unix domain socket
+            if arg3:
+                self.editorModel.connect(arg2, None, arg3, arg4 or None)
+            elif default_name != '0':
+                self.editorModel.connect(arg2, None, default_name)
+            else:
+                self.ui.printMessage("usage :" + self.platform.getApplicationName() + \
+                                     " connect [socket path] [name" + default_name_string + "] [document]")
         elif arg1 == 'connect':
             # connect to a server
-            if arg2 and arg3 and arg4:
+            if arg2 and arg3 and arg4 and arg5:
+                self.editorModel.connect(arg2, arg3, arg4, arg5)
+            elif arg2 and arg3 and arg4:
                 self.editorModel.connect(arg2, arg3, arg4)
             elif arg2 and arg3 and default_name != '0':
                 self.editorModel.connect(arg2, arg3, default_name)
@@ -411,7 +944,8 @@ class EditorController:
             else:
                 self.ui.printMessage("usage :" + self.platform.getApplicationName() + \
                                      " connect [host address / 'localhost'] [port" + \
-                                     default_port_string + "] [name" + default_name_string + "]")
+                                     default_port_string + "] [name" + default_name_string + "] [document]" + \
+                                     " | connect [socket path] [name] [document]")
         elif arg1 == 'disconnect':
             # disconnect from the server
             self.editorModel.disconnect()
@@ -419,58 +953,105 @@ class EditorController:
             # disconnect from the server and quit
             self.editorModel.disconnect()
             self.ui.quit()
+        elif arg1 == 'profile' and arg2 == 'start':
+            # time the hot paths of the client, sampling one call in arg3 of each under cProfile
+            self.editorModel.startProfiling(int(arg3) if arg3 else 1)
+            self.ui.printMessage('Profiling started')
+        elif arg1 == 'profile' and arg2 == 'stop':
+            path = arg3 or os.path.join(tempfile.gettempdir(), 'teameditor-client-' + str(os.getpid()) + '.prof')
+            self.editorModel.stopProfiling(path)
+            self.ui.printMessage('Profile written to ' + path)
+        elif arg1 == 'profile':
+            self.ui.printMessage("usage: " + self.platform.getApplicationName() + \
+                                 " profile start [sample every] | profile stop [path]")
         else:
-            self.ui.printMessage("usage: " + self.platform.getApplicationName() + " [share] [connect] [disconnect] [quit]")
+            self.ui.printMessage("usage: " + self.platform.getApplicationName() + \
+                                 " [share] [connect] [disconnect] [quit] [profile]")
+
+    def onChange(self):
+        """
+        Called by the editor when the text or the cursor changed. The update is sent right away after being idle,
+        otherwise from the timer once the send interval elapsed.
+        :return: None
+        """
+        self.changed = True
+        if self.runFlag is not True:
+            return
+        if not self.hasTimer:
+            self.editorModel.runDispatched()
+        self.__sendUpdate()
+
+    def onTimer(self):
+        """
+        Called by the editor on its main thread every DISPATCH_INTERVAL while connected. Applies the packets the
+        daemon thread received and sends our changes, so that only the main thread calls the editor.
+        :return: None
+        """
+        if self.runFlag is not True:
+            return
+        self.editorModel.runDispatched()
+        self.__sendUpdate()
+
+    def __sendUpdate(self):
+        """
+        Send an update if the editor reported a change and the send interval elapsed, and check the buffer now
+        and then in case a notification was missed, which is cheap as it is only compared when its change tick
+        moved. Nothing is sent while idle.
+        :return: None
+        """
+        if self.editorModel.scheduler.isDue(time.time(), self.changed, self.editorModel.isBackedUp()):
+            self.changed = False
+            self.editorModel.update()
 
     def startDaemonThread(self):
         """
-        Start running the daemon thread to send and receive periodic updates
+        Start running the daemon thread to send and receive updates, and the timer handling them
         :return: None
         """
         self.runFlag = True
+        self.hasTimer = self.platform.startTimer(DISPATCH_INTERVAL)
         self.daemonThread = Thread(target=self.__run)
         self.daemonThread.start()
 
     def stopDaemonThread(self):
         """
-        Stop the daemon thread
+        Stop the daemon thread and the timer
         :return: None
         """
+        self.platform.stopTimer()
         self.runFlag = False
         self.daemonThread.join()
 
     def __run(self):
         """
-        Receives updates from the server and sends periodic updates to the server
+        Sends the queued updates to the server and receives its packets. Only does network I/O, the editor is
+        only called from the main thread.
         :return: None
         """
-        begin = time.time()
-        messageLen = None
-        data = ''
         while self.runFlag is True:
-            # set timeout so as not to block on receiving updates
-            self.editorModel.connection.settimeout(0.01)    #10 ms
-
-            # receive updates
-            if messageLen is None:
-                data = self.editorModel.recvall(self.editorModel.connection, 4)
-                if data is None:
-                    return
-                elif len(data) == 4:
-                    messageLen = struct.unpack('>I', data)[0]
-            if messageLen is not None:
-                data = self.editorModel.recvall(self.editorModel.connection, messageLen)
-                if data is None:
-                    return
-                elif len(data) == messageLen:
-                    self.editorModel.processData(data)
-                    messageLen = None
-
-            # reset to blocking
-            self.editorModel.connection.settimeout(None)
+            self.editorModel.flush()
+            # receive updates, woken up when ours are queued, and checking the run flag now and then
+            if not self.editorModel.receive(0.1) and not self.__reconnect():
+                return
 
-            # send periodic updates
-            if time.time() - begin > 0.1:   #100 ms
-                self.editorModel.update()
-                begin = time.time()
+    def __reconnect(self):
+        """
+        Try to resume the session after the connection was lost, from the daemon thread, and disconnect from the
+        main thread if the server cannot be reached after MAX_RECONNECT_ATTEMPTS attempts
+        :return: True if connected again or stopped meanwhile, False if given up
+        """
+        model = self.editorModel
+        delay = RECONNECT_DELAY
+        for attempt in range(1, MAX_RECONNECT_ATTEMPTS + 1):
+            if self.runFlag is not True or model.reconnect():
+                return True
+            model.dispatch(model.ui.printError, 'Unable to reach the server (attempt ' + str(attempt) + ' of ' +
+                           str(MAX_RECONNECT_ATTEMPTS) + ')')
+            if attempt < MAX_RECONNECT_ATTEMPTS:
+                time.sleep(delay)
+                delay = min(2 * delay, MAX_RECONNECT_DELAY)
+        model.dispatch(model.ui.printError, 'Lost the connection to the server, giving up')
+        # the main thread stops this thread, which ends first
+        model.dispatch(model.disconnect)
+        return False
 
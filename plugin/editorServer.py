@@ -1,260 +1,846 @@
+import os
 import socket
-import sys
-import select
-import json
-import struct
+import errno
+import argparse
+import multiprocessing
+import signal
+import tempfile
+import time
+import uuid
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from multiprocessing.reduction import recv_handle, send_handle
 
-class EditorServer:
+try:
+    from urllib import quote
+except ImportError:
+    from urllib.parse import quote
+
+from documentStore import DocumentStore
+from eventLoop import EventLoop, READ, WRITE, WOULD_BLOCK
+from framing import MIN_READ_SIZE, FrameReader, frame, frameHeader
+from operationLog import OperationLog, SNAPSHOT_INTERVAL
+from operations import INSERT_LINES, DELETE_LINES, applyOps, opsFromSplice, transformPosition
+from profiler import Profiler
+from serverMetrics import PUSH_INTERVAL, ServerMetrics, StatsEndpoint, renderFamilies
+from syncEngine import ServerHistory
+from transports import listen, transportFor, transportOf
+from wireProtocol import BACKPRESSURE, BINARY, CHUNKED_SYNC, DEFAULT_DOCUMENT, JSON, MALFORMED_FRAME_ERRORS, \
+    BinaryCodec, JsonCodec, parseHello
+
+# Queued outbound bytes above which a client's cursor frames are dropped and the client is told to slow down,
+# until less than half of it is queued
+QUEUE_SOFT_LIMIT = 256 * 1024
+
+# Queued outbound bytes above which a client is resynchronized, or disconnected if already resynchronizing
+QUEUE_HARD_LIMIT = 4 * 1024 * 1024
+
+# Approximate number of bytes of text per chunk of the document sent to joining clients
+SYNC_CHUNK_SIZE = 64 * 1024
+
+# Number of session tokens a document remembers for clients to resume their session after reconnecting
+MAX_SESSIONS = 1024
+
+# Maximum number of buffers handed to a single vectored send
+MAX_IOVEC = 512
+
+# Whether sockets support vectored sends (writev)
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+
+
+def printMessage(message):
     """
-    The server of the collaborative text editor
+    Write a message of the server to the standard output
+    :param message: the message
+    :return: None
     """
-    __slots__ = 'socketList', 'buffer', 'clientManager'
-    
-    def __init__(self, port):
+    print(message)
+
+
+def documentDirectory(dataDirectory, name):
+    """
+    Get the directory where a document is persisted
+    :param dataDirectory: the data directory of the server
+    :param name: the name of the document
+    :return: the path of the directory, the data directory itself for the default document
+    """
+    if name == DEFAULT_DOCUMENT:
+        return dataDirectory
+    return os.path.join(dataDirectory, 'doc-' + quote(name, safe=''))
+
+
+class Document:
+    """
+    A document being edited, with its clients
+    """
+    __slots__ = 'name', 'connections', 'buffer', 'history', 'log', 'clientManager', 'eventLoop', 'codecs', \
+                'batchInterval', 'batchTimer', 'pendingBroadcasts', 'pendingCursorBroadcasts', 'onConnectionClosed', \
+                'sessions', 'metrics', 'profiler', 'logMessage'
+
+    def __init__(self, name, eventLoop, batchInterval=0, dataDirectory=None, onConnectionClosed=None, metrics=None,
+                 profiler=None, logMessage=None):
         """
         Initializer
-        :param port: the port on which the server listens for incoming connection requests
+        :param name: the name of the document
+        :param eventLoop: the event loop dispatching the events of the document's connections
+        :param batchInterval: the time in seconds during which broadcasts are accumulated and sent as one frame
+                              per client, 0 to send every broadcast immediately
+        :param dataDirectory: the directory where the document is persisted and recovered from, None to keep it
+                              in memory only
+        :param onConnectionClosed: called without arguments whenever a connection of the document is closed
+        :param metrics: the metrics of the process
+        :param profiler: the profiler of the process
+        :param logMessage: called with each message of the document, None to print them
         """
+        self.name = name
+        self.metrics = metrics if metrics is not None else ServerMetrics()
+        self.profiler = profiler if profiler is not None else Profiler()
+        self.logMessage = logMessage if logMessage is not None else printMessage
+
         # Server side copy of the document
-        self.buffer = []
+        self.buffer = DocumentStore()
+        # Revisions of the document, to transform edits based on older ones
+        self.history = ServerHistory()
+
+        # Durable log of the revisions, if any
+        self.log = None
+        if dataDirectory is not None:
+            self.log = OperationLog(dataDirectory, logMessage=self.logMessage)
+            revision, lines = self.log.recover()
+            self.buffer.setLines(lines)
+            self.history.revision = revision
+            self.logMessage('Recovered revision ' + str(revision) + ' of ' + name + ' from ' + dataDirectory)
 
         # Manages the clients
         self.clientManager = ClientManager(self)
 
-        # Bind to server port and listen
-        listenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        listenSocket.bind(("", port))
-        listenSocket.listen(10)
+        # Dictionary mapping client sockets to their connections
+        self.connections = {}
 
-        # List of sockets whose states have to be checked
-        self.socketList = [listenSocket]
+        # Dictionary mapping the session tokens given to clients to their names, oldest first
+        self.sessions = OrderedDict()
 
-        # Start accepting clients
-        self.acceptClients(listenSocket)
+        # Dictionary mapping the supported wire encodings to their codec, in order of preference. Codecs are per
+        # document as the binary one maps the document's users to session ids.
+        self.codecs = {BINARY: BinaryCodec(), JSON: JsonCodec()}
+
+        # Dispatches socket events
+        self.eventLoop = eventLoop
+        self.onConnectionClosed = onConnectionClosed
 
-    def acceptClients(self, listenSocket):
+        # Broadcasts accumulated during the current batching window, as [clientX, data, sendToClientX, cursorOnly]
+        # entries
+        self.batchInterval = batchInterval
+        self.batchTimer = None
+        self.pendingBroadcasts = []
+        # Dictionary mapping client names to their pending cursor-only broadcast
+        self.pendingCursorBroadcasts = {}
+
+    def close(self):
         """
-        Accepts clients and handles their messages
-        :param listenSocket the socket on server to listen for connection requests
+        Persist the document and release its log
         :return: None
         """
-        messageLen = None
-        while True:
-            try:
-                readSockets, writeSockets, errorSockets = select.select(self.socketList, [], [], 300)
-
-                # for sockets that are in read state
-                for socket in readSockets:
-                    # new connection request from a client on the listen socket
-                    if socket == listenSocket:
-                        clientSocket, addr = listenSocket.accept()
-                        self.socketList.append(clientSocket)
-
-                        # receive client's name
-                        if messageLen is None:
-                            data = self.recvall(clientSocket, 4)
-                            if data is not None and len(data) == 4:
-                                messageLen = struct.unpack('>I', data)[0]
-                        if messageLen is not None:
-                            data = self.recvall(clientSocket, messageLen)
-                            if data is not None and len(data) == messageLen:
-                                name = str(data)
-
-                                #TODO: validate name
-
-                                client = Client(name, clientSocket)
-                                self.clientManager.addClient(client)
-                                print('Client ' + client.name + ' joined!')
-
-                                # give the current buffer and other client info to this new client
-                                d = {
-                                    'type': 'message',
-                                    'data': {
-                                        'message_type': 'connect_success',
-                                        'name': client.name,
-                                        'users': self.clientManager.allClientsToDict()
-                                    }
-                                }
-                                if self.clientManager.isMulti():
-                                    d['data']['buffer'] = self.buffer
-
-                                self.send(client.sock, json.dumps(d))
-
-                                # broadcast to other clients about this new client
-                                d = {
-                                    'type': 'message',
-                                    'data': {
-                                        'message_type': 'user_connected',
-                                        'user': client.toDict()
-                                    }
-                                }
-
-                                self.broadcastData(client.name, json.dumps(d))
-
-                                messageLen = None
-                        
-                    # incoming data from clients
-                    else:
-                        # get incoming data
-                        if messageLen is None:
-                            data = self.recvall(socket, 4)
-                            if data is None:
-                                # EOF received. Broadcast to other clients about this client having disconnected
-                                client = self.clientManager.getClientBySock(socket)
-                                d = {
-                                    'type': 'message',
-                                    'data': {
-                                        'message_type': 'user_disconnected',
-                                        'name': client.name
-                                    }
-                                }
-                                self.broadcastData(client.name, json.dumps(d))
-                                print('Client ' + client.name + ' left')
-
-                                # remove the client from client manager and socket list
-                                self.clientManager.removeClient(client)
-                                if socket in self.socketList: self.socketList.remove(socket)
-
-                                # exit if all clients have disconnected
-                                if len(self.socketList) == 1: return
-                            elif len(data) == 4:
-                                messageLen = struct.unpack('>I', data)[0]
-                        if messageLen is not None:
-                            data = self.recvall(socket, messageLen)
-                            if data is None:
-                                # EOF received. Broadcast to other clients about this client having disconnected
-                                client = self.clientManager.getClientBySock(socket)
-                                d = {
-                                    'type': 'message',
-                                    'data': {
-                                        'message_type': 'user_disconnected',
-                                        'name': client.name
-                                    }
-                                }
-                                self.broadcastData(client.name, json.dumps(d))
-                                print('Client ' + client.name + ' left')
-
-                                # remove the client from client manager and socket list
-                                self.clientManager.removeClient(client)
-                                if socket in self.socketList: self.socketList.remove(socket)
-
-                                # exit if all clients have disconnected
-                                if len(self.socketList) == 1: return
-                            elif len(data) == messageLen:
-                                # process the data
-                                self.processData(data)
-                                messageLen = None
-                    
-            except select.error:
-                #TODO
-                print('Socket error')
-
-    def broadcastData(self, clientX, data, sendToClientX=False):
-        """
-        Broadcast data to all clients on behalf of clientX
+        if self.log is not None:
+            if self.history.revision != self.log.snapshotRevision:
+                self.log.snapshot(self.history.revision, self.buffer.getLines())
+            self.log.close()
+            self.log = None
+
+    def addConnection(self, sock, hello, pending=b''):
+        """
+        Take over a connection whose hello named this document
+        :param sock: the non-blocking client socket
+        :param hello: the parsed hello of the client
+        :param pending: the bytes received after the hello
+        :return: None
+        """
+        connection = Connection(self, sock)
+        self.connections[sock] = connection
+        self.eventLoop.register(sock, connection.onReadable, connection.onWritable)
+        for codecName in hello['codecs']:
+            if codecName in self.codecs:
+                connection.codec = self.codecs[codecName]
+                break
+        connection.features = hello['features']
+        self.__addClient(connection, hello)
+        if pending:
+            connection.feed(pending)
+
+    def onFrame(self, connection, data):
+        """
+        Handle a complete frame received on a connection
+        :param connection: the connection on which the frame was received
+        :param data: the payload of the frame
+        :return: None
+        """
+        begin = time.time()
+        self.profiler.measure('processData', self.processData, data, connection)
+        self.metrics.framesReceived.inc()
+        self.metrics.processTime.observe(time.time() - begin)
+
+    def __addClient(self, connection, hello):
+        """
+        Register a new client and introduce it to the other clients
+        :param connection: the connection of the new client
+        :param hello: the parsed hello of the client
+        :return: None
+        """
+        #TODO: validate name
+        name = hello['name']
+
+        # the snapshot given to the new client must not be followed by edits it already contains
+        self.flushBroadcasts()
+
+        # a client presenting the token of a previous session of its name only gets the revisions it missed, as
+        # long as the history goes back as far
+        token = hello.get('token')
+        missed = None
+        if token is not None and self.sessions.get(token) == name:
+            stale = self.clientManager.clientsByName.get(name)
+            if stale is not None:
+                # the previous connection is dead but not closed yet, edits it did not deliver are lost
+                self.closeConnection(self.connections[stale.sock])
+            missed = self.history.since(hello.get('revision', 0))
+        if missed is not None:
+            del self.sessions[token]
+        else:
+            token = uuid.uuid4().hex
+        self.sessions[token] = name
+        if len(self.sessions) > MAX_SESSIONS:
+            self.sessions.popitem(False)
+
+        client = Client(name, connection.sock)
+        connection.client = client
+        self.clientManager.addClient(client)
+        self.codecs[BINARY].addSession(client.sessionId, client.name)
+        self.logMessage('Client ' + client.name + ' joined!')
+
+        # give the current buffer and other client info to this new client
+        d = {
+            'type': 'message',
+            'data': {
+                'message_type': 'connect_success',
+                'name': client.name,
+                'users': self.clientManager.allClientsToDict(),
+                'revision': self.history.revision,
+                'token': token
+            }
+        }
+        lines = None
+        if missed is not None:
+            d['data']['resumed'] = True
+        elif self.clientManager.isMulti() or self.history.revision:
+            # a document recovered from disk is sent even to its first client
+            lines = self.buffer.getLines()
+            if CHUNKED_SYNC in connection.features:
+                # the document follows in chunks, interleaved with the updates made meanwhile
+                d['data']['buffer_size'] = len(lines)
+            else:
+                d['data']['buffer'] = lines
+
+        self.send(client.sock, d)
+        if lines and CHUNKED_SYNC in connection.features:
+            connection.startSync(lines)
+        for revision, ops, author in missed or ():
+            self.send(client.sock, {
+                'type': 'update',
+                'data': {
+                    'name': author,
+                    'ops': ops,
+                    'revision': revision,
+                    'updated_cursors': []
+                }
+            })
+
+        # broadcast to other clients about this new client
+        d = {
+            'type': 'message',
+            'data': {
+                'message_type': 'user_connected',
+                'user': client.toDict(True)
+            }
+        }
+
+        self.broadcastData(client.name, d)
+
+    def closeConnection(self, connection, force=False):
+        """
+        Close a connection and tell the other clients that its client left
+        :param connection: the connection to be closed
+        :param force: whether to close a connection already marked as closed
+        :return: None
+        """
+        if connection.closed and not force:
+            return
+        connection.closed = True
+        self.eventLoop.unregister(connection.sock)
+        del self.connections[connection.sock]
+        connection.sock.close()
+
+        client = connection.client
+        # a client replaced by a newer connection of its name is not announced as gone
+        if client is not None and self.clientManager.removeClient(client):
+            # broadcast to other clients about the client having disconnected
+            d = {
+                'type': 'message',
+                'data': {
+                    'message_type': 'user_disconnected',
+                    'name': client.name
+                }
+            }
+            self.broadcastData(client.name, d)
+            self.codecs[BINARY].removeSession(client.name)
+            self.logMessage('Client ' + client.name + ' left')
+
+        if self.onConnectionClosed is not None:
+            self.onConnectionClosed()
+
+    def broadcastData(self, clientX, packet, sendToClientX=False, cursorOnly=False):
+        """
+        Broadcast a packet to all clients on behalf of clientX
         :param clientX: the client whose data is being sent to other clients
-        :param data: the data to be sent
+        :param packet: the packet to be sent
         :param sendToSelf: whether to send to clientX or not
+        :param cursorOnly: whether the packet only carries clientX's cursor, so that it may be superseded
+        :return: None
+        """
+        if self.batchInterval:
+            entry = [clientX, packet, sendToClientX, cursorOnly]
+            if cursorOnly:
+                # a newer cursor of the same client supersedes the pending one
+                stale = self.pendingCursorBroadcasts.get(clientX)
+                if stale is not None:
+                    stale[1] = None
+                self.pendingCursorBroadcasts[clientX] = entry
+            self.pendingBroadcasts.append(entry)
+            if self.batchTimer is None:
+                self.batchTimer = self.eventLoop.callLater(self.batchInterval, self.flushBroadcasts)
+            return
+        self.profiler.measure('broadcastData', self.__broadcastNow, clientX, packet, sendToClientX, cursorOnly)
+
+    def __broadcastNow(self, clientX, packet, sendToClientX, cursorOnly):
+        """
+        Send a packet to all clients on behalf of clientX
         :return: None
         """
-        for name, client in self.clientManager.clientsByName.iteritems():
+        # encode and pack length of data along with it, once per codec
+        begin = time.time()
+        frames = {}
+        key = (clientX,) if cursorOnly else None
+        for name, client in self.clientManager.clientsByName.items():
             if client.name != clientX or sendToClientX:
-                self.send(client.sock, data)
+                connection = self.connections.get(client.sock)
+                if connection is not None:
+                    data = frames.get(connection.codec.name)
+                    if data is None:
+                        data = connection.codec.encode(packet)
+                        data = frames[connection.codec.name] = frame(data)
+                    connection.write(data, key)
+        self.metrics.broadcastTime.observe(time.time() - begin)
 
-    def send(self, sock, data):
+    def flushBroadcasts(self):
         """
-        Send data through a socket
-        :param sock: the socket through which data is to be sent
-        :param data: the data to be sent
+        Send the broadcasts accumulated during the batching window, as one frame per client
         :return: None
         """
-        # pack length of data along with it
-        data = struct.pack('>I', len(data)) + data
-        try:
-            sock.sendall(data)
-        except socket.error:
-            print('Socket error occurred when sending')
+        if self.batchTimer is not None:
+            self.eventLoop.cancel(self.batchTimer)
+            self.batchTimer = None
+        pending = [entry for entry in self.pendingBroadcasts if entry[1] is not None]
+        self.pendingBroadcasts = []
+        self.pendingCursorBroadcasts = {}
+        if not pending:
+            return
+        self.profiler.measure('flushBroadcasts', self.__sendBatch, pending)
 
-    def recvall(self, sock, n):
+    def __sendBatch(self, pending):
         """
-        Helper function to recv n bytes or return None if EOF is hit
-        :param sock: the socket through which data is to be received
-        :param n: the number of bytes of data to be received
-        :return: the received data of length n
+        Send accumulated broadcasts, as one frame per client
+        :param pending: the [clientX, data, sendToClientX, cursorOnly] entries of the broadcasts
+        :return: None
         """
-        data = ''
-        while len(data) < n:
-            try:
-                packet = sock.recv(n - len(data))
-            except socket.timeout:
-                #print('Timeout error occurred when receiving')
-                break
-            except socket.error:
-                print('Socket error occurred when receiving')
-                break
-            if not packet:
-                return None
-            data += packet
-        return data
-
-    def __toUtf8(self, data):
-        """
-        Encode received data to UTF-8
-        :param data: the data to be encoded
-        :return: the UTF-8 encoded data
-        """
-        if isinstance(data, dict):
-            d2 = {}
-            for key, value in data.iteritems():
-                d2[self.__toUtf8(key)] = self.__toUtf8(value)
-            return d2
-        elif isinstance(data, list):
-            return map(self.__toUtf8, data)
-        elif isinstance(data, unicode):
-            return data.encode('utf-8')
+        begin = time.time()
+
+        # only the clients which sent something in this window get a different set of packets
+        excluded = {}
+        for i, entry in enumerate(pending):
+            if not entry[2]:
+                excluded.setdefault(entry[0], set()).add(i)
+
+        # packets are encoded once per codec and frames are shared by the clients getting the same packets
+        encoded = {}
+        frames = {}
+        for name, client in self.clientManager.clientsByName.items():
+            connection = self.connections.get(client.sock)
+            if connection is None:
+                continue
+            codec = connection.codec
+            skip = excluded.get(name, ())
+            included = tuple(i for i in range(len(pending)) if i not in skip) if skip else None
+            frame = frames.get((codec.name, included))
+            if frame is None:
+                indexes = range(len(pending)) if included is None else included
+                if not indexes:
+                    continue
+                packets = []
+                for i in indexes:
+                    data = encoded.get((codec.name, i))
+                    if data is None:
+                        data = encoded[(codec.name, i)] = codec.encode(pending[i][1])
+                    packets.append(data)
+                senders = tuple(pending[i][0] for i in indexes if pending[i][3])
+                frame = frames[(codec.name, included)] = (self.__batchFrame(codec, packets),
+                                                          senders if len(senders) == len(indexes) else None)
+            connection.write(frame[0], frame[1])
+        self.metrics.broadcastTime.observe(time.time() - begin)
+
+    def __batchFrame(self, codec, packets):
+        """
+        Create a frame carrying several packets
+        :param codec: the codec of the recipients
+        :param packets: the encoded packets
+        :return: the framed data, as a list of buffers sharing the packets if vectored sends are supported
+        """
+        if len(packets) == 1:
+            buffers = [packets[0]]
         else:
-            return data
+            buffers = codec.encodeBatch(packets)
+        size = sum(len(buf) for buf in buffers)
+        buffers.insert(0, frameHeader(size))
+        if HAS_SENDMSG:
+            return buffers
+        return b''.join(buffers)
+
+    def send(self, sock, packet):
+        """
+        Queue a packet to be sent through a socket
+        :param sock: the socket through which data is to be sent
+        :param packet: the packet to be sent
+        :return: None
+        """
+        connection = self.connections.get(sock)
+        if connection is not None:
+            # pack length of data along with it
+            connection.write(frame(connection.codec.encode(packet)))
+
+    def resyncData(self, codec):
+        """
+        Create the framed message resynchronizing a client that fell too far behind
+        :param codec: the codec of the client
+        :return: the framed message carrying the whole document and all cursors
+        """
+        d = {
+            'type': 'message',
+            'data': {
+                'message_type': 'resync',
+                'buffer': self.buffer.getLines(),
+                'users': self.clientManager.allClientsToDict(),
+                'revision': self.history.revision
+            }
+        }
+        return frame(codec.encode(d))
+
+    def backpressureData(self, codec, backedUp):
+        """
+        Create the framed message telling a client whether the server is queuing too much for it
+        :param codec: the codec of the client
+        :param backedUp: whether the queue of the client passed QUEUE_SOFT_LIMIT
+        :return: the framed message
+        """
+        d = {
+            'type': 'message',
+            'data': {
+                'message_type': 'backpressure',
+                'backed_up': backedUp
+            }
+        }
+        return frame(codec.encode(d))
 
-    def __cleanData(self, data):
+    def syncChunkData(self, codec, start, lines):
         """
-        Preprocess received data to remove unnecessary characters
-        :param data: the data to be cleaned
-        :return: the cleaned data
+        Create the framed message carrying a chunk of the document to a joining client
+        :param codec: the codec of the client
+        :param start: the index of the first line of the chunk
+        :param lines: the lines of the chunk
+        :return: the framed message
         """
-        dirtyData = data.find("}{")
-        if dirtyData > -1:
-            data = data[:dirtyData + 1]
-        return data
+        d = {
+            'type': 'message',
+            'data': {
+                'message_type': 'sync_chunk',
+                'start': start,
+                'chunk': lines
+            }
+        }
+        return frame(codec.encode(d))
 
-    def processData(self, data_string):
+    def processData(self, data_string, connection):
         """
         Process the received data and take actions
         :param data_string: the raw unprocessed data received
+        :param connection: the connection of the sending client
         :return: None
         """
-        data_string = self.__cleanData(data_string)
-        packet = self.__toUtf8(json.loads(data_string))
+        packet = connection.codec.decode(data_string)
 
         data = packet['data']
+        client = connection.client
         updateSelf = False
+        data['updated_cursors'] = []
 
         if 'cursor' in data.keys():
             # cursor update from the client
-            client = self.clientManager.getClientByName(data['name'])
-            client.updateCursor(data['cursor']['x'], data['cursor']['y'])
-            packet['data']['updated_cursors'] = [client.toDict()]
+            self.clientManager.moveCursor(client, data['cursor']['x'], data['cursor']['y'])
+            data['updated_cursors'].append(client.toDict())
             del packet['data']['cursor']
 
         if 'buffer' in data.keys():
-            # buffer update from the client
-            b_data = data['buffer']
-            self.buffer = self.buffer[:b_data['start']] \
-                                    + b_data['buffer'] \
-                                    + self.buffer[b_data['end'] - b_data['change_y'] + 1:]
-            # update all clients' cursors based on the new buffer
-            packet['data']['updated_cursors'] += self.clientManager.updateCursors(b_data, client)
-            updateSelf = True
-        self.broadcastData(client.name, json.dumps(packet), updateSelf)
+            # line range update from an older client
+            b_data = data.pop('buffer')
+            data['ops'] = opsFromSplice(b_data['start'], b_data['end'] - b_data['change_y'] + 1, b_data['buffer'])
+
+        if 'ops' in data.keys() and connection.resyncRevision is not None and data.get('revision') is not None:
+            if data['revision'] < connection.resyncRevision:
+                # sent before the client applied its resync, which drops its unacknowledged edits: committing them
+                # would leave the client without them for good
+                del data['ops']
+            else:
+                connection.resyncRevision = None
+
+        if 'ops' in data.keys():
+            # edit operations from the client, based on the revision it had when making them
+            ops = self.history.commit(data['ops'], data.get('revision'), client.name)
+            if ops is None:
+                self.logMessage('Client ' + client.name + ' sent edits based on an unknown revision, resynchronizing')
+                del data['ops']
+                self.metrics.resyncs.inc(1, ('unknown_revision',))
+                connection.resyncRevision = self.history.revision
+                connection.write(self.resyncData(connection.codec))
+            else:
+                applyOps(self.buffer, ops)
+                data['ops'] = ops
+                data['revision'] = self.history.revision
+                if self.log is not None:
+                    self.log.append(self.history.revision, ops)
+                    if self.history.revision - self.log.snapshotRevision >= SNAPSHOT_INTERVAL:
+                        self.log.snapshot(self.history.revision, self.buffer.getLines())
+                # update all clients' cursors based on the operations
+                data['updated_cursors'] += self.clientManager.updateCursors(ops, client)
+                # the sender gets its operations back as the acknowledgement of the revision
+                updateSelf = True
+        self.broadcastData(client.name, packet, updateSelf, not updateSelf)
+
+
+def _frameSize(data):
+    """
+    Get the size of framed data
+    :param data: a string or a list of buffers
+    :return: the number of bytes
+    """
+    if isinstance(data, list):
+        return sum(len(buf) for buf in data)
+    return len(data)
+
+
+def _remainingBuffers(buffers, offset):
+    """
+    Get the buffers left to send after offset bytes have been sent
+    :param buffers: the list of buffers
+    :param offset: the number of bytes already sent
+    :return: the list of remaining buffers, at most MAX_IOVEC of them
+    """
+    for i, buf in enumerate(buffers):
+        if offset < len(buf):
+            remaining = buffers[i:i + MAX_IOVEC]
+            if offset:
+                remaining[0] = memoryview(buf)[offset:]
+            return remaining
+        offset -= len(buf)
+    return []
+
+
+class Connection:
+    """
+    A client connection with its own non-blocking framing state and bounded send queue
+    """
+    __slots__ = 'document', 'sock', 'client', 'codec', 'features', 'reader', 'sendQueue', 'sendOffset', \
+                'queuedBytes', 'pendingCursors', 'resyncEntry', 'resyncRevision', 'syncLines', 'syncPosition', \
+                'syncScheduled', 'backedUp', 'wantWrite', 'closed'
+
+    def __init__(self, document, sock):
+        """
+        Initializer
+        :param document: the document the client edits
+        :param sock: the non-blocking client socket
+        """
+        self.document = document
+        self.sock = sock
+        # The client, known once its name has been received
+        self.client = None
+        # The codec negotiated with the client
+        self.codec = document.codecs[JSON]
+        # The optional features announced by the client
+        self.features = []
+        # Reads the frames sent by the client
+        self.reader = FrameReader()
+        # Queue of [framed data, cursor key, size] entries waiting to be sent, data is None for dropped entries.
+        # The data is either a string or a list of buffers to be sent with a single vectored send.
+        self.sendQueue = deque()
+        # Number of bytes of the first queued entry already sent
+        self.sendOffset = 0
+        # Number of queued bytes, not counting a pending resync
+        self.queuedBytes = 0
+        # Dictionary mapping client names to their queued cursor-only entry
+        self.pendingCursors = {}
+        # The queued resync entry, if any
+        self.resyncEntry = None
+        # Revision of the last resync sent, until the client sends edits based on it, None otherwise
+        self.resyncRevision = None
+        # The document snapshot being streamed to the client and the index of its next line to be sent
+        self.syncLines = None
+        self.syncPosition = 0
+        self.syncScheduled = False
+        # Whether the client was told that its queue passed QUEUE_SOFT_LIMIT
+        self.backedUp = False
+        self.wantWrite = False
+        self.closed = False
+
+    def onReadable(self):
+        """
+        Read everything available on the socket and handle the complete frames
+        :return: None
+        """
+        while not self.closed:
+            try:
+                received = self.reader.readFrom(self.sock)
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] not in WOULD_BLOCK:
+                    self.document.logMessage('Socket error occurred when receiving: ' + str(e))
+                    self.document.metrics.socketError('receive', e)
+                    self.document.closeConnection(self)
+                return
+            if not received:
+                # EOF received
+                self.document.closeConnection(self)
+                return
+            self.document.metrics.bytesReceived.inc(received)
+            self.__dispatchFrames()
+
+    def feed(self, data):
+        """
+        Handle bytes of the connection received by someone else
+        :param data: the received bytes
+        :return: None
+        """
+        self.reader.feed(data)
+        self.__dispatchFrames()
+
+    def __dispatchFrames(self):
+        """
+        Hand the complete frames received to the document
+        :return: None
+        """
+        for data in self.reader.frames():
+            if self.closed:
+                break
+            try:
+                self.document.onFrame(self, data)
+            except MALFORMED_FRAME_ERRORS as e:
+                self.document.logMessage('Client ' + self.client.name + ' sent a malformed frame, disconnecting: ' + repr(e))
+                self.document.metrics.malformedFrames.inc(1, ('packet',))
+                self.document.closeConnection(self)
+                break
+
+    def write(self, data, key=None):
+        """
+        Queue framed data and send as much as the socket accepts without blocking
+        :param data: the framed data to be sent
+        :param key: the names of the clients whose cursors the data carries if it is cursor-only, None otherwise.
+                    A cursor-only frame supersedes the queued one of the same clients.
+        :return: None
+        """
+        if self.closed:
+            return
+        if key is not None:
+            if self.queuedBytes > QUEUE_SOFT_LIMIT:
+                # too far behind, the cursor would be stale by the time it is sent
+                return
+            stale = self.pendingCursors.pop(key, None)
+            if stale is not None:
+                self.__drop(stale)
+        entry = [data, key, _frameSize(data)]
+        self.document.metrics.framesSent.inc()
+        self.sendQueue.append(entry)
+        self.queuedBytes += entry[2]
+        if key is not None:
+            self.pendingCursors[key] = entry
+
+        if self.queuedBytes > QUEUE_HARD_LIMIT:
+            self.__resync()
+        elif self.queuedBytes > QUEUE_SOFT_LIMIT:
+            for stale in self.pendingCursors.values():
+                self.__drop(stale)
+            self.pendingCursors.clear()
+            self.__signalBackpressure(True)
+        self.__flush()
+
+    def __signalBackpressure(self, backedUp):
+        """
+        Tell the client whether its queue is backed up, ahead of the queued frames so that it learns it right away
+        :param backedUp: whether the queue passed QUEUE_SOFT_LIMIT
+        :return: None
+        """
+        if backedUp == self.backedUp or BACKPRESSURE not in self.features:
+            return
+        self.backedUp = backedUp
+        data = self.document.backpressureData(self.codec, backedUp)
+        entry = [data, None, len(data)]
+        self.document.metrics.framesSent.inc()
+        # after the partially sent entry, if any, so that the framing stays intact
+        head = self.sendQueue.popleft() if self.sendOffset else None
+        self.sendQueue.appendleft(entry)
+        if head is not None:
+            self.sendQueue.appendleft(head)
+        self.queuedBytes += entry[2]
+
+    def __drop(self, entry):
+        """
+        Drop a queued entry unless it is partially sent
+        :param entry: the queued entry
+        :return: None
+        """
+        if entry[0] is not None and not (self.sendOffset and entry is self.sendQueue[0]):
+            self.queuedBytes -= entry[2]
+            entry[0] = None
+
+    def __resync(self):
+        """
+        Replace everything queued by a snapshot of the document, or disconnect the client if a snapshot is
+        already on its way
+        :return: None
+        """
+        if self.resyncEntry is not None:
+            self.document.logMessage('Client ' + self.client.name + ' is too far behind, disconnecting')
+            self.document.metrics.resyncs.inc(1, ('slow_client_disconnected',))
+            self.__closeLater()
+            return
+        # keep the partially sent entry, if any, so that the framing stays intact
+        head = self.sendQueue[0] if self.sendOffset else None
+        self.sendQueue.clear()
+        self.pendingCursors.clear()
+        self.queuedBytes = 0
+        if head is not None:
+            self.sendQueue.append(head)
+            self.queuedBytes = head[2]
+        self.document.logMessage('Client ' + self.client.name + ' is too far behind, resynchronizing')
+        self.document.metrics.resyncs.inc(1, ('slow_client',))
+        # the resync carries the whole document
+        self.syncLines = None
+        self.resyncRevision = self.document.history.revision
+        data = self.document.resyncData(self.codec)
+        self.resyncEntry = [data, None, len(data)]
+        self.sendQueue.append(self.resyncEntry)
+
+    def __flush(self):
+        """
+        Send queued entries until the queue is empty or the socket would block
+        :return: None
+        """
+        queue = self.sendQueue
+        while queue and not self.closed:
+            entry = queue[0]
+            data = entry[0]
+            if data is not None:
+                try:
+                    if isinstance(data, list):
+                        sent = self.sock.sendmsg(_remainingBuffers(data, self.sendOffset))
+                    else:
+                        sent = self.sock.send(memoryview(data)[self.sendOffset:])
+                except socket.error as e:
+                    if e.args[0] == errno.EINTR:
+                        continue
+                    if e.args[0] not in WOULD_BLOCK:
+                        self.document.logMessage('Socket error occurred when sending: ' + str(e))
+                        self.document.metrics.socketError('send', e)
+                        self.__closeLater()
+                        return
+                    break
+                self.document.metrics.bytesSent.inc(sent)
+                self.sendOffset += sent
+                if self.sendOffset < entry[2]:
+                    break
+                if entry is self.resyncEntry:
+                    self.resyncEntry = None
+                else:
+                    self.queuedBytes -= entry[2]
+                if entry[1] is not None and self.pendingCursors.get(entry[1]) is entry:
+                    del self.pendingCursors[entry[1]]
+                if self.backedUp and self.queuedBytes <= QUEUE_SOFT_LIMIT // 2:
+                    self.__signalBackpressure(False)
+            queue.popleft()
+            self.sendOffset = 0
+
+        # the next chunk of the document is sent once everything else went out, from the next loop iteration
+        if self.syncLines is not None and not queue and not self.syncScheduled and not self.closed:
+            self.syncScheduled = True
+            self.document.eventLoop.callLater(0, self.__continueSync)
+
+        # only watch for writability while there is something left to send
+        wantWrite = bool(queue) and not self.closed
+        if wantWrite != self.wantWrite and not self.closed:
+            self.wantWrite = wantWrite
+            self.document.eventLoop.modify(self.sock, READ | WRITE if wantWrite else READ)
+
+    def startSync(self, lines):
+        """
+        Stream a snapshot of the document in bounded chunks, so that encoding it never blocks the event loop for
+        long and live updates are not held behind it
+        :param lines: the lines of the document
+        :return: None
+        """
+        self.syncLines = lines
+        self.syncPosition = 0
+        self.__continueSync()
+
+    def __continueSync(self):
+        """
+        Queue the next chunk of the document being streamed
+        :return: None
+        """
+        self.syncScheduled = False
+        lines = self.syncLines
+        if lines is None or self.closed:
+            return
+        start = end = self.syncPosition
+        size = 0
+        while end < len(lines) and size < SYNC_CHUNK_SIZE:
+            size += len(lines[end]) + 1
+            end += 1
+        self.syncPosition = end
+        if end >= len(lines):
+            self.syncLines = None
+        self.write(self.document.syncChunkData(self.codec, start, lines[start:end]))
+
+    def onWritable(self):
+        """
+        Send as much of the queue as the socket accepts
+        :return: None
+        """
+        self.__flush()
+
+    def __closeLater(self):
+        """
+        Close the connection from the event loop, as sending may happen while the document iterates over its clients
+        :return: None
+        """
+        self.sendQueue.clear()
+        self.closed = True
+        self.document.eventLoop.callLater(0, lambda: self.document.closeConnection(self, True))
 
 
 class Cursor:
@@ -284,7 +870,7 @@ class Client:
     """
     The client
     """
-    __slots__ = 'name', 'sock', 'cursor'
+    __slots__ = 'name', 'sock', 'cursor', 'sessionId'
 
     def __init__(self, name, sock):
         """
@@ -295,16 +881,22 @@ class Client:
         self.name = name
         self.sock = sock
         self.cursor = Cursor()
+        # Integer id standing for the name in compact packets, assigned by the client manager
+        self.sessionId = None
 
-    def toDict(self):
+    def toDict(self, withSession=False):
         """
         Convert to a dictionary
+        :param withSession: whether to include the session id, when introducing the client
         :return: a dictionary containing the client information
         """
-        return {
+        d = {
             'name': self.name,
             'cursor': self.cursor.toDict()
         }
+        if withSession:
+            d['id'] = self.sessionId
+        return d
 
     def updateCursor(self, x, y):
         """
@@ -317,11 +909,91 @@ class Client:
         self.cursor.y = y
 
 
+class CursorTable:
+    """
+    The clients' cursors ordered by line, in parallel arrays, so that an edit only visits the cursors at or below
+    the edited line
+    """
+    __slots__ = 'lines', 'cols', 'clients'
+
+    def __init__(self):
+        """
+        Initializer
+        """
+        # 0-based lines of the cursors, in increasing order
+        self.lines = array('i')
+        # Columns of the cursors
+        self.cols = array('i')
+        # Clients owning the cursors
+        self.clients = []
+
+    def add(self, client):
+        """
+        Insert a client's cursor at its position
+        :param client: the client
+        :return: None
+        """
+        line = client.cursor.y - 1
+        i = bisect_right(self.lines, line)
+        self.lines.insert(i, line)
+        self.cols.insert(i, client.cursor.x)
+        self.clients.insert(i, client)
+
+    def remove(self, client):
+        """
+        Remove a client's cursor
+        :param client: the client
+        :return: None
+        """
+        line = client.cursor.y - 1
+        i = bisect_left(self.lines, line)
+        while i < len(self.clients) and self.clients[i] is not client:
+            i += 1
+        if i < len(self.clients):
+            del self.lines[i]
+            del self.cols[i]
+            del self.clients[i]
+
+    def applyOps(self, ops):
+        """
+        Move the cursors according to edit operations
+        :param ops: the list of operations
+        :return: the list of clients whose cursor moved
+        """
+        lines = self.lines
+        cols = self.cols
+        touched = set()
+        for op in ops:
+            # line operations move the cursors below them, text operations those on their line
+            start = bisect_left(lines, op[1])
+            if op[0] == INSERT_LINES or op[0] == DELETE_LINES:
+                end = len(lines)
+            else:
+                end = bisect_right(lines, op[1], start)
+            for i in range(start, end):
+                line, col = transformPosition(lines[i], cols[i], op)
+                if line != lines[i] or col != cols[i]:
+                    # shifting every cursor below an edit keeps the lines in order
+                    lines[i] = line
+                    cols[i] = col
+                    touched.add(i)
+
+        moved = []
+        for i in sorted(touched):
+            client = self.clients[i]
+            cols[i] = x = max(1, cols[i])
+            y = lines[i] + 1
+            if x != client.cursor.x or y != client.cursor.y:
+                client.updateCursor(x, y)
+                moved.append(client)
+        return moved
+
+
 class ClientManager:
     """
     The client manager
     """
-    __slots__ = 'clientsByName', 'clientsBySock'
+    __slots__ = 'clientsByName', 'clientsBySock', 'cursors', 'nextSessionId'
 
     def __init__(self, server):
         """
@@ -331,6 +1003,9 @@ class ClientManager:
         self.clientsBySock = {}
         # Dictionary mapping clients by their names
         self.clientsByName = {}
+        # Cursors of the clients ordered by line
+        self.cursors = CursorTable()
+        self.nextSessionId = 1
 
     def isEmpty(self):
         """
@@ -390,54 +1065,515 @@ class ClientManager:
         :param client: the new client
         :return: None
         """
+        client.sessionId = self.nextSessionId
+        self.nextSessionId += 1
         self.clientsByName[client.name] = client
         self.clientsBySock[client.sock] = client
+        self.cursors.add(client)
 
     def removeClient(self, client):
         """
         Removes the client from the list of connected clients
-        :param client: the new client
-        :return: None
+        :param client: the client to be removed
+        :return: True if the client was connected, False if it was not or another client took its name since
         """
-        if self.clientsByName.get(client.name):
-            del self.clientsByName[client.name]
-            del self.clientsBySock[client.sock]
+        if self.clientsBySock.get(client.sock) is not client:
+            return False
+        del self.clientsBySock[client.sock]
+        self.cursors.remove(client)
+        if self.clientsByName.get(client.name) is not client:
+            return False
+        del self.clientsByName[client.name]
+        return True
 
     def allClientsToDict(self):
         """
         Convert all client information to a list of dictionary data
         :return: the list of clients converted to dictionary form
         """
-        return [client.toDict() for client in self.clientsByName.values()]
-
-    def updateCursors(self, data, c):
-        """
-        Update all client cursors according to the received buffer information
-        :param data: the received data
-        :param c: the client from which the data was received
-        :return: the updated list of client information
-        """
-        result = []
-        y_target = c.cursor.y
-        x_target = c.cursor.x
-
-        for client in self.clientsByName.values():
-            updated = False
-            if client != c:
-                if client.cursor.y > y_target:
-                    client.cursor.y += data['change_y']
-                    updated = True
-                if client.cursor.y == y_target and client.cursor.x > x_target:
-                    client.cursor.x = max(1, client.cursor.x + data['change_x'])
-                    updated = True
-                if client.cursor.y == y_target - 1 and client.cursor.x > x_target and data['change_y'] == 1:
-                    client.cursor.y += 1
-                    client.cursor.x = max(1, client.cursor.x + data['change_x'])
-                    updated = True
-                if updated:
-                    result.append(client.toDict())
-        return result
+        return [client.toDict(True) for client in self.clientsByName.values()]
+
+    def moveCursor(self, client, x, y):
+        """
+        Move a client's cursor to the position it reported
+        :param client: the client
+        :param x: column number
+        :param y: row number
+        :return: None
+        """
+        self.cursors.remove(client)
+        client.updateCursor(x, y)
+        self.cursors.add(client)
+
+    def updateCursors(self, ops, c):
+        """
+        Update the other clients' cursors according to the received edit operations
+        :param ops: the received operations
+        :param c: the client from which the operations were received
+        :return: the list of information of the clients whose cursor moved
+        """
+        # the sender's cursor already accounts for its own operations
+        self.cursors.remove(c)
+        moved = self.cursors.applyOps(ops)
+        self.cursors.add(c)
+        return [client.toDict() for client in moved]
+
+
+class Worker:
+    """
+    Hosts the documents assigned to one process
+    """
+    __slots__ = 'documents', 'eventLoop', 'batchInterval', 'dataDirectory', 'onConnectionClosed', 'metrics', \
+                'profiler', 'logMessage'
+
+    def __init__(self, eventLoop, batchInterval=0, dataDirectory=None, onConnectionClosed=None, metrics=None,
+                 profiler=None, logMessage=None):
+        """
+        Initializer
+        :param eventLoop: the event loop of the process
+        :param batchInterval: the batching window of the documents, in seconds
+        :param dataDirectory: the data directory of the server, None to keep the documents in memory only
+        :param onConnectionClosed: called without arguments whenever a connection is closed
+        :param metrics: the metrics of the process
+        :param profiler: the profiler of the process
+        :param logMessage: called with each message of the documents, None to print them
+        """
+        # Dictionary mapping document names to the documents opened so far
+        self.documents = {}
+        self.eventLoop = eventLoop
+        self.batchInterval = batchInterval
+        self.dataDirectory = dataDirectory
+        self.onConnectionClosed = onConnectionClosed
+        self.logMessage = logMessage
+
+        self.profiler = profiler if profiler is not None else Profiler()
+
+        # the state of the documents is read when the metrics are collected
+        self.metrics = metrics if metrics is not None else ServerMetrics()
+        self.metrics.connectedClients.function = lambda: [((name,), len(document.connections))
+                                                          for name, document in self.documents.items()]
+        self.metrics.documentLines.function = lambda: [((name,), len(document.buffer))
+                                                       for name, document in self.documents.items()]
+        self.metrics.documentRevision.function = lambda: [((name,), document.history.revision)
+                                                          for name, document in self.documents.items()]
+        self.metrics.queuedBytes.function = lambda: [((name, connection.client.name), connection.queuedBytes)
+                                                     for name, document in self.documents.items()
+                                                     for connection in document.connections.values()
+                                                     if connection.client is not None]
+
+    def addConnection(self, sock, hello, pending=b''):
+        """
+        Hand a connection to the document named in its hello, opening the document if needed
+        :param sock: the non-blocking client socket
+        :param hello: the parsed hello of the client
+        :param pending: the bytes received after the hello
+        :return: None
+        """
+        name = hello['document']
+        document = self.documents.get(name)
+        if document is None:
+            directory = None
+            if self.dataDirectory is not None:
+                directory = documentDirectory(self.dataDirectory, name)
+            document = Document(name, self.eventLoop, self.batchInterval, directory, self.onConnectionClosed,
+                                self.metrics, self.profiler, self.logMessage)
+            self.documents[name] = document
+        document.addConnection(sock, hello, pending)
+
+    def close(self):
+        """
+        Persist and close all documents
+        :return: None
+        """
+        for document in self.documents.values():
+            document.close()
+
+
+def runWorker(pipe, batchInterval, dataDirectory, index=0, pushMetrics=False, profilePath=None, profileSample=1):
+    """
+    Main function of a worker process. Connections are received through the pipe, as a (hello, pending bytes, socket
+    family) message followed by the socket's file descriptor, until a None message. A ('profile', enabled) message
+    starts or stops profiling. A 'closed' message is sent back whenever a connection is closed.
+    :param pipe: the worker's end of the pipe to the acceptor
+    :param batchInterval: the batching window of the documents, in seconds
+    :param dataDirectory: the data directory of the server, None to keep the documents in memory only
+    :param index: the index of the worker, labelling its metrics
+    :param pushMetrics: whether to send the metrics of the worker to the acceptor periodically, as a
+                        ('metrics', families) message
+    :param profilePath: the file the profile of the worker is written to, profiling from the start if not None
+    :param profileSample: run one call in this many of each stage under cProfile
+    :return: None
+    """
+    # profiling is toggled by the acceptor, the signal may be sent to the whole process group
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    eventLoop = EventLoop()
+    metrics = ServerMetrics()
+    profiler = Profiler()
+    if profilePath is not None:
+        profiler.start(profileSample)
+    else:
+        profilePath = _defaultProfilePath()
+    profilePath += '.worker' + str(index)
+    worker = Worker(eventLoop, batchInterval, dataDirectory, lambda: pipe.send('closed'), metrics, profiler)
+
+    def push():
+        pipe.send(('metrics', metrics.collect([('worker', str(index))])))
+        eventLoop.callLater(PUSH_INTERVAL, push)
+
+    if pushMetrics:
+        push()
+
+    def onReadable():
+        # the pipe is watched edge-triggered, so every queued message is handled
+        while pipe.poll():
+            message = pipe.recv()
+            if message is None:
+                eventLoop.stop()
+                return
+            if message[0] == 'profile':
+                if message[1]:
+                    profiler.start(profileSample)
+                else:
+                    profiler.stop(profilePath)
+                continue
+            hello, pending, family = message
+            fd = recv_handle(pipe)
+            sock = socket.fromfd(fd, family, socket.SOCK_STREAM)
+            os.close(fd)
+            sock.setblocking(False)
+            worker.addConnection(sock, hello, pending)
+
+    eventLoop.register(pipe, onReadable)
+    try:
+        eventLoop.run()
+    except KeyboardInterrupt:
+        pass
+    worker.close()
+    profiler.stop(profilePath)
+
+
+def _defaultProfilePath():
+    """
+    Get the file the profile of the server is written to when no path was given
+    :return: the path, in the temporary directory
+    """
+    return os.path.join(tempfile.gettempdir(), 'teameditor-server-' + str(os.getpid()) + '.prof')
+
+
+class Handshake:
+    """
+    A connection whose hello has not been received yet
+    """
+    __slots__ = 'server', 'sock', 'reader'
+
+    def __init__(self, server, sock):
+        """
+        Initializer
+        :param server: the server which accepted the connection
+        :param sock: the non-blocking client socket
+        """
+        self.server = server
+        self.sock = sock
+        self.reader = FrameReader(MIN_READ_SIZE)
+
+    def onReadable(self):
+        """
+        Receive until the hello is complete, then hand the connection to its document
+        :return: None
+        """
+        while True:
+            try:
+                received = self.reader.readFrom(self.sock)
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] in WOULD_BLOCK:
+                    return
+                self.server.metrics.socketError('receive', e)
+                received = 0
+            if not received:
+                self.server.closeHandshake(self)
+                return
+            self.server.metrics.bytesReceived.inc(received)
+            for data in self.reader.frames():
+                try:
+                    hello = parseHello(data)
+                except MALFORMED_FRAME_ERRORS as e:
+                    self.server.logMessage('Received a malformed hello, disconnecting: ' + repr(e))
+                    self.server.metrics.malformedFrames.inc(1, ('hello',))
+                    self.server.closeHandshake(self)
+                    return
+                # the frames sent right after the hello go along with it
+                pending = bytes(self.reader.buffer[self.reader.start:self.reader.end])
+                self.server.route(self, hello, pending)
+                return
+
+
+class EditorServer:
+    """
+    The server of the collaborative text editor. It accepts the connections and routes each of them to the process
+    hosting the document named in its hello, documents being spread over the worker processes by a hash of their
+    name. Without worker processes, the documents are hosted by the server process itself.
+    """
+    __slots__ = 'eventLoop', 'handshakes', 'connectionCount', 'workers', 'localWorker', 'metrics', 'workerMetrics', \
+                'statsEndpoint', 'profiler', 'profilePath', 'profileSample', 'listenAddresses', 'logMessage'
+
+    def __init__(self, port, batchInterval=0, dataDirectory=None, workers=0, statsPort=None, profilePath=None,
+                 profileSample=1, unixPath=None, ready=None, clientSockets=(), logMessage=None):
+        """
+        Initializer
+        :param port: the port on which the server listens for incoming connection requests
+        :param batchInterval: the time in seconds during which broadcasts are accumulated and sent as one frame
+                              per client, 0 to send every broadcast immediately
+        :param dataDirectory: the directory where the documents are persisted and recovered from, None to keep them
+                              in memory only
+        :param workers: the number of worker processes hosting the documents, 0 to host them in this process
+        :param statsPort: the local port on which the metrics are served over HTTP, None not to serve them
+        :param profilePath: the file the profile is written to, profiling from the start if not None. Profiling is
+                            toggled by SIGUSR1, worker processes writing theirs to the same path suffixed with
+                            .worker<index>.
+        :param profileSample: run one call in this many of each stage under cProfile
+        :param unixPath: the path of a Unix domain socket the server also listens on, such as for the host's own
+                         client, None not to listen on one
+        :param ready: called without arguments once the server listens, before it accepts clients
+        :param clientSockets: sockets of clients already connected, such as the server's end of a socket pair
+        :param logMessage: called with each message of the server process, None to print them. Worker processes
+                           print theirs.
+        """
+        # Dispatches socket events
+        self.eventLoop = EventLoop()
+        self.logMessage = logMessage if logMessage is not None else printMessage
+
+        # Metrics of this process and the last ones sent by each worker process
+        self.metrics = ServerMetrics()
+        self.workerMetrics = [[] for i in range(workers)]
+
+        self.profiler = Profiler()
+        self.profilePath = profilePath if profilePath is not None else _defaultProfilePath()
+        self.profileSample = profileSample
+        if profilePath is not None:
+            self.profiler.start(profileSample)
+
+        # Dictionary mapping the sockets which did not send their hello yet to their handshake
+        self.handshakes = {}
+        # Number of open connections, including the ones handed to workers
+        self.connectionCount = 0
+
+        # Worker processes as (process, pipe) entries, started before binding so that they do not inherit the
+        # listening socket
+        self.workers = []
+        self.localWorker = None
+        for i in range(workers):
+            pipe, childPipe = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=runWorker, args=(childPipe, batchInterval, dataDirectory, i,
+                                                                      statsPort is not None, profilePath,
+                                                                      profileSample))
+            process.daemon = True
+            process.start()
+            childPipe.close()
+            self.workers.append((process, pipe))
+            self.eventLoop.register(pipe, lambda i=i: self.__onWorkerMessage(i))
+        if not workers:
+            self.localWorker = Worker(self.eventLoop, batchInterval, dataDirectory, self.onConnectionClosed,
+                                      self.metrics, self.profiler, self.logMessage)
+        try:
+            # the handler only schedules the toggle, which runs from the event loop
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.eventLoop.callLater(0, self.toggleProfiling))
+        except (AttributeError, ValueError):
+            # no SIGUSR1 on this platform, or not running in the main thread
+            pass
+
+        self.statsEndpoint = None
+        if statsPort is not None:
+            self.statsEndpoint = StatsEndpoint(self.eventLoop, statsPort, self.renderMetrics)
+
+        # Bind to server port, and to the Unix domain socket if any, and listen
+        self.listenAddresses = [("", port)]
+        if unixPath is not None:
+            self.listenAddresses.append(unixPath)
+        listenSockets = []
+        try:
+            for address in self.listenAddresses:
+                listenSockets.append(listen(address))
+        except socket.error:
+            for listenSocket in listenSockets:
+                listenSocket.close()
+            raise
+
+        for clientSocket in clientSockets:
+            self.__addClient(clientSocket)
+
+        if ready is not None:
+            ready()
+
+        # Start accepting clients
+        self.acceptClients(listenSockets)
+
+    def acceptClients(self, listenSockets):
+        """
+        Accepts clients and handles their messages until all clients have disconnected
+        :param listenSockets: the sockets on server to listen for connection requests
+        :return: None
+        """
+        for listenSocket in listenSockets:
+            self.eventLoop.register(listenSocket, lambda listenSocket=listenSocket: self.__accept(listenSocket))
+        self.eventLoop.run()
+        for listenSocket, address in zip(listenSockets, self.listenAddresses):
+            self.eventLoop.unregister(listenSocket)
+            listenSocket.close()
+            transportFor(address).remove(address)
+        if self.statsEndpoint is not None:
+            self.statsEndpoint.close()
+        if self.localWorker is not None:
+            self.localWorker.close()
+        if self.profiler.enabled:
+            self.profiler.stop(self.profilePath)
+            self.logMessage('Profile written to ' + self.profilePath)
+        for process, pipe in self.workers:
+            pipe.send(None)
+        for process, pipe in self.workers:
+            process.join()
+            pipe.close()
+
+    def __accept(self, listenSocket):
+        """
+        Accept all pending connection requests
+        :param listenSocket: the socket on server to listen for connection requests
+        :return: None
+        """
+        while True:
+            try:
+                clientSocket, addr = listenSocket.accept()
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] not in WOULD_BLOCK:
+                    self.logMessage('Socket error occurred when accepting: ' + str(e))
+                    self.metrics.socketError('accept', e)
+                return
+            self.__addClient(clientSocket)
+
+    def __addClient(self, clientSocket):
+        """
+        Wait for the hello of a new connection
+        :param clientSocket: the connected socket
+        :return: None
+        """
+        self.metrics.connectionsAccepted.inc()
+        clientSocket.setblocking(False)
+        transportOf(clientSocket).configure(clientSocket)
+        handshake = Handshake(self, clientSocket)
+        self.handshakes[clientSocket] = handshake
+        self.connectionCount += 1
+        self.eventLoop.register(clientSocket, handshake.onReadable)
+
+    def route(self, handshake, hello, pending):
+        """
+        Hand a connection whose hello was received to the process hosting its document
+        :param handshake: the handshake of the connection
+        :param hello: the parsed hello
+        :param pending: the bytes received after the hello
+        :return: None
+        """
+        sock = handshake.sock
+        self.eventLoop.unregister(sock)
+        del self.handshakes[sock]
+        if self.localWorker is not None:
+            self.localWorker.addConnection(sock, hello, pending)
+            return
+        name = hello['document']
+        key = name.encode('utf-8') if not isinstance(name, bytes) else name
+        process, pipe = self.workers[(zlib.crc32(key) & 0xffffffff) % len(self.workers)]
+        pipe.send((hello, pending, sock.family))
+        send_handle(pipe, sock.fileno(), process.pid)
+        sock.close()
+
+    def closeHandshake(self, handshake):
+        """
+        Close a connection which did not send its hello
+        :param handshake: the handshake of the connection
+        :return: None
+        """
+        self.eventLoop.unregister(handshake.sock)
+        del self.handshakes[handshake.sock]
+        handshake.sock.close()
+        self.onConnectionClosed()
+
+    def onConnectionClosed(self):
+        """
+        Count a closed connection, stopping the server once all clients have disconnected
+        :return: None
+        """
+        self.connectionCount -= 1
+        if not self.connectionCount:
+            self.eventLoop.stop()
+
+    def __onWorkerMessage(self, index):
+        """
+        Handle the messages of a worker process
+        :param index: the index of the worker
+        :return: None
+        """
+        pipe = self.workers[index][1]
+        while pipe.poll():
+            message = pipe.recv()
+            if message == 'closed':
+                self.onConnectionClosed()
+            elif message[0] == 'metrics':
+                self.workerMetrics[index] = message[1]
+
+    def toggleProfiling(self):
+        """
+        Start profiling this process and the workers, or stop and write the profiles
+        :return: None
+        """
+        enabled = not self.profiler.enabled
+        if enabled:
+            self.profiler.start(self.profileSample)
+            self.logMessage('Profiling started')
+        else:
+            self.profiler.stop(self.profilePath)
+            self.logMessage('Profile written to ' + self.profilePath)
+        for process, pipe in self.workers:
+            pipe.send(('profile', enabled))
+
+    def renderMetrics(self):
+        """
+        Get the metrics of this process and of the workers in the Prometheus text format
+        :return: the text
+        """
+        families = self.metrics.collect()
+        for workerFamilies in self.workerMetrics:
+            families.extend(workerFamilies)
+        return renderFamilies(families)
 
 
 if __name__ == "__main__":
-    EditorServer(int(sys.argv[1]))
+    parser = argparse.ArgumentParser(description='Server of the collaborative text editor')
+    parser.add_argument('port', type=int, help='the port on which the server listens')
+    parser.add_argument('--batch-ms', type=float, default=0,
+                        help='send the updates received during this many milliseconds as one frame per client')
+    parser.add_argument('--data-dir', default=None,
+                        help='persist the documents in this directory and recover them on start')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='host the documents in this many worker processes instead of the server process')
+    parser.add_argument('--stats-port', type=int, default=None,
+                        help='serve the metrics in the Prometheus text format over HTTP on this local port')
+    parser.add_argument('--profile', default=None, metavar='PATH',
+                        help='profile from the start and write the profile to this file, profiling can also be '
+                             'toggled with SIGUSR1')
+    parser.add_argument('--profile-sample', type=int, default=1,
+                        help='run one call in this many of each profiled stage under cProfile')
+    parser.add_argument('--unix', default=None, metavar='PATH',
+                        help='also listen on a Unix domain socket at this path')
+    parser.add_argument('--ready-fd', type=int, default=None, metavar='FD',
+                        help='write a line to this file descriptor and close it once listening')
+    args = parser.parse_args()
+
+    def ready():
+        os.write(args.ready_fd, b'ready\n')
+        os.close(args.ready_fd)
+
+    EditorServer(args.port, args.batch_ms / 1000.0, args.data_dir, args.workers, args.stats_port, args.profile,
+                 args.profile_sample, args.unix, ready if args.ready_fd is not None else None)
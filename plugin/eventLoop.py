@@ -0,0 +1,249 @@
+import errno
+import heapq
+import select
+import time
+
+try:
+    import selectors
+except ImportError:
+    # python 2 without the selectors backport
+    selectors = None
+
+# Event masks
+READ = 1
+WRITE = 2
+
+# errno values meaning that a non-blocking operation would have blocked
+WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+
+
+class _EpollBackend(object):
+    """
+    Edge-triggered epoll backend. Readiness is only reported on state changes, so handlers must
+    read until the socket would block.
+    """
+    __slots__ = 'epoll'
+
+    def __init__(self):
+        self.epoll = select.epoll()
+
+    def __mask(self, events):
+        mask = select.EPOLLET
+        if hasattr(select, 'EPOLLRDHUP'):
+            mask |= select.EPOLLRDHUP
+        if events & READ:
+            mask |= select.EPOLLIN
+        if events & WRITE:
+            mask |= select.EPOLLOUT
+        return mask
+
+    def register(self, fd, events):
+        self.epoll.register(fd, self.__mask(events))
+
+    def modify(self, fd, events):
+        self.epoll.modify(fd, self.__mask(events))
+
+    def unregister(self, fd):
+        self.epoll.unregister(fd)
+
+    def poll(self, timeout):
+        result = []
+        for fd, mask in self.epoll.poll(-1 if timeout is None else timeout):
+            events = 0
+            if mask & (select.EPOLLIN | select.EPOLLHUP | select.EPOLLERR):
+                events |= READ
+            if mask & select.EPOLLOUT:
+                events |= WRITE
+            if hasattr(select, 'EPOLLRDHUP') and mask & select.EPOLLRDHUP:
+                events |= READ
+            result.append((fd, events))
+        return result
+
+
+class _SelectorsBackend(object):
+    """
+    Level-triggered backend on top of the selectors module
+    """
+    __slots__ = 'selector'
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+
+    def __mask(self, events):
+        mask = 0
+        if events & READ:
+            mask |= selectors.EVENT_READ
+        if events & WRITE:
+            mask |= selectors.EVENT_WRITE
+        return mask
+
+    def register(self, fd, events):
+        self.selector.register(fd, self.__mask(events))
+
+    def modify(self, fd, events):
+        self.selector.modify(fd, self.__mask(events))
+
+    def unregister(self, fd):
+        self.selector.unregister(fd)
+
+    def poll(self, timeout):
+        result = []
+        for key, mask in self.selector.select(timeout):
+            events = 0
+            if mask & selectors.EVENT_READ:
+                events |= READ
+            if mask & selectors.EVENT_WRITE:
+                events |= WRITE
+            result.append((key.fd, events))
+        return result
+
+
+class _SelectBackend(object):
+    """
+    Level-triggered fallback backend on top of select.select
+    """
+    __slots__ = 'events'
+
+    def __init__(self):
+        self.events = {}
+
+    def register(self, fd, events):
+        self.events[fd] = events
+
+    def modify(self, fd, events):
+        self.events[fd] = events
+
+    def unregister(self, fd):
+        del self.events[fd]
+
+    def poll(self, timeout):
+        readers = [fd for fd, events in self.events.items() if events & READ]
+        writers = [fd for fd, events in self.events.items() if events & WRITE]
+        if not readers and not writers:
+            time.sleep(timeout or 0)
+            return []
+        readable, writable, _ = select.select(readers, writers, [], timeout)
+        result = {}
+        for fd in readable:
+            result[fd] = READ
+        for fd in writable:
+            result[fd] = result.get(fd, 0) | WRITE
+        return list(result.items())
+
+
+def _createBackend():
+    if hasattr(select, 'epoll'):
+        return _EpollBackend()
+    if selectors is not None:
+        return _SelectorsBackend()
+    return _SelectBackend()
+
+
+class EventLoop(object):
+    """
+    Single threaded readiness based event loop with timers.
+    Uses edge-triggered epoll when available, so that the cost of a poll does not depend on the
+    number of idle connections, and falls back to the selectors module or select otherwise.
+    """
+    __slots__ = 'backend', 'handlers', 'timers', 'timerCount', 'running'
+
+    def __init__(self):
+        """
+        Initializer
+        """
+        self.backend = _createBackend()
+        # Maps file descriptors to their (onReadable, onWritable) callbacks
+        self.handlers = {}
+        # Heap of (deadline, sequence number, callback) scheduled callbacks
+        self.timers = []
+        self.timerCount = 0
+        self.running = False
+
+    def register(self, sock, onReadable, onWritable=None, events=READ):
+        """
+        Start watching a socket
+        :param sock: the socket to be watched
+        :param onReadable: called without arguments when the socket becomes readable
+        :param onWritable: called without arguments when the socket becomes writable
+        :param events: the initial event mask
+        :return: None
+        """
+        fd = sock.fileno()
+        self.handlers[fd] = (onReadable, onWritable)
+        self.backend.register(fd, events)
+
+    def modify(self, sock, events):
+        """
+        Change the events watched on a socket
+        :param sock: the watched socket
+        :param events: the new event mask
+        :return: None
+        """
+        self.backend.modify(sock.fileno(), events)
+
+    def unregister(self, sock):
+        """
+        Stop watching a socket
+        :param sock: the watched socket
+        :return: None
+        """
+        fd = sock.fileno()
+        if self.handlers.pop(fd, None) is not None:
+            self.backend.unregister(fd)
+
+    def callLater(self, delay, callback):
+        """
+        Schedule a callback
+        :param delay: the delay in seconds
+        :param callback: called without arguments once the delay has elapsed
+        :return: a handle that can be passed to cancel
+        """
+        self.timerCount += 1
+        timer = [time.time() + delay, self.timerCount, callback]
+        heapq.heappush(self.timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel a scheduled callback
+        :param timer: the handle returned by callLater
+        :return: None
+        """
+        timer[2] = None
+
+    def stop(self):
+        """
+        Make run return after the current iteration
+        :return: None
+        """
+        self.running = False
+
+    def run(self):
+        """
+        Dispatch events until stop is called
+        :return: None
+        """
+        self.running = True
+        while self.running:
+            timeout = None
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.time())
+            try:
+                ready = self.backend.poll(timeout)
+            except (IOError, OSError, select.error) as e:
+                if e.args and e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, events in ready:
+                handlers = self.handlers.get(fd)
+                if handlers is not None and events & READ:
+                    handlers[0]()
+                # the read handler may have closed the socket
+                handlers = self.handlers.get(fd)
+                if handlers is not None and events & WRITE and handlers[1] is not None:
+                    handlers[1]()
+            now = time.time()
+            while self.timers and self.timers[0][0] <= now:
+                callback = heapq.heappop(self.timers)[2]
+                if callback is not None:
+                    callback()
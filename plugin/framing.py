@@ -0,0 +1,108 @@
+"""
+Length-prefixed framing shared by the server and the client: every frame is a 4-byte big-endian payload length
+followed by the payload.
+"""
+import struct
+
+_HEADER = struct.Struct('>I')
+
+# Initial size of the receive buffer, which grows to fit the largest frame received
+INITIAL_BUFFER_SIZE = 16384
+
+# Minimum free space of the buffer for a read
+MIN_READ_SIZE = 4096
+
+
+def frameHeader(size):
+    """
+    Create the header of a frame
+    :param size: the size of the payload
+    :return: the header bytes
+    """
+    return _HEADER.pack(size)
+
+
+def frame(data):
+    """
+    Frame a payload
+    :param data: the payload
+    :return: the framed data
+    """
+    return _HEADER.pack(len(data)) + data
+
+
+class FrameReader(object):
+    """
+    Reads frames from a socket with recv_into into a reusable buffer. Complete frames are handed out as memoryviews
+    of the buffer, which stay valid until the next read.
+    """
+    __slots__ = 'buffer', 'start', 'end'
+
+    def __init__(self, size=INITIAL_BUFFER_SIZE):
+        """
+        Initializer
+        :param size: the initial size of the buffer
+        """
+        self.buffer = bytearray(size)
+        # The received bytes not handed out yet are buffer[start:end]
+        self.start = 0
+        self.end = 0
+
+    def readFrom(self, sock):
+        """
+        Receive what is available on a socket, up to the free space of the buffer
+        :param sock: the socket, socket errors are left to the caller
+        :return: the number of bytes received, 0 on EOF
+        """
+        self.__reserve()
+        n = sock.recv_into(memoryview(self.buffer)[self.end:])
+        self.end += n
+        return n
+
+    def feed(self, data):
+        """
+        Add bytes received by other means, such as the bytes following a frame read by another reader
+        :param data: the bytes
+        :return: None
+        """
+        self.__reserve(len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def frames(self):
+        """
+        Get the complete frames received so far
+        :return: a generator of the frame payloads as memoryviews
+        """
+        view = memoryview(self.buffer)
+        while self.end - self.start >= _HEADER.size:
+            size = _HEADER.unpack_from(self.buffer, self.start)[0]
+            begin = self.start + _HEADER.size
+            if self.end - begin < size:
+                break
+            self.start = begin + size
+            yield view[begin:self.start]
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def __reserve(self, size=MIN_READ_SIZE):
+        """
+        Make room at the end of the buffer, moving the pending bytes to its start and growing it to fit the frame
+        being received. A grown buffer is a new bytearray, as frames handed out may still be referenced.
+        :param size: the number of free bytes needed
+        :return: None
+        """
+        if len(self.buffer) - self.end >= size:
+            return
+        pending = self.end - self.start
+        needed = pending + size
+        if pending >= _HEADER.size:
+            needed = max(needed, _HEADER.size + _HEADER.unpack_from(self.buffer, self.start)[0])
+        if needed > len(self.buffer):
+            buffer = bytearray(max(needed, 2 * len(self.buffer)))
+            buffer[:pending] = self.buffer[self.start:self.end]
+            self.buffer = buffer
+        elif self.start:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+        self.start = 0
+        self.end = pending
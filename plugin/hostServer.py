@@ -0,0 +1,131 @@
+"""
+Starting the server of a hosting user, either in the editor's process on a background thread or as a separate
+process, returning once it listens so that the host's client connects right away.
+
+The host's client is connected to a server in process through a socket pair, and to a separate one over the Unix
+domain socket at hostSocketPath(port), which the server listens on besides its TCP port.
+"""
+import errno
+import os
+import select
+import socket
+import subprocess
+import tempfile
+import time
+from threading import Event, Thread
+
+from transports import connect, socketPair
+
+# Maximum time in seconds to wait for the server to listen
+START_TIMEOUT = 10
+
+# Path of the server script
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'editorServer.py')
+
+
+def hostSocketPath(port):
+    """
+    Get the path of the Unix domain socket the server of a hosting user listens on
+    :param port: the TCP port of the server
+    :return: the path
+    """
+    uid = os.getuid() if hasattr(os, 'getuid') else 0
+    return os.path.join(tempfile.gettempdir(), 'teameditor-' + str(uid) + '-' + str(port) + '.sock')
+
+
+def startServerThread(port, unixPath, timeout=START_TIMEOUT):
+    """
+    Run the server in this process, on a daemon thread
+    :param port: the TCP port of the server
+    :param unixPath: the path of the Unix domain socket of the server
+    :param timeout: the maximum time in seconds to wait for the server to listen
+    :return: the client's end of a socket pair connected to the server, None if it failed to start
+    """
+    # imported here, so that the editor only loads the server when hosting in process
+    from editorServer import EditorServer
+
+    serverEnd, clientEnd = socketPair()
+    ready = Event()
+    thread = Thread(target=EditorServer, args=(int(port),),
+                    kwargs={'unixPath': unixPath, 'ready': ready.set, 'clientSockets': (serverEnd,),
+                            'logMessage': _ignoreMessage})
+    thread.daemon = True
+    thread.start()
+    # the thread ends early if the server failed to bind its sockets
+    deadline = time.time() + timeout
+    while not ready.is_set() and thread.is_alive() and time.time() < deadline:
+        ready.wait(0.05)
+    if not ready.is_set():
+        serverEnd.close()
+        clientEnd.close()
+        return None
+    return clientEnd
+
+
+def startServerProcess(port, unixPath, python='python', timeout=START_TIMEOUT):
+    """
+    Run the server as a separate process, which signals that it listens through a pipe
+    :param port: the TCP port of the server
+    :param unixPath: the path of the Unix domain socket of the server
+    :param python: the Python interpreter running the server
+    :param timeout: the maximum time in seconds to wait for the server to listen
+    :return: a socket connected to the server's Unix domain socket, None if it failed to start
+    """
+    readFd, writeFd = os.pipe()
+    if hasattr(os, 'set_inheritable'):
+        os.set_inheritable(writeFd, True)
+    try:
+        with open(os.devnull, 'wb') as devnull:
+            subprocess.Popen([python, SERVER_PATH, str(port), '--unix', unixPath, '--ready-fd', str(writeFd)],
+                             stdin=devnull, stdout=devnull, stderr=devnull, close_fds=False)
+    except OSError:
+        os.close(readFd)
+        return None
+    finally:
+        os.close(writeFd)
+    try:
+        if not _waitReady(readFd, timeout):
+            return None
+    finally:
+        os.close(readFd)
+    try:
+        return connect(unixPath)
+    except socket.error:
+        return None
+
+
+def _ignoreMessage(message):
+    """
+    Drop a message of a server running in the editor's process, whose thread must not write to the editor
+    :param message: the message
+    :return: None
+    """
+    pass
+
+
+def _waitReady(fd, timeout):
+    """
+    Wait for the server to write its ready line
+    :param fd: the read end of the pipe
+    :param timeout: the maximum time in seconds to wait
+    :return: True if the server is ready, False if it exited or timed out before
+    """
+    received = b''
+    deadline = time.time() + timeout
+    while b'\n' not in received:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        try:
+            if not select.select([fd], [], [], remaining)[0]:
+                return False
+            data = os.read(fd, 64)
+        except (OSError, select.error) as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        if not data:
+            # the server exited, its copy of the write end being closed
+            return False
+        received += data
+    return True
@@ -34,6 +34,43 @@ class IEditorView(object):
     def setCurrentBuffer(self, buffer):
         pass
 
+    @abstractmethod
+    def getLines(self, start, end):
+        pass
+
+    @abstractmethod
+    def getLineCount(self):
+        pass
+
+    @abstractmethod
+    def replaceLines(self, start, end, lines):
+        pass
+
+    @abstractmethod
+    def getChangeTick(self):
+        pass
+
+    @abstractmethod
+    def watchChanges(self):
+        """
+        Start collecting the changes made to the buffer
+        :return: True if the editor reports its changes, False if it does not
+        """
+        pass
+
+    @abstractmethod
+    def unwatchChanges(self):
+        pass
+
+    @abstractmethod
+    def takeChanges(self):
+        """
+        Get and forget the changes collected so far, each one in the line numbers left by the previous ones
+        :return: the list of (first changed line, line below the changed ones before the change, number of lines
+                 added) 0-based tuples
+        """
+        pass
+
     @abstractmethod
     def printError(self, error):
         pass
@@ -64,4 +101,8 @@ class IEditorView(object):
 
     @abstractmethod
     def updateCursor(self, cursorId, cursorColor, x, y):
+        pass
+
+    @abstractmethod
+    def updateCursors(self, cursors):
         pass
\ No newline at end of file
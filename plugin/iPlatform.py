@@ -19,5 +19,32 @@ class IPlatform(object):
         pass
 
     @abstractmethod
-    def runServer(self, port):
+    def runServer(self, port, unixPath):
+        """
+        Start the server of the hosting user
+        :param port: the port the server listens on
+        :param unixPath: the path of the Unix domain socket the server also listens on, for the host's client
+        :return: a socket connected to the server once it listens, None if it failed to start
+        """
+        pass
+
+    @abstractmethod
+    def getSendIntervals(self):
+        """
+        Get the bounds of the interval between two updates while the user keeps typing
+        :return: the minimum and maximum intervals in seconds
+        """
+        pass
+
+    @abstractmethod
+    def startTimer(self, interval):
+        """
+        Call the controller's onTimer on the editor's main thread at a regular interval
+        :param interval: the interval in seconds
+        :return: True if started, False if the editor has no timers
+        """
+        pass
+
+    @abstractmethod
+    def stopTimer(self):
         pass
@@ -0,0 +1,220 @@
+"""
+Durable storage of the server document as a snapshot and an append-only log of the operations committed since.
+
+Both files are sequences of records made of a 4-byte big-endian length, the CRC-32 of the payload and the
+payload encoded by the binary codec. Log records carry a revision and its operations, the snapshot is a single
+record carrying a revision and the lines of the document. A torn record at the end of the log, left by a crash
+during a write, is discarded on recovery, as is the rest of the log after a missing revision.
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+
+from documentStore import DocumentStore
+from operations import applyOps
+from wireProtocol import BinaryCodec
+
+SNAPSHOT_FILE = 'snapshot'
+LOG_FILE = 'ops.log'
+
+# Number of logged revisions after which the document is snapshotted and the log emptied
+SNAPSHOT_INTERVAL = 1000
+
+# Time in seconds the writer waits after a sync, so that records arriving meanwhile share the next one
+SYNC_INTERVAL = 0.05
+
+_HEADER = struct.Struct('>II')
+
+
+def _printMessage(message):
+    print(message)
+
+
+def _frameRecord(payload):
+    return _HEADER.pack(len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+
+
+def _readRecords(data):
+    """
+    Parse the records of a file, up to the first torn or corrupted one
+    :param data: the content of the file
+    :return: the list of (payload, offset following the record) entries
+    """
+    records = []
+    offset = 0
+    while len(data) - offset >= _HEADER.size:
+        size, crc = _HEADER.unpack_from(data, offset)
+        end = offset + _HEADER.size + size
+        payload = data[offset + _HEADER.size:end]
+        if end > len(data) or zlib.crc32(payload) & 0xffffffff != crc:
+            break
+        records.append((payload, end))
+        offset = end
+    return records
+
+
+class OperationLog(object):
+    """
+    Write-behind log of the committed operations. Records are handed to a writer thread, which writes and syncs
+    everything accumulated since its previous sync at once, so that the event loop never waits for the disk.
+    """
+    __slots__ = 'directory', 'codec', 'snapshotCodec', 'logFile', 'queue', 'condition', 'thread', 'closed', 'snapshotRevision', \
+                'syncInterval', 'logMessage'
+
+    def __init__(self, directory, syncInterval=SYNC_INTERVAL, logMessage=None):
+        """
+        Initializer
+        :param directory: the directory holding the snapshot and log files, created if missing
+        :param syncInterval: the minimum time in seconds between two syncs
+        :param logMessage: called with the messages of the log, None to print them
+        """
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.codec = BinaryCodec()
+        # Encodes the snapshots on the writer thread
+        self.snapshotCodec = BinaryCodec()
+        self.logFile = None
+        # Records and snapshots waiting for the writer thread, as ('record', framed record) and
+        # ('snapshot', (revision, lines)) entries
+        self.queue = []
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closed = False
+        # The revision of the last snapshot handed to the writer
+        self.snapshotRevision = 0
+        self.syncInterval = syncInterval
+        self.logMessage = logMessage if logMessage is not None else _printMessage
+
+    def __path(self, name):
+        return os.path.join(self.directory, name)
+
+    def recover(self):
+        """
+        Load the latest snapshot and replay the log on top of it, then start the writer
+        :return: the recovered revision and list of lines
+        """
+        revision = 0
+        document = DocumentStore()
+        try:
+            with open(self.__path(SNAPSHOT_FILE), 'rb') as f:
+                records = _readRecords(f.read())
+            if records:
+                snapshot = self.codec.decode(records[0][0])
+                revision = snapshot['revision']
+                document.setLines(snapshot['buffer'])
+        except IOError:
+            pass
+        self.snapshotRevision = revision
+
+        # Size of the part of the log which was recovered
+        validSize = 0
+        if os.path.exists(self.__path(LOG_FILE)):
+            with open(self.__path(LOG_FILE), 'rb') as f:
+                records = _readRecords(f.read())
+            for payload, end in records:
+                record = self.codec.decode(payload)
+                if record['revision'] > revision + 1:
+                    self.logMessage('Operation log is missing revision ' + str(revision + 1) + ', ignoring the rest of it')
+                    break
+                if record['revision'] == revision + 1:
+                    applyOps(document, record['ops'])
+                    revision = record['revision']
+                # otherwise already part of the snapshot, the log was not emptied before a crash
+                validSize = end
+
+        # drop the torn tail and the records after a missing revision, so that new records follow the last
+        # recovered one and are recovered next time
+        self.logFile = open(self.__path(LOG_FILE), 'ab')
+        self.logFile.truncate(validSize)
+        self.thread = threading.Thread(target=self.__run)
+        self.thread.daemon = True
+        self.thread.start()
+        return revision, document.getLines()
+
+    def append(self, revision, ops):
+        """
+        Queue the operations of a revision to be logged
+        :param revision: the revision number
+        :param ops: the list of operations leading to it
+        :return: None
+        """
+        self.__enqueue('record', _frameRecord(self.codec.encode({'revision': revision, 'ops': ops})))
+
+    def snapshot(self, revision, lines):
+        """
+        Queue a snapshot of the document, replacing the log once written. The writer encodes it, as that takes
+        time proportional to the size of the document.
+        :param revision: the revision of the document
+        :param lines: the list of lines of the document, not modified afterwards
+        :return: None
+        """
+        self.snapshotRevision = revision
+        self.__enqueue('snapshot', (revision, lines))
+
+    def close(self):
+        """
+        Write everything queued and stop the writer
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.logFile is not None:
+            self.logFile.close()
+            self.logFile = None
+
+    def __enqueue(self, kind, data):
+        with self.condition:
+            self.queue.append((kind, data))
+            self.condition.notify()
+
+    def __run(self):
+        """
+        Write the queued entries until closed
+        :return: None
+        """
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                batch = self.queue
+                self.queue = []
+                closed = self.closed
+            if not batch:
+                return
+            try:
+                self.__write(batch)
+            except (IOError, OSError) as e:
+                self.logMessage('Failed to write the operation log: ' + str(e))
+            if not closed:
+                time.sleep(self.syncInterval)
+
+    def __write(self, batch):
+        """
+        Write entries and sync them to disk
+        :param batch: the list of (kind, data) entries
+        :return: None
+        """
+        for kind, data in batch:
+            if kind == 'record':
+                self.logFile.write(data)
+            else:
+                revision, lines = data
+                payload = _frameRecord(self.snapshotCodec.encode({'revision': revision, 'buffer': lines}))
+                # replace the snapshot atomically, then start an empty log
+                path = self.__path(SNAPSHOT_FILE)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.rename(path + '.tmp', path)
+                self.logFile.close()
+                self.logFile = open(self.__path(LOG_FILE), 'wb')
+        self.logFile.flush()
+        os.fsync(self.logFile.fileno())
@@ -0,0 +1,268 @@
+"""
+Edit operations on a line based document.
+
+An operation is a list starting with its op code:
+    [INSERT_LINES, line, lines]     inserts the lines before the given line
+    [DELETE_LINES, line, count]     deletes count lines starting at the given line
+    [INSERT_TEXT, line, col, text]  inserts text without line breaks at the given column of a line
+    [DELETE_TEXT, line, col, count] deletes count characters starting at the given column of a line
+Lines and columns are 0-based. A list of operations is applied in order, each one refering to the document
+left by the previous ones.
+
+Columns and counts of text operations are in code points, whatever the string type of the process: python 2
+processes hold lines as UTF-8 bytes and python 3 ones as str, and they may edit the same document.
+"""
+import sys
+
+PY2 = sys.version_info[0] == 2
+
+INSERT_LINES = 1
+DELETE_LINES = 2
+INSERT_TEXT = 3
+DELETE_TEXT = 4
+
+
+def decodeText(text):
+    """
+    Get the code points of a text. Python 2 lines which are not valid UTF-8 count one code point per byte.
+    :param text: the text, UTF-8 bytes on python 2
+    :return: the unicode text and the encoding it was decoded from, None if it was not encoded
+    """
+    if not PY2 or isinstance(text, unicode):
+        return text, None
+    try:
+        return text.decode('utf-8'), 'utf-8'
+    except UnicodeDecodeError:
+        return text.decode('latin-1'), 'latin-1'
+
+
+def textLength(text):
+    """
+    Get the length of a text in code points, the unit of text operations
+    :param text: the text
+    :return: the length
+    """
+    if PY2 and isinstance(text, str):
+        return len(decodeText(text)[0])
+    return len(text)
+
+
+def _textIndex(text, col):
+    """
+    Get the index in a line of the string type of the process of a column, clamped to the line
+    :param text: the line
+    :param col: the column in code points
+    :return: the index
+    """
+    if PY2 and isinstance(text, str):
+        decoded, encoding = decodeText(text)
+        return len(decoded[:max(0, col)].encode(encoding))
+    return max(0, min(col, len(text)))
+
+
+def opsFromSplice(start, end, lines):
+    """
+    Create the operations replacing a range of lines
+    :param start: the first line to be replaced
+    :param end: the line after the last line to be replaced
+    :param lines: the lines replacing the range [start, end)
+    :return: the list of operations
+    """
+    ops = []
+    if end > start:
+        ops.append([DELETE_LINES, start, end - start])
+    if lines:
+        ops.append([INSERT_LINES, start, list(lines)])
+    return ops
+
+
+def applyOps(document, ops, listener=None):
+    """
+    Apply operations to a document. Out of range positions are clamped to the document.
+    :param document: the DocumentStore to be modified
+    :param ops: the list of operations
+    :param listener: called as listener(start, end, lines) after each operation, with the range of lines
+                     [start, end) it replaced and the lines replacing it, to mirror the change elsewhere
+    :return: None
+    """
+    for op in ops:
+        kind = op[0]
+        size = len(document)
+        if kind == INSERT_LINES:
+            line = end = max(0, min(op[1], size))
+            lines = op[2]
+        elif kind == DELETE_LINES:
+            line = max(0, min(op[1], size))
+            end = min(line + op[2], size)
+            lines = []
+        elif size > 0:
+            line = max(0, min(op[1], size - 1))
+            end = line + 1
+            text = document.getLine(line)
+            col = _textIndex(text, op[2])
+            if kind == INSERT_TEXT:
+                text = text[:col] + op[3] + text[col:]
+            elif kind == DELETE_TEXT:
+                text = text[:col] + text[_textIndex(text, op[2] + op[3]):]
+            lines = [text]
+        else:
+            continue
+        document.replaceLines(line, end, lines)
+        if listener is not None:
+            listener(line, end, lines)
+
+
+def transformPosition(line, col, op):
+    """
+    Get the position of a character after an operation was applied. A position right at an insertion point stays
+    before the inserted text.
+    :param line: the 0-based line of the position
+    :param col: the 0-based column of the position
+    :param op: the operation
+    :return: the transformed line and column
+    """
+    kind = op[0]
+    if kind == INSERT_LINES:
+        if line >= op[1]:
+            line += len(op[2])
+    elif kind == DELETE_LINES:
+        if line >= op[1] + op[2]:
+            line -= op[2]
+        elif line >= op[1]:
+            line = op[1]
+            col = 0
+    elif line == op[1]:
+        if kind == INSERT_TEXT:
+            if col > op[2]:
+                col += textLength(op[3])
+        elif kind == DELETE_TEXT:
+            if col >= op[2] + op[3]:
+                col -= op[3]
+            elif col > op[2]:
+                col = op[2]
+    return line, col
+
+
+def _isLineOp(op):
+    return op[0] == INSERT_LINES or op[0] == DELETE_LINES
+
+
+def _transformRanges(aStart, aCount, bStart, bCount):
+    """
+    Transform a deleted range against another deleted range
+    :return: the start and count of the part of range a left after range b was deleted
+    """
+    overlap = max(0, min(aStart + aCount, bStart + bCount) - max(aStart, bStart))
+    return aStart - min(bCount, max(0, aStart - bStart)), aCount - overlap
+
+
+def _transformInsertDelete(insertAt, insertLength, deleteAt, deleteCount):
+    """
+    Transform an insertion and a deletion at the same level (lines of a document or characters of a line)
+    :return: the new insertion position and the list of (position, count) deletions
+    """
+    if insertAt <= deleteAt:
+        return insertAt, [(deleteAt + insertLength, deleteCount)]
+    if insertAt >= deleteAt + deleteCount:
+        return insertAt - deleteCount, [(deleteAt, deleteCount)]
+    # the insertion falls inside the deleted range, which is split around it
+    return deleteAt, [(deleteAt, insertAt - deleteAt), (deleteAt + insertLength, deleteAt + deleteCount - insertAt)]
+
+
+def _transformLineOps(a, b):
+    """
+    Transform two line operations, a winning ties
+    """
+    if a[0] == INSERT_LINES and b[0] == INSERT_LINES:
+        if a[1] <= b[1]:
+            return [a], [[INSERT_LINES, b[1] + len(a[2]), b[2]]]
+        return [[INSERT_LINES, a[1] + len(b[2]), a[2]]], [b]
+    if a[0] == DELETE_LINES and b[0] == DELETE_LINES:
+        aStart, aCount = _transformRanges(a[1], a[2], b[1], b[2])
+        bStart, bCount = _transformRanges(b[1], b[2], a[1], a[2])
+        return ([[DELETE_LINES, aStart, aCount]] if aCount else []), \
+               ([[DELETE_LINES, bStart, bCount]] if bCount else [])
+    if a[0] == INSERT_LINES:
+        at, deletions = _transformInsertDelete(a[1], len(a[2]), b[1], b[2])
+        return [[INSERT_LINES, at, a[2]]], [[DELETE_LINES, start, count] for start, count in deletions]
+    bPrime, aPrime = _transformLineOps(b, a)
+    return aPrime, bPrime
+
+
+def _transformTextOps(a, b):
+    """
+    Transform two text operations on the same line, a winning ties
+    """
+    line = a[1]
+    if a[0] == INSERT_TEXT and b[0] == INSERT_TEXT:
+        if a[2] <= b[2]:
+            return [a], [[INSERT_TEXT, line, b[2] + textLength(a[3]), b[3]]]
+        return [[INSERT_TEXT, line, a[2] + textLength(b[3]), a[3]]], [b]
+    if a[0] == DELETE_TEXT and b[0] == DELETE_TEXT:
+        aStart, aCount = _transformRanges(a[2], a[3], b[2], b[3])
+        bStart, bCount = _transformRanges(b[2], b[3], a[2], a[3])
+        return ([[DELETE_TEXT, line, aStart, aCount]] if aCount else []), \
+               ([[DELETE_TEXT, line, bStart, bCount]] if bCount else [])
+    if a[0] == INSERT_TEXT:
+        at, deletions = _transformInsertDelete(a[2], textLength(a[3]), b[2], b[3])
+        return [[INSERT_TEXT, line, at, a[3]]], [[DELETE_TEXT, line, start, count] for start, count in deletions]
+    bPrime, aPrime = _transformTextOps(b, a)
+    return aPrime, bPrime
+
+
+def _transformLineText(lineOp, textOp):
+    """
+    Transform a line operation and a text operation
+    :return: the transformed text operations, the line operation being unaffected
+    """
+    line = textOp[1]
+    if lineOp[0] == INSERT_LINES:
+        if line >= lineOp[1]:
+            return [[textOp[0], line + len(lineOp[2])] + textOp[2:]]
+    elif line >= lineOp[1] + lineOp[2]:
+        return [[textOp[0], line - lineOp[2]] + textOp[2:]]
+    elif line >= lineOp[1]:
+        # the edited line was deleted
+        return []
+    return [textOp]
+
+
+def _transformPair(a, b):
+    """
+    Transform two concurrent operations
+    :return: the lists of operations a' and b' such that applying a then b' equals applying b then a'
+    """
+    if _isLineOp(a):
+        if _isLineOp(b):
+            return _transformLineOps(a, b)
+        return [a], _transformLineText(a, b)
+    if _isLineOp(b):
+        return _transformLineText(b, a), [b]
+    if a[1] != b[1]:
+        return [a], [b]
+    return _transformTextOps(a, b)
+
+
+def transform(aOps, bOps):
+    """
+    Transform two concurrent lists of operations applying to the same document. When both insert at the same
+    position, the insertion of aOps goes first.
+    :param aOps: the first list of operations
+    :param bOps: the second list of operations
+    :return: the lists aOps' and bOps' such that applying aOps then bOps' equals applying bOps then aOps'
+    """
+    if not aOps or not bOps:
+        return list(aOps), list(bOps)
+    if len(aOps) == 1 and len(bOps) == 1:
+        return _transformPair(aOps[0], bOps[0])
+    if len(aOps) > 1:
+        result = []
+        for a in aOps:
+            aPrime, bOps = transform([a], bOps)
+            result.extend(aPrime)
+        return result, bOps
+    result = []
+    for b in bOps:
+        aOps, bPrime = transform(aOps, [b])
+        result.extend(bPrime)
+    return aOps, result
@@ -0,0 +1,122 @@
+"""
+Opt-in profiling of the hot paths of the server and the client.
+
+While started, the calls wrapped by measure are timed per stage, and one call in sampleEvery of each stage runs
+under cProfile. Stopping dumps the cProfile data in the pstats format and the stage timers as JSON, next to it.
+When stopped, measure only costs a function call and a test.
+"""
+import cProfile
+import json
+import time
+
+# Suffix of the file holding the stage timers, next to the pstats file
+STAGES_SUFFIX = '.stages.json'
+
+
+class Profiler(object):
+    """
+    Stage timers and sampled cProfile data
+    """
+    __slots__ = 'enabled', 'profile', 'stages', 'sampleEvery', 'depth', 'startTime'
+
+    def __init__(self):
+        """
+        Initializer
+        """
+        self.enabled = False
+        self.profile = None
+        # Dictionary mapping stage names to their [count, total time, max time]
+        self.stages = {}
+        self.sampleEvery = 1
+        # Number of measured calls in progress, only the outermost one runs under cProfile
+        self.depth = 0
+        self.startTime = None
+
+    def start(self, sampleEvery=1):
+        """
+        Start profiling, forgetting the previous data
+        :param sampleEvery: run one call in this many of each stage under cProfile
+        :return: None
+        """
+        self.profile = cProfile.Profile()
+        self.stages = {}
+        self.sampleEvery = max(1, sampleEvery)
+        self.startTime = time.time()
+        self.enabled = True
+
+    def stop(self, path):
+        """
+        Stop profiling and dump the data
+        :param path: the pstats file to be written, the stage timers being written to path + STAGES_SUFFIX
+        :return: None
+        """
+        if not self.enabled:
+            return
+        self.enabled = False
+        self.profile.dump_stats(path)
+        stages = {}
+        # the stages may still be measured from another thread
+        for name, (count, total, longest) in list(self.stages.items()):
+            stages[name] = {
+                'count': count,
+                'totalSeconds': total,
+                'meanSeconds': total / count,
+                'maxSeconds': longest
+            }
+        with open(path + STAGES_SUFFIX, 'w') as f:
+            json.dump({'duration': time.time() - self.startTime, 'sampleEvery': self.sampleEvery, 'stages': stages},
+                      f, indent=2, separators=(',', ': '), sort_keys=True)
+            f.write('\n')
+        self.profile = None
+
+    def measure(self, stage, function, *args):
+        """
+        Call a function, timing it as a stage while profiling
+        :param stage: the name of the stage
+        :param function: the function
+        :param args: the arguments of the function
+        :return: the result of the function
+        """
+        if not self.enabled:
+            return function(*args)
+        timer = self.stages.get(stage)
+        if timer is None:
+            timer = self.stages[stage] = [0, 0.0, 0.0]
+        timer[0] += 1
+        sampled = self.depth == 0 and timer[0] % self.sampleEvery == 0
+        self.depth += 1
+        begin = time.time()
+        try:
+            if sampled:
+                return self.profile.runcall(function, *args)
+            return function(*args)
+        finally:
+            elapsed = time.time() - begin
+            self.depth -= 1
+            timer[1] += elapsed
+            if elapsed > timer[2]:
+                timer[2] = elapsed
+
+
+class ProfiledView(object):
+    """
+    Wraps an editor view so that each of its calls is measured as a 'ui.<method>' stage
+    """
+    __slots__ = 'view', 'profiler'
+
+    def __init__(self, view, profiler):
+        """
+        Initializer
+        :param view: the wrapped editor view
+        :param profiler: the profiler
+        """
+        self.view = view
+        self.profiler = profiler
+
+    def __getattr__(self, name):
+        attribute = getattr(self.view, name)
+        if not callable(attribute):
+            return attribute
+        profiler = self.profiler
+        stage = 'ui.' + name
+        return lambda *args: profiler.measure(stage, attribute, *args)
@@ -0,0 +1,342 @@
+"""
+Metrics of the server, exposed in the Prometheus text format by a small HTTP endpoint served from the event loop.
+
+Metrics are collected as families of plain tuples, so that worker processes can send theirs to the server process,
+which renders them along with its own.
+"""
+import errno
+import socket
+
+from eventLoop import READ, WRITE, WOULD_BLOCK
+
+# Upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+# Maximum size of an HTTP request to the stats endpoint
+MAX_REQUEST_SIZE = 8192
+
+# Interval in seconds at which worker processes send their metrics to the server process
+PUSH_INTERVAL = 1.0
+
+
+def _formatLabels(labels):
+    """
+    Format the labels of a sample
+    :param labels: the list of (name, value) pairs
+    :return: the label set, empty if there are no labels
+    """
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"')
+                                       .replace('\n', '\\n'))
+                          for name, value in labels) + '}'
+
+
+def _formatValue(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def renderFamilies(families):
+    """
+    Render metric families in the Prometheus text format, merging the families of the same name
+    :param families: the list of (name, kind, help, samples) families, samples being (name, labels, value) tuples
+    :return: the text
+    """
+    merged = []
+    byName = {}
+    for name, kind, help, samples in families:
+        family = byName.get(name)
+        if family is None:
+            family = byName[name] = (name, kind, help, [])
+            merged.append(family)
+        family[3].extend(samples)
+    lines = []
+    for name, kind, help, samples in merged:
+        lines.append('# HELP ' + name + ' ' + help)
+        lines.append('# TYPE ' + name + ' ' + kind)
+        for sampleName, labels, value in samples:
+            lines.append(sampleName + _formatLabels(labels) + ' ' + _formatValue(value))
+    return '\n'.join(lines) + '\n'
+
+
+class _Metric(object):
+    """
+    A metric, with one value per combination of label values
+    """
+    __slots__ = 'name', 'help', 'labelNames', 'values'
+    kind = None
+
+    def __init__(self, name, help, labelNames=()):
+        """
+        Initializer
+        :param name: the name of the metric
+        :param help: the description of the metric
+        :param labelNames: the names of the labels
+        """
+        self.name = name
+        self.help = help
+        self.labelNames = tuple(labelNames)
+        # Dictionary mapping tuples of label values to the values of the metric
+        self.values = {}
+
+    def collect(self, extraLabels=()):
+        """
+        Get the samples of the metric
+        :param extraLabels: (name, value) pairs added to the labels of every sample
+        :return: the (name, kind, help, samples) family
+        """
+        samples = []
+        for labelValues, value in sorted(self.values.items()):
+            labels = list(extraLabels) + list(zip(self.labelNames, labelValues))
+            self._samples(samples, labels, value)
+        return self.name, self.kind, self.help, samples
+
+    def _samples(self, samples, labels, value):
+        samples.append((self.name, labels, value))
+
+
+class Counter(_Metric):
+    """
+    A count that only goes up
+    """
+    __slots__ = ()
+    kind = 'counter'
+
+    def inc(self, amount=1, labelValues=()):
+        """
+        Increment the counter
+        :param amount: the increment
+        :param labelValues: the values of the labels
+        :return: None
+        """
+        self.values[labelValues] = self.values.get(labelValues, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, set directly or read from a function when collected
+    """
+    __slots__ = 'function'
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelNames=(), function=None):
+        """
+        Initializer
+        :param name: the name of the metric
+        :param help: the description of the metric
+        :param labelNames: the names of the labels
+        :param function: called without arguments when collected, returning a list of (label values, value) pairs
+        """
+        _Metric.__init__(self, name, help, labelNames)
+        self.function = function
+
+    def set(self, value, labelValues=()):
+        """
+        Set the value of the gauge
+        :param value: the value
+        :param labelValues: the values of the labels
+        :return: None
+        """
+        self.values[labelValues] = value
+
+    def collect(self, extraLabels=()):
+        if self.function is not None:
+            self.values = dict(self.function())
+        return _Metric.collect(self, extraLabels)
+
+
+class Histogram(_Metric):
+    """
+    The distribution of observed values, counted in cumulative buckets
+    """
+    __slots__ = 'buckets'
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelNames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initializer
+        :param name: the name of the metric
+        :param help: the description of the metric
+        :param labelNames: the names of the labels
+        :param buckets: the increasing upper bounds of the buckets
+        """
+        _Metric.__init__(self, name, help, labelNames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labelValues=()):
+        """
+        Record an observation
+        :param value: the observed value
+        :param labelValues: the values of the labels
+        :return: None
+        """
+        state = self.values.get(labelValues)
+        if state is None:
+            # the count of each bucket, then the sum and count of the observations
+            state = self.values[labelValues] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += value
+        state[-1] += 1
+
+    def _samples(self, samples, labels, state):
+        cumulative = 0
+        for i, bound in enumerate(self.buckets):
+            cumulative += state[i]
+            samples.append((self.name + '_bucket', labels + [('le', _formatValue(float(bound)))], cumulative))
+        samples.append((self.name + '_bucket', labels + [('le', '+Inf')], state[-1]))
+        samples.append((self.name + '_sum', labels, state[-2]))
+        samples.append((self.name + '_count', labels, state[-1]))
+
+
+class ServerMetrics(object):
+    """
+    The metrics of a server process
+    """
+    __slots__ = 'metrics', 'framesReceived', 'framesSent', 'bytesReceived', 'bytesSent', 'socketErrors', \
+                'processTime', 'broadcastTime', 'resyncs', 'connectedClients', 'documentLines', 'documentRevision', \
+                'queuedBytes', 'connectionsAccepted', 'malformedFrames'
+
+    def __init__(self):
+        """
+        Initializer
+        """
+        self.framesReceived = Counter('teameditor_frames_received_total', 'Frames received from clients')
+        self.framesSent = Counter('teameditor_frames_sent_total', 'Frames queued for clients')
+        self.bytesReceived = Counter('teameditor_bytes_received_total', 'Bytes received from clients')
+        self.bytesSent = Counter('teameditor_bytes_sent_total', 'Bytes sent to clients')
+        self.socketErrors = Counter('teameditor_socket_errors_total', 'Socket errors, by operation and errno',
+                                    ('operation', 'errno'))
+        self.processTime = Histogram('teameditor_process_seconds', 'Time spent handling a packet from a client')
+        self.broadcastTime = Histogram('teameditor_broadcast_seconds', 'Time spent fanning a broadcast out to clients')
+        self.resyncs = Counter('teameditor_resyncs_total', 'Clients resynchronized, by reason', ('reason',))
+        self.connectionsAccepted = Counter('teameditor_connections_accepted_total', 'Connections accepted')
+        self.malformedFrames = Counter('teameditor_malformed_frames_total',
+                                       'Connections closed for sending a frame which could not be handled, by stage',
+                                       ('stage',))
+        self.connectedClients = Gauge('teameditor_connected_clients', 'Clients connected to a document',
+                                      ('document',))
+        self.documentLines = Gauge('teameditor_document_lines', 'Number of lines of a document', ('document',))
+        self.documentRevision = Gauge('teameditor_document_revision', 'Revision of a document', ('document',))
+        self.queuedBytes = Gauge('teameditor_client_queued_bytes', 'Bytes queued for a client',
+                                 ('document', 'client'))
+        self.metrics = [self.framesReceived, self.framesSent, self.bytesReceived, self.bytesSent, self.socketErrors,
+                        self.processTime, self.broadcastTime, self.resyncs, self.connectionsAccepted,
+                        self.connectedClients, self.documentLines, self.documentRevision, self.queuedBytes,
+                        self.malformedFrames]
+
+    def socketError(self, operation, error):
+        """
+        Count a socket error
+        :param operation: the failed operation, such as 'send'
+        :param error: the socket error
+        :return: None
+        """
+        code = error.args[0] if error.args else None
+        self.socketErrors.inc(1, (operation, errno.errorcode.get(code, str(code))))
+
+    def collect(self, extraLabels=()):
+        """
+        Get the samples of all metrics
+        :param extraLabels: (name, value) pairs added to the labels of every sample
+        :return: the list of (name, kind, help, samples) families
+        """
+        return [metric.collect(extraLabels) for metric in self.metrics]
+
+
+class StatsEndpoint(object):
+    """
+    Minimal HTTP endpoint answering every request with the metrics in the Prometheus text format
+    """
+    __slots__ = 'eventLoop', 'listenSocket', 'render', 'requests'
+
+    def __init__(self, eventLoop, port, render, host='127.0.0.1'):
+        """
+        Initializer
+        :param eventLoop: the event loop serving the endpoint
+        :param port: the port of the endpoint
+        :param render: called without arguments to get the text of the metrics
+        :param host: the address the endpoint listens on, only the local host by default
+        """
+        self.eventLoop = eventLoop
+        self.render = render
+        # Dictionary mapping the sockets of the requests being served to their [request, response, offset]
+        self.requests = {}
+        self.listenSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listenSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listenSocket.bind((host, port))
+        self.listenSocket.listen(16)
+        self.listenSocket.setblocking(False)
+        self.eventLoop.register(self.listenSocket, self.__accept)
+
+    def close(self):
+        """
+        Stop serving
+        :return: None
+        """
+        for sock in list(self.requests):
+            self.__close(sock)
+        self.eventLoop.unregister(self.listenSocket)
+        self.listenSocket.close()
+
+    def __accept(self):
+        while True:
+            try:
+                sock = self.listenSocket.accept()[0]
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                return
+            sock.setblocking(False)
+            self.requests[sock] = [b'', None, 0]
+            self.eventLoop.register(sock, lambda sock=sock: self.__read(sock), lambda sock=sock: self.__write(sock))
+
+    def __read(self, sock):
+        state = self.requests.get(sock)
+        while state is not None and state[1] is None:
+            try:
+                data = sock.recv(4096)
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] not in WOULD_BLOCK:
+                    self.__close(sock)
+                return
+            if not data:
+                self.__close(sock)
+                return
+            state[0] += data
+            if b'\r\n\r\n' in state[0] or b'\n\n' in state[0] or len(state[0]) > MAX_REQUEST_SIZE:
+                body = self.render().encode('utf-8')
+                state[1] = (b'HTTP/1.0 200 OK\r\n'
+                            b'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                            b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n'
+                            b'Connection: close\r\n\r\n' + body)
+                self.eventLoop.modify(sock, READ | WRITE)
+                self.__write(sock)
+
+    def __write(self, sock):
+        state = self.requests.get(sock)
+        if state is None or state[1] is None:
+            return
+        while state[2] < len(state[1]):
+            try:
+                state[2] += sock.send(state[1][state[2]:])
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] not in WOULD_BLOCK:
+                    self.__close(sock)
+                return
+        self.__close(sock)
+
+    def __close(self, sock):
+        if self.requests.pop(sock, None) is not None:
+            self.eventLoop.unregister(sock)
+            sock.close()
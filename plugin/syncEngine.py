@@ -0,0 +1,157 @@
+"""
+Operational transformation state of the server and of the clients.
+
+The server orders the edits: every list of operations it applies gets the next revision number. Clients send
+their edits along with the revision their document was at, and the server transforms them against the edits
+committed since then before applying them. Clients apply their own edits immediately, keep at most one list of
+operations in flight until the server acknowledges it, and transform the edits of other clients against their
+unacknowledged ones. Both sides call transform with the client's operations first, so ties are broken the
+same way everywhere.
+"""
+from collections import deque
+
+from operations import transform
+
+# Number of revisions the server keeps to transform late edits and to catch up reconnecting clients
+MAX_HISTORY = 1000
+
+
+class ServerHistory(object):
+    """
+    The revisions committed by the server
+    """
+    __slots__ = 'revision', 'entries', 'authors', 'maxEntries'
+
+    def __init__(self, maxEntries=MAX_HISTORY):
+        """
+        Initializer
+        :param maxEntries: the number of revisions kept
+        """
+        # The revision of the server document
+        self.revision = 0
+        # The operations of the last revisions, the last entry leading to the current revision
+        self.entries = deque()
+        # The names of the clients which made the revisions of entries
+        self.authors = deque()
+        self.maxEntries = maxEntries
+
+    def oldestRevision(self):
+        """
+        Get the oldest revision edits can still be based on
+        :return: the revision number
+        """
+        return self.revision - len(self.entries)
+
+    def since(self, revision):
+        """
+        Get the revisions committed after a revision
+        :param revision: the revision number
+        :return: the list of (revision, operations, author) entries, or None if the history does not go back as far
+        """
+        if revision < self.oldestRevision() or revision > self.revision:
+            return None
+        first = revision - self.oldestRevision()
+        return [(self.oldestRevision() + i + 1, self.entries[i], self.authors[i])
+                for i in range(first, len(self.entries))]
+
+    def commit(self, ops, baseRevision=None, author=None):
+        """
+        Transform operations against the revisions committed since the one they are based on and commit them
+        :param ops: the list of operations
+        :param baseRevision: the revision the operations are based on, None for the current revision
+        :param author: the name of the client which made the operations
+        :return: the transformed operations, now leading to the current revision, or None if the base revision
+                 is unknown
+        """
+        if baseRevision is None:
+            baseRevision = self.revision
+        if baseRevision < self.oldestRevision() or baseRevision > self.revision:
+            return None
+        for i in range(baseRevision - self.oldestRevision(), len(self.entries)):
+            ops = transform(ops, self.entries[i])[0]
+        self.entries.append(ops)
+        self.authors.append(author)
+        self.revision += 1
+        if len(self.entries) > self.maxEntries:
+            self.entries.popleft()
+            self.authors.popleft()
+        return ops
+
+
+class ClientSync(object):
+    """
+    The local edits of a client not yet acknowledged by the server
+    """
+    __slots__ = 'revision', 'inflight', 'pending'
+
+    def __init__(self, revision=0):
+        """
+        Initializer
+        :param revision: the server revision of the document
+        """
+        self.reset(revision)
+
+    def reset(self, revision):
+        """
+        Forget the unacknowledged edits, after the whole document was received
+        :param revision: the server revision of the received document
+        :return: None
+        """
+        # The last server revision applied to the document
+        self.revision = revision
+        # The operations sent and waiting for acknowledgement, None if there are none
+        self.inflight = None
+        # The local operations not sent yet
+        self.pending = []
+
+    def addLocal(self, ops):
+        """
+        Record operations already applied to the local document
+        :param ops: the list of operations
+        :return: None
+        """
+        self.pending.extend(ops)
+
+    def takeOutgoing(self):
+        """
+        Get the operations to be sent, if nothing is in flight
+        :return: the list of operations and the revision they are based on, or None if nothing is to be sent
+        """
+        if self.inflight is not None or not self.pending:
+            return None
+        self.inflight = self.pending
+        self.pending = []
+        return self.inflight, self.revision
+
+    def resend(self):
+        """
+        Send the operations in flight again, after the connection they were sent on was lost before the server
+        committed them. They are already based on the last revision received.
+        :return: None
+        """
+        if self.inflight is not None:
+            self.pending = self.inflight + self.pending
+            self.inflight = None
+
+    def acknowledge(self, revision):
+        """
+        Handle the server committing the operations in flight
+        :param revision: the revision the server gave them
+        :return: None
+        """
+        self.inflight = None
+        self.revision = revision
+
+    def receive(self, ops, revision):
+        """
+        Transform the operations of another client against the unacknowledged local ones
+        :param ops: the operations committed by the server
+        :param revision: the revision the server gave them
+        :return: the operations to be applied to the local document
+        """
+        if self.inflight is not None:
+            self.inflight, ops = transform(self.inflight, ops)
+        if self.pending:
+            self.pending, ops = transform(self.pending, ops)
+        self.revision = revision
+        return ops
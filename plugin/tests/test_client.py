@@ -0,0 +1,210 @@
+"""
+Tests of the client model handling the packets of the server, run against the in-memory editor view of the
+benchmarks.
+"""
+import os
+import socket
+import sys
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'plugin'))
+sys.path.insert(0, ROOT)
+
+from benchmarks import fakeVim
+from benchmarks.memoryEditor import MemoryEditorView, MemoryPlatform
+
+fakeVim.install()
+
+from documentStore import DocumentStore
+import editorClient
+from editorClient import CursorManager, EditorModel
+from framing import FrameReader, frame
+from wireProtocol import BinaryCodec, JsonCodec
+
+
+class Controller(object):
+    """
+    The part of the editor controller the model uses
+    """
+
+    def __init__(self):
+        self.platform = MemoryPlatform()
+
+    def onChange(self):
+        pass
+
+    def startDaemonThread(self):
+        pass
+
+    def stopDaemonThread(self):
+        pass
+
+
+class RecordingView(MemoryEditorView):
+    """
+    The in-memory view, keeping the errors printed
+    """
+
+    def __init__(self, lines=None):
+        MemoryEditorView.__init__(self, lines)
+        self.errors = []
+
+    def printError(self, error):
+        self.errors.append(error)
+
+
+def user(name, x=1, y=1):
+    return {'name': name, 'cursor': {'x': x, 'y': y}}
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ui = RecordingView(['first', 'second'])
+        model = self.model = EditorModel(Controller(), self.ui)
+        model.name = 'me'
+        model.port = 0
+        model.prevBuffer = DocumentStore(['first', 'second'])
+        model.cursorManager = CursorManager(model)
+        model.sync.reset(0)
+        model.changeTick = self.ui.getChangeTick()
+
+    def receive(self, message_type, **data):
+        data['message_type'] = message_type
+        self.model.processData(JsonCodec().encode({'type': 'message', 'data': data}))
+
+    def cursorIds(self, *names):
+        return set(self.model.cursorManager.cursors[name][1] for name in names)
+
+
+class ResyncUsersTest(ClientTest):
+    """
+    A resync drops the arrivals and departures queued for the client, the users are reconciled with its list
+    """
+
+    def testResyncReconcilesUsers(self):
+        self.receive('user_connected', user=user('alice'))
+        self.receive('user_connected', user=user('bob'))
+        alice = self.cursorIds('alice')
+        # alice left and carol joined while the messages were dropped
+        self.receive('resync', buffer=['first'], revision=3,
+                     users=[user('me'), user('bob', 2, 1), user('carol', 3, 1)])
+        self.assertEqual(set(self.model.cursorManager.cursors), set(['me', 'bob', 'carol']))
+        self.assertEqual(set(self.ui.cursors), self.cursorIds('bob', 'carol'))
+        self.assertFalse(alice & set(self.ui.cursors))
+        self.assertEqual(self.ui.cursors[list(self.cursorIds('carol'))[0]][1:], (3, 1))
+
+        self.receive('user_disconnected', name='carol')
+        self.assertEqual(set(self.ui.cursors), self.cursorIds('bob'))
+
+    def testUnknownUserDisconnecting(self):
+        self.receive('user_disconnected', name='alice')
+        self.assertEqual(self.ui.cursors, {})
+
+
+class DisconnectTest(ClientTest):
+
+    def testDisconnectWhenNotConnected(self):
+        self.model.disconnect()
+        self.assertEqual(self.ui.errors, ['TeamEditor must be running to use this command'])
+
+
+class MalformedFrameTest(ClientTest):
+    """
+    A frame the client cannot decode ends the connection, which is then resumed, instead of the network thread
+    """
+
+    def setUp(self):
+        ClientTest.setUp(self)
+        self.server, self.model.connection = socket.socketpair()
+        self.model.reader = FrameReader()
+        self.model.binaryCodec = BinaryCodec()
+        self.model.wakeup = os.pipe()
+
+    def tearDown(self):
+        self.server.close()
+        self.model.connection.close()
+        for fd in self.model.wakeup:
+            os.close(fd)
+
+    def assertMalformed(self, data):
+        self.server.sendall(frame(data))
+        self.assertFalse(self.model.receive(1))
+        self.model.runDispatched()
+        self.assertEqual(len(self.ui.errors), 1)
+        self.assertTrue(self.ui.errors[0].startswith('Received a malformed frame, reconnecting'))
+
+    def testUnknownSession(self):
+        codec = BinaryCodec()
+        codec.addSession(7, 'ghost')
+        self.assertMalformed(codec.encode({'type': 'update', 'data': {'name': 'ghost', 'cursor': {'x': 1, 'y': 1}}}))
+
+    def testTruncatedFrame(self):
+        encoded = BinaryCodec().encode({'type': 'message', 'data': {'message_type': 'resync', 'buffer': ['a']}})
+        self.assertMalformed(encoded[:-2])
+
+
+class ReconnectTest(unittest.TestCase):
+    """
+    A client whose server is gone stops trying to reconnect after a few attempts and disconnects
+    """
+
+    def setUp(self):
+        self.delays = editorClient.RECONNECT_DELAY, editorClient.MAX_RECONNECT_DELAY
+        editorClient.RECONNECT_DELAY = editorClient.MAX_RECONNECT_DELAY = 0.001
+
+    def tearDown(self):
+        editorClient.RECONNECT_DELAY, editorClient.MAX_RECONNECT_DELAY = self.delays
+
+    def testGiveUp(self):
+        controller = editorClient.EditorController()
+        controller.platform = MemoryPlatform()
+        model = controller.editorModel
+        ui = model.ui = RecordingView()
+        server, connection = socket.socketpair()
+        model.connect(os.path.join(ROOT, 'no-such-server.sock'), None, 'me', connection=connection)
+        server.close()
+        controller.daemonThread.join(5)
+        self.assertFalse(controller.daemonThread.is_alive())
+        while model.inbox:
+            model.runDispatched()
+        attempts = editorClient.MAX_RECONNECT_ATTEMPTS
+        self.assertEqual(ui.errors[-attempts - 1:], ['Unable to reach the server (attempt ' + str(i + 1) + ' of ' +
+                                                     str(attempts) + ')' for i in range(attempts)] +
+                         ['Lost the connection to the server, giving up'])
+        self.assertIsNone(model.connection)
+        self.assertFalse(model.isConnected)
+        self.assertFalse(controller.runFlag)
+
+
+class HostTest(ClientTest):
+    """
+    Hosting through the platform, which runs the server on a thread
+    """
+
+    def tearDown(self):
+        if self.model.connection is not None:
+            self.model.disconnect()
+        # the server stops once its last client left
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread():
+                thread.join(5)
+
+    def testHost(self):
+        self.model.name = None
+        self.model.createServer(0, 'me')
+        self.assertTrue(self.model.isHost)
+        for _ in range(100):
+            self.model.flush()
+            self.model.receive(0.05)
+            self.model.runDispatched()
+            if self.model.token is not None:
+                break
+        self.assertIsNotNone(self.model.token)
+        self.assertEqual(set(self.model.cursorManager.cursors), set(['me']))
+
+
+if __name__ == '__main__':
+    unittest.main()
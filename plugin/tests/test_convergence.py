@@ -0,0 +1,306 @@
+"""
+Randomized convergence tests of the operational transformation: clients edit concurrently, the server orders
+their edits, and every replica must end up with the server's document.
+"""
+import errno
+import os
+import random
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import editorServer
+from documentStore import DocumentStore
+from eventLoop import EventLoop, WOULD_BLOCK
+from framing import FrameReader, frame
+from operations import applyOps
+from syncEngine import ClientSync, ServerHistory
+from textDiff import diffLines
+from wireProtocol import BinaryCodec, createHello, parseHello
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta', '', ' ', 'x', 'yy', '\tz']
+
+
+def randomEdit(rand, lines):
+    """
+    Make a random edit to a document
+    :param rand: the random generator
+    :param lines: the lines of the document
+    :return: the edited lines
+    """
+    lines = list(lines)
+    for _ in range(rand.randint(1, 3)):
+        lines = lines or ['']
+        i = rand.randrange(len(lines))
+        action = rand.randrange(5)
+        if action == 0:
+            lines.insert(rand.randint(0, len(lines)), rand.choice(WORDS))
+        elif action == 1 and len(lines) > 1:
+            del lines[i:i + rand.randint(1, 3)]
+        elif action == 2:
+            column = rand.randint(0, len(lines[i]))
+            lines[i] = lines[i][:column] + rand.choice(WORDS) + lines[i][column:]
+        elif action == 3:
+            column = rand.randint(0, len(lines[i]))
+            lines[i] = lines[i][:column] + lines[i][column + rand.randint(1, 4):]
+        else:
+            # split a line in two
+            column = rand.randint(0, len(lines[i]))
+            lines[i:i + 1] = [lines[i][:column], lines[i][column:]]
+    return lines or ['']
+
+
+class ModelReplica(object):
+    """
+    A client replica exchanging operations with the model server through in-order queues
+    """
+
+    def __init__(self, name, lines):
+        self.name = name
+        self.document = DocumentStore(lines)
+        self.sync = ClientSync()
+        # The (ops, revision) sent and not received by the server yet
+        self.outgoing = []
+        # The (name, ops, revision) committed by the server and not received yet
+        self.incoming = []
+
+    def edit(self, rand):
+        lines = self.document.getLines()
+        ops = diffLines(lines, randomEdit(rand, lines))
+        applyOps(self.document, ops)
+        self.sync.addLocal(ops)
+
+    def send(self):
+        outgoing = self.sync.takeOutgoing()
+        if outgoing is not None:
+            self.outgoing.append(outgoing)
+
+    def receive(self):
+        name, ops, revision = self.incoming.pop(0)
+        if name == self.name:
+            self.sync.acknowledge(revision)
+        else:
+            applyOps(self.document, self.sync.receive(ops, revision))
+
+
+class ModelConvergenceTest(unittest.TestCase):
+    """
+    Random interleavings of ServerHistory and ClientSync, without the network
+    """
+
+    def runSession(self, seed, clients=3, steps=300):
+        rand = random.Random(seed)
+        initial = ['first line', 'second line']
+        server = DocumentStore(initial)
+        history = ServerHistory()
+        replicas = [ModelReplica(str(i), initial) for i in range(clients)]
+
+        def commit(replica):
+            ops, revision = replica.outgoing.pop(0)
+            ops = history.commit(ops, revision, replica.name)
+            self.assertIsNotNone(ops)
+            applyOps(server, ops)
+            for other in replicas:
+                other.incoming.append((replica.name, ops, history.revision))
+
+        for _ in range(steps):
+            replica = rand.choice(replicas)
+            action = rand.randrange(4)
+            if action == 0:
+                replica.edit(rand)
+            elif action == 1:
+                replica.send()
+            elif action == 2 and replica.outgoing:
+                commit(replica)
+            elif action == 3 and replica.incoming:
+                replica.receive()
+
+        # deliver everything, sending the edits waiting for an acknowledgement as it comes
+        while any(r.outgoing or r.incoming or r.sync.inflight is not None or r.sync.pending for r in replicas):
+            for replica in replicas:
+                replica.send()
+                while replica.outgoing:
+                    commit(replica)
+            for replica in replicas:
+                while replica.incoming:
+                    replica.receive()
+
+        for replica in replicas:
+            self.assertEqual(replica.document.getLines(), server.getLines(), 'seed ' + str(seed))
+
+    def testRandomInterleavings(self):
+        for seed in range(200):
+            self.runSession(seed)
+
+
+class SocketReplica(object):
+    """
+    A client replica connected to a Document through a socket pair, handling its messages the way EditorModel does
+    """
+
+    def __init__(self, test, document, name):
+        self.test = test
+        self.name = name
+        self.document = DocumentStore()
+        self.sync = ClientSync()
+        self.codec = BinaryCodec()
+        self.reader = FrameReader()
+        serverEnd, self.sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        # small socket buffers make the server queue frames for a client which does not read
+        serverEnd.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        serverEnd.setblocking(False)
+        self.sock.setblocking(False)
+        self.serverEnd = serverEnd
+        document.addConnection(serverEnd, parseHello(createHello(name, features=())))
+        self.connection = document.connections[serverEnd]
+
+    def edit(self, rand):
+        lines = self.document.getLines()
+        ops = diffLines(lines, randomEdit(rand, lines))
+        applyOps(self.document, ops)
+        self.sync.addLocal(ops)
+
+    def send(self):
+        outgoing = self.sync.takeOutgoing()
+        if outgoing is not None:
+            d = {'type': 'update', 'data': {'name': self.name, 'ops': outgoing[0], 'revision': outgoing[1]}}
+            self.sock.sendall(frame(self.codec.encode(d)))
+
+    def serve(self):
+        """
+        Let the server read what the client sent and send what the socket accepts
+        """
+        if not self.connection.closed:
+            self.connection.onReadable()
+            self.connection.onWritable()
+
+    def receive(self):
+        """
+        Handle everything the server sent so far
+        """
+        while True:
+            try:
+                received = self.reader.readFrom(self.sock)
+            except socket.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                if e.args[0] in WOULD_BLOCK:
+                    return
+                raise
+            self.test.assertTrue(received, 'the server closed the connection of ' + self.name)
+            for data in self.reader.frames():
+                self.__handle(self.codec.decode(data))
+            self.connection.onWritable()
+
+    def __handle(self, packet):
+        data = packet['data']
+        if packet['type'] == 'message':
+            if data['message_type'] == 'connect_success':
+                self.sync.reset(data['revision'])
+                if 'buffer' in data:
+                    self.document.setLines(data['buffer'])
+            elif data['message_type'] == 'resync':
+                self.sync.reset(data['revision'])
+                self.document.setLines(data['buffer'])
+        elif packet['type'] == 'update' and 'ops' in data and data['revision'] > self.sync.revision:
+            if data['name'] == self.name:
+                self.sync.acknowledge(data['revision'])
+            else:
+                applyOps(self.document, self.sync.receive(data['ops'], data['revision']))
+
+
+class DocumentConvergenceTest(unittest.TestCase):
+    """
+    Clients editing a Document through sockets, including clients too slow to receive which get resynchronized
+    """
+
+    def setUp(self):
+        self.limits = editorServer.QUEUE_SOFT_LIMIT, editorServer.QUEUE_HARD_LIMIT
+        editorServer.QUEUE_SOFT_LIMIT, editorServer.QUEUE_HARD_LIMIT = 1024, 4096
+        self.document = editorServer.Document('test', EventLoop(), logMessage=lambda message: None)
+        self.replicas = []
+
+    def tearDown(self):
+        editorServer.QUEUE_SOFT_LIMIT, editorServer.QUEUE_HARD_LIMIT = self.limits
+        for replica in self.replicas:
+            replica.sock.close()
+            replica.serverEnd.close()
+
+    def join(self, name):
+        replica = SocketReplica(self, self.document, name)
+        self.replicas.append(replica)
+        replica.receive()
+        return replica
+
+    def settle(self):
+        for _ in range(1000):
+            for replica in self.replicas:
+                replica.send()
+                replica.serve()
+            for replica in self.replicas:
+                replica.receive()
+            if all(r.sync.inflight is None and not r.sync.pending for r in self.replicas):
+                break
+        server = self.document.buffer.getLines()
+        for replica in self.replicas:
+            self.assertEqual(replica.document.getLines(), server, 'replica ' + replica.name)
+
+    def testResyncDropsEditsInFlight(self):
+        rand = random.Random(1)
+        slow = self.join('slow')
+        fast = self.join('fast')
+        for _ in range(5):
+            slow.edit(rand)
+            slow.send()
+            slow.serve()
+            slow.receive()
+        self.settle()
+
+        # the slow client's edits are still on their way to the server when it gets resynchronized
+        slow.edit(rand)
+        slow.send()
+        while slow.connection.resyncEntry is None:
+            fast.edit(rand)
+            fast.send()
+            fast.serve()
+            fast.receive()
+        slow.serve()
+        slow.receive()
+        self.assertIsNone(slow.sync.inflight)
+        self.settle()
+
+    def testRandomSessions(self):
+        resyncs = 0
+        for seed in range(20):
+            rand = random.Random(seed)
+            self.tearDown()
+            self.setUp()
+            for i in range(3):
+                self.join(str(i))
+            # the first client stops reading from time to time, until the server resynchronizes it
+            slow = self.replicas[0]
+            stalled = False
+            for _ in range(1000):
+                replica = rand.choice(self.replicas)
+                action = rand.randrange(3)
+                if action == 0:
+                    replica.edit(rand)
+                    replica.send()
+                elif action == 1:
+                    replica.serve()
+                elif not (stalled and replica is slow):
+                    replica.receive()
+                if slow.connection.resyncEntry is not None:
+                    resyncs += 1
+                    stalled = False
+                elif rand.random() < 0.02:
+                    stalled = True
+            self.settle()
+        self.assertTrue(resyncs)
+
+
+if __name__ == '__main__':
+    unittest.main()
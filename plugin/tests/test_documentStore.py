@@ -0,0 +1,79 @@
+"""
+Tests of the treap holding the lines of a document, against a plain list
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documentStore import CHUNK_SIZE, DocumentStore
+
+
+class DocumentStoreTest(unittest.TestCase):
+    """
+    Replacing ranges of lines in a document spanning several chunks
+    """
+
+    def assertStore(self, document, lines):
+        self.assertEqual(len(document), len(lines))
+        self.assertEqual(document.getLines(), lines)
+
+    def testEmpty(self):
+        document = DocumentStore()
+        self.assertStore(document, [])
+        self.assertEqual(document.getLines(3, 5), [])
+        self.assertRaises(IndexError, document.getLine, 0)
+        document.replaceLines(0, 0, ['a'])
+        self.assertStore(document, ['a'])
+        document.replaceLines(0, 1, [])
+        self.assertStore(document, [])
+
+    def testGetLine(self):
+        lines = [str(i) for i in range(5 * CHUNK_SIZE + 3)]
+        document = DocumentStore(lines)
+        for i in range(len(lines)):
+            self.assertEqual(document.getLine(i), lines[i])
+        self.assertEqual(document.getLine(-1), lines[-1])
+        self.assertRaises(IndexError, document.getLine, len(lines))
+        self.assertRaises(IndexError, document.getLine, -len(lines) - 1)
+
+    def testRangesAreClamped(self):
+        document = DocumentStore(['a', 'b', 'c'])
+        self.assertEqual(document.getLines(-5, 2), ['a', 'b'])
+        self.assertEqual(document.getLines(2, 100), ['c'])
+        self.assertEqual(document.getLines(2, 1), [])
+        document.replaceLines(2, 100, ['d'])
+        self.assertStore(document, ['a', 'b', 'd'])
+        document.replaceLines(10, 20, ['e'])
+        self.assertStore(document, ['a', 'b', 'd', 'e'])
+
+    def testSetLines(self):
+        document = DocumentStore(['a'])
+        lines = ['x'] * (3 * CHUNK_SIZE)
+        document.setLines(lines)
+        lines.append('not shared')
+        self.assertEqual(len(document), 3 * CHUNK_SIZE)
+        document.setLines([])
+        self.assertStore(document, [])
+
+    def testRandomReplacements(self):
+        rand = random.Random(0)
+        lines = ['line %d' % i for i in range(3 * CHUNK_SIZE)]
+        document = DocumentStore(lines)
+        for step in range(2000):
+            start = rand.randint(0, len(lines))
+            end = rand.randint(start, min(len(lines), start + rand.choice((0, 1, 5, 2 * CHUNK_SIZE))))
+            replacement = ['new %d.%d' % (step, i) for i in range(rand.choice((0, 1, 3, CHUNK_SIZE + 1)))]
+            document.replaceLines(start, end, replacement)
+            lines[start:end] = replacement
+            self.assertEqual(len(document), len(lines))
+            first = rand.randint(0, len(lines))
+            last = rand.randint(first, len(lines))
+            self.assertEqual(document.getLines(first, last), lines[first:last])
+        self.assertStore(document, lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Tests of the length-prefixed framing and of the reader handing out frames as views of its buffer
+"""
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from framing import FrameReader, frame, frameHeader
+
+
+def payloads(reader):
+    return [data.tobytes() for data in reader.frames()]
+
+
+class FrameReaderTest(unittest.TestCase):
+    """
+    Frames split and merged in every way by the reads are handed out whole
+    """
+
+    def testFrame(self):
+        self.assertEqual(frame(b'abc'), b'\x00\x00\x00\x03abc')
+        self.assertEqual(frameHeader(0x01020304), b'\x01\x02\x03\x04')
+        self.assertEqual(frame(b''), b'\x00\x00\x00\x00')
+
+    def testFramesFedByteByByte(self):
+        messages = [b'first', b'', b'x' * 300, b'last']
+        data = b''.join(frame(message) for message in messages)
+        reader = FrameReader(16)
+        received = []
+        for i in range(len(data)):
+            reader.feed(data[i:i + 1])
+            received.extend(payloads(reader))
+        self.assertEqual(received, messages)
+        self.assertEqual(payloads(reader), [])
+
+    def testSeveralFramesAtOnce(self):
+        reader = FrameReader()
+        reader.feed(frame(b'a') + frame(b'bc') + frame(b'def')[:5])
+        self.assertEqual(payloads(reader), [b'a', b'bc'])
+        reader.feed(frame(b'def')[5:])
+        self.assertEqual(payloads(reader), [b'def'])
+
+    def testGrowsToFitLargeFrames(self):
+        reader = FrameReader(64)
+        large = bytes(bytearray(range(256))) * 40
+        data = frame(large)
+        for i in range(0, len(data), 1000):
+            reader.feed(data[i:i + 1000])
+        self.assertEqual(payloads(reader), [large])
+        self.assertGreaterEqual(len(reader.buffer), len(data))
+
+    def testFramesHandedOutStayValid(self):
+        # frames are decoded before the next read, but a buffer grown meanwhile must not change them
+        reader = FrameReader(16)
+        reader.feed(frame(b'abcd') + frame(b'efgh' * 10)[:6])
+        view = next(reader.frames())
+        reader.feed(frame(b'efgh' * 10)[6:])
+        self.assertEqual(view.tobytes(), b'abcd')
+        self.assertEqual(payloads(reader), [b'efgh' * 10])
+
+    def testReadFromSocket(self):
+        left, right = socket.socketpair()
+        try:
+            reader = FrameReader(32)
+            left.sendall(frame(b'hello') + frame(b'y' * 5000))
+            received = []
+            while len(received) < 2:
+                self.assertTrue(reader.readFrom(right))
+                received.extend(payloads(reader))
+            self.assertEqual(received, [b'hello', b'y' * 5000])
+            left.close()
+            self.assertEqual(reader.readFrom(right), 0)
+        finally:
+            left.close()
+            right.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
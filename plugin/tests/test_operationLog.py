@@ -0,0 +1,93 @@
+"""
+Tests of the recovery of the document from the snapshot and the operation log
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from operationLog import LOG_FILE, OperationLog
+from operations import INSERT_LINES
+
+
+def insert(line, text):
+    return [[INSERT_LINES, line, [text]]]
+
+
+class OperationLogTest(unittest.TestCase):
+    """
+    Writing logs with an OperationLog, damaging them as a crash would and recovering them
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.messages = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self):
+        log = OperationLog(self.directory, syncInterval=0, logMessage=self.messages.append)
+        return log, log.recover()
+
+    def write(self, revisions):
+        """
+        Recover the log, append revisions and close it
+        :param revisions: the list of (revision, ops) to be appended
+        :return: what was recovered before appending
+        """
+        log, recovered = self.open()
+        for revision, ops in revisions:
+            log.append(revision, ops)
+        log.close()
+        return recovered
+
+    def recover(self):
+        log, recovered = self.open()
+        log.close()
+        return recovered
+
+    def appendToLog(self, data):
+        with open(os.path.join(self.directory, LOG_FILE), 'ab') as f:
+            f.write(data)
+
+    def testEmpty(self):
+        self.assertEqual(self.recover(), (0, []))
+
+    def testReplay(self):
+        self.write([(1, insert(0, 'a')), (2, insert(1, 'b'))])
+        self.assertEqual(self.recover(), (2, ['a', 'b']))
+
+    def testSnapshot(self):
+        log, recovered = self.open()
+        log.append(1, insert(0, 'a'))
+        log.snapshot(1, ['a'])
+        log.append(2, insert(1, 'b'))
+        log.close()
+        self.assertEqual(self.recover(), (2, ['a', 'b']))
+        # the log was emptied by the snapshot and only holds the second revision
+        self.assertTrue(0 < os.path.getsize(os.path.join(self.directory, LOG_FILE)) < 64)
+
+    def testTornTail(self):
+        self.write([(1, insert(0, 'a')), (2, insert(1, 'b'))])
+        # a crash in the middle of writing a record
+        self.appendToLog(b'\x00\x00\x00\x40\x12\x34')
+        self.assertEqual(self.write([(3, insert(2, 'c'))]), (2, ['a', 'b']))
+        self.assertEqual(self.recover(), (3, ['a', 'b', 'c']))
+        self.assertEqual(self.messages, [])
+
+    def testGap(self):
+        self.write([(1, insert(0, 'a')), (2, insert(1, 'b')), (4, insert(0, 'lost'))])
+        recovered = self.write([(3, insert(2, 'c')), (4, insert(3, 'd'))])
+        self.assertEqual(recovered, (2, ['a', 'b']))
+        self.assertEqual(self.messages, ['Operation log is missing revision 3, ignoring the rest of it'])
+        # the records after the gap were dropped, so the new ones are recovered
+        self.assertEqual(self.recover(), (4, ['a', 'b', 'c', 'd']))
+        self.assertEqual(len(self.messages), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Tests of the columns of text operations on lines with non-ASCII text: python 2 processes hold lines as UTF-8 bytes
+and python 3 ones as str, the columns on the wire count code points for both.
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documentStore import DocumentStore
+from operations import INSERT_TEXT, DELETE_TEXT, PY2, applyOps, textLength, transform
+from textDiff import diffLines, diffText
+from wireProtocol import BinaryCodec, JsonCodec
+
+OLD = u'caf\u00e9 \u00fcber na\u00efve'
+NEW = u'caf\u00e9s \u00fcber \u2603 na\u00efve'
+
+
+def _unicode(text):
+    return text
+
+
+def _utf8(text):
+    return text.encode('utf-8')
+
+
+# the string types lines may have in a process
+STRING_TYPES = [_unicode, _utf8] if PY2 else [_unicode]
+
+
+def _received(text):
+    """
+    Convert text to the string type the codecs decode to, UTF-8 bytes on python 2
+    """
+    return text.encode('utf-8') if PY2 else text
+
+
+def _decoded(text):
+    """
+    Convert text to unicode
+    """
+    return text.decode('utf-8') if PY2 and isinstance(text, str) else text
+
+
+class TextColumnTest(unittest.TestCase):
+    """
+    Diffing, encoding, applying and transforming text operations on non-ASCII lines
+    """
+
+    def testTextLength(self):
+        for encode in STRING_TYPES:
+            self.assertEqual(textLength(encode(OLD)), 15)
+
+    def testDiffCountsCodePoints(self):
+        expected = [[INSERT_TEXT, 0, 4, u's'], [INSERT_TEXT, 0, 10, u' \u2603']]
+        for encode in STRING_TYPES:
+            ops = diffText(0, encode(OLD), encode(NEW))
+            self.assertEqual([op[:3] + [_decoded(op[3])] for op in ops], expected)
+        ops = diffText(0, NEW, OLD)
+        self.assertEqual(ops, [[DELETE_TEXT, 0, 4, 1], [DELETE_TEXT, 0, 9, 2]])
+
+    def testApplyAcrossStringTypes(self):
+        # the ops of a client holding either string type are applied to the lines of the type the codecs decode to
+        for codec in (BinaryCodec(), JsonCodec()):
+            for sent in STRING_TYPES:
+                for old, new in ((OLD, NEW), (NEW, OLD)):
+                    ops = diffLines([sent(old), sent(u'\u00e9')], [sent(new), sent(u'')])
+                    packet = codec.decode(codec.encode({'type': 'update', 'data': {'ops': ops}}))
+                    document = DocumentStore([_received(old), _received(u'\u00e9')])
+                    applyOps(document, packet['data']['ops'])
+                    self.assertEqual([_decoded(line) for line in document.getLines()], [new, u''])
+
+    def testConcurrentEditsConverge(self):
+        a = [[INSERT_TEXT, 0, 5, u'\u00e0 ']]
+        b = [[DELETE_TEXT, 0, 3, 2], [INSERT_TEXT, 0, 12, u'\u00df']]
+        for encode in STRING_TYPES:
+            def native(ops):
+                return [op[:3] + [encode(op[3]) if op[0] == INSERT_TEXT else op[3]] for op in ops]
+            aPrime, bPrime = transform(native(a), native(b))
+            first = DocumentStore([encode(OLD)])
+            applyOps(first, native(a))
+            applyOps(first, bPrime)
+            second = DocumentStore([encode(OLD)])
+            applyOps(second, native(b))
+            applyOps(second, aPrime)
+            self.assertEqual(first.getLines(), second.getLines())
+            self.assertEqual(_decoded(first.getLine(0)), u'caf\u00e0 \u00fcber na\u00efv\u00dfe')
+
+    def testInvalidUtf8CountsBytes(self):
+        if not PY2:
+            return
+        # lines which are not UTF-8 still edit in place, one column per byte
+        old, new = b'caf\xe9', b'caf\xe9s'
+        ops = diffText(0, old, new)
+        self.assertEqual(ops, [[INSERT_TEXT, 0, 4, b's']])
+        document = DocumentStore([old])
+        applyOps(document, ops)
+        self.assertEqual(document.getLines(), [new])
+        ops = diffText(0, b'caf\xc3\xa9', new)
+        document = DocumentStore([b'caf\xc3\xa9'])
+        applyOps(document, ops)
+        self.assertEqual(document.getLines(), [new])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""
+Tests of the diff turning the local changes of a buffer into edit operations
+"""
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import textDiff
+from documentStore import DocumentStore
+from operations import INSERT_LINES, DELETE_LINES, INSERT_TEXT, DELETE_TEXT, applyOps
+from textDiff import diffLines, diffText
+
+
+def apply(lines, ops):
+    document = DocumentStore(lines)
+    applyOps(document, ops)
+    return document.getLines()
+
+
+def edit(rand, lines):
+    """
+    Make a few random line and character edits, as a user between two updates would
+    """
+    lines = list(lines)
+    for _ in range(rand.randint(1, 4)):
+        i = rand.randint(0, len(lines))
+        action = rand.random()
+        if action < 0.2:
+            lines[i:i] = ['added %d' % rand.randint(0, 99) for _ in range(rand.randint(1, 3))]
+        elif action < 0.4:
+            del lines[i:i + rand.randint(1, 3)]
+        elif i < len(lines):
+            text = lines[i]
+            col = rand.randint(0, len(text))
+            lines[i] = text[:col] + rand.choice(('', 'x', 'yz ')) + text[col + rand.randint(0, 3):]
+    return lines
+
+
+class DiffTest(unittest.TestCase):
+    """
+    Applying the diff of two versions to the first one gives the second one, with few operations
+    """
+
+    def testInsertedText(self):
+        self.assertEqual(diffText(4, 'hello world', 'hello big world'), [[INSERT_TEXT, 4, 6, 'big ']])
+        self.assertEqual(diffText(0, '', 'abc'), [[INSERT_TEXT, 0, 0, 'abc']])
+
+    def testDeletedText(self):
+        self.assertEqual(diffText(2, 'hello big world', 'hello world'), [[DELETE_TEXT, 2, 6, 4]])
+        self.assertEqual(diffText(0, 'same', 'same'), [])
+
+    def testReplacedText(self):
+        ops = diffText(0, 'the cat sat', 'the dog sat')
+        self.assertEqual(apply(['the cat sat'], ops), ['the dog sat'])
+        self.assertEqual(sum(op[3] if op[0] == DELETE_TEXT else len(op[3]) for op in ops), 6)
+
+    def testLines(self):
+        old = ['a', 'b', 'c', 'd']
+        self.assertEqual(diffLines(old, ['a', 'x', 'y', 'b', 'c', 'd']), [[INSERT_LINES, 1, ['x', 'y']]])
+        self.assertEqual(diffLines(old, ['a', 'd']), [[DELETE_LINES, 1, 2]])
+        self.assertEqual(diffLines(old, ['a', 'bb', 'c', 'd']), [[INSERT_TEXT, 1, 1, 'b']])
+        self.assertEqual(diffLines(old, old), [])
+
+    def testFirstLine(self):
+        # a range of the document starting at line 10
+        self.assertEqual(diffLines(['a', 'b'], ['a', 'x', 'b'], 10), [[INSERT_LINES, 11, ['x']]])
+        self.assertEqual(diffLines(['a', 'b'], ['a', 'bc'], 10), [[INSERT_TEXT, 11, 1, 'c']])
+
+    def testRandomEdits(self):
+        rand = random.Random(0)
+        lines = ['line %d of the test' % i for i in range(30)]
+        for _ in range(500):
+            edited = edit(rand, lines)
+            self.assertEqual(apply(lines, diffLines(lines, edited)), edited)
+            lines = edited
+
+    def testCostlyDiffsStillApply(self):
+        rand = random.Random(1)
+        old = ''.join(rand.choice('ab') for _ in range(3 * textDiff.MAX_CHAR_COST))
+        new = ''.join(rand.choice('ab') for _ in range(3 * textDiff.MAX_CHAR_COST))
+        self.assertEqual(apply([old], diffText(0, old, new)), [new])
+        oldLines = [str(i) for i in range(3 * textDiff.MAX_LINE_COST)]
+        newLines = [str(i) for i in range(1, 6 * textDiff.MAX_LINE_COST, 2)]
+        self.assertEqual(apply(oldLines, diffLines(oldLines, newLines)), newLines)
+
+
+if __name__ == '__main__':
+    unittest.main()
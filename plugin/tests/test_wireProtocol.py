@@ -0,0 +1,195 @@
+"""
+Tests of the codecs and the hello: varints, session ids, compressed chunks, batches and malformed frames
+"""
+import os
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from operations import INSERT_LINES, DELETE_LINES, INSERT_TEXT, DELETE_TEXT
+from wireProtocol import BINARY, DEFAULT_DOCUMENT, HELLO_MAGIC, JSON, MALFORMED_FRAME_ERRORS, PY2, T_ZLINES, \
+    BinaryCodec, JsonCodec, createHello, isBinary, parseHello
+
+
+def _text(text):
+    """
+    Convert text to the string type the codecs decode to, UTF-8 bytes on python 2
+    """
+    return text.encode('utf-8') if PY2 else text
+
+
+class BinaryCodecTest(unittest.TestCase):
+    """
+    Packets encoded with the binary codec are decoded back to the same values
+    """
+
+    def roundTrip(self, packet, codec=None):
+        codec = codec or BinaryCodec()
+        return codec.decode(codec.encode(packet))
+
+    def testIntegers(self):
+        # varints of one to several bytes, negative numbers being zigzag encoded
+        values = [0, 1, -1, 63, -64, 64, 127, 128, 255, 300, 16383, 16384, -16385, 2 ** 31, -2 ** 31, 2 ** 53 + 1]
+        packet = {'type': 'update', 'data': {'revision': 0, 'values': values}}
+        self.assertEqual(self.roundTrip(packet), packet)
+        for value in values:
+            self.assertEqual(self.roundTrip({'x': value}), {'x': value})
+
+    def testVarintSizes(self):
+        codec = BinaryCodec()
+        size = len(codec.encode({'revision': 0}))
+        self.assertEqual(len(codec.encode({'revision': 63})), size)
+        self.assertEqual(len(codec.encode({'revision': 64})), size + 1)
+        self.assertEqual(len(codec.encode({'revision': 8191})), size + 1)
+        self.assertEqual(len(codec.encode({'revision': 8192})), size + 2)
+
+    def testValues(self):
+        packet = {'type': 'message', 'data': {'message_type': 'connect_success', 'resumed': True, 'token': None,
+                                              'users': [{'name': 'alice', 'cursor': {'x': 1, 'y': 2}}],
+                                              'unknown_field': [1, 'two', False, [], {}],
+                                              'buffer': [_text(u'caf\u00e9'), _text(''), _text('\t')]}}
+        self.assertEqual(self.roundTrip(packet), packet)
+
+    def testUnknownConstantsStayStrings(self):
+        packet = {'type': 'message', 'data': {'message_type': 'from_a_newer_server'}}
+        self.assertEqual(self.roundTrip(packet), packet)
+
+    def testOps(self):
+        ops = [[INSERT_LINES, 3, [_text('a'), _text(u'\u2603')]], [DELETE_LINES, 0, 2],
+               [INSERT_TEXT, 70000, 5, _text(u'\u00e9t\u00e9')], [DELETE_TEXT, 1, 300, 4]]
+        packet = {'type': 'update', 'data': {'name': 'alice', 'ops': ops, 'revision': 12}}
+        self.assertEqual(self.roundTrip(packet), packet)
+
+    def testSessionIds(self):
+        server = BinaryCodec()
+        client = BinaryCodec()
+        server.addSession(5, 'alice')
+        # the client learns the session id from the dictionary introducing the user
+        introduction = {'type': 'message', 'data': {'message_type': 'user_connected',
+                                                    'user': {'name': 'alice', 'id': 5, 'cursor': {'x': 1, 'y': 1}}}}
+        self.assertEqual(client.decode(server.encode(introduction)), introduction)
+
+        update = {'type': 'update', 'data': {'name': 'alice', 'cursor': {'x': 3, 'y': 4}}}
+        encoded = server.encode(update)
+        self.assertLess(len(encoded), len(BinaryCodec().encode(update)))
+        self.assertEqual(client.decode(encoded), update)
+
+        # names are only replaced in updates, and only for known users
+        message = {'type': 'message', 'data': {'message_type': 'user_disconnected', 'name': 'alice'}}
+        self.assertEqual(server.encode(message), BinaryCodec().encode(message))
+        self.assertEqual(client.decode(server.encode({'type': 'update', 'data': {'name': 'bob'}})),
+                         {'type': 'update', 'data': {'name': 'bob'}})
+
+        server.removeSession('alice')
+        server.removeSession('alice')
+        self.assertEqual(server.encode(update), BinaryCodec().encode(update))
+
+    def testUnknownSessionIsMalformed(self):
+        server = BinaryCodec()
+        server.addSession(9, 'ghost')
+        encoded = server.encode({'type': 'update', 'data': {'name': 'ghost'}})
+        self.assertRaises(MALFORMED_FRAME_ERRORS, BinaryCodec().decode, encoded)
+
+    def testCompressedChunks(self):
+        lines = [_text(u'line %d of the document \u00e9' % i) for i in range(2000)]
+        packet = {'type': 'message', 'data': {'message_type': 'sync_chunk', 'start': 100, 'chunk': lines}}
+        encoded = BinaryCodec().encode(packet)
+        self.assertIn(T_ZLINES, bytearray(encoded[:40]))
+        self.assertLess(len(encoded), len(BinaryCodec().encode({'buffer': lines})) // 4)
+        self.assertEqual(self.roundTrip(packet), packet)
+
+    def testCorruptedChunkIsMalformed(self):
+        encoded = bytearray(BinaryCodec().encode({'chunk': [_text('some line')] * 100}))
+        encoded[-3] ^= 0xff
+        self.assertRaises(MALFORMED_FRAME_ERRORS, BinaryCodec().decode, bytes(encoded))
+        self.assertTrue(issubclass(zlib.error, MALFORMED_FRAME_ERRORS))
+
+    def testTruncatedFramesAreMalformed(self):
+        encoded = BinaryCodec().encode({'type': 'update', 'data': {'name': 'a', 'ops': [[INSERT_LINES, 0, ['x']]],
+                                                                   'revision': 300}})
+        for end in range(2, len(encoded)):
+            self.assertRaises(MALFORMED_FRAME_ERRORS, BinaryCodec().decode, encoded[:end])
+        self.assertRaises(MALFORMED_FRAME_ERRORS, BinaryCodec().decode, b'\x02\x00')
+
+    def testTruncatedStringsAreMalformed(self):
+        codec = BinaryCodec()
+        for packet in ({'type': 'update', 'data': {'name': 'alice'}},
+                       {'type': 'update', 'data': {'buffer': ['one', 'two']}},
+                       {'type': 'update', 'data': {'ops': [[INSERT_TEXT, 0, 0, 'text']]}}):
+            encoded = codec.encode(packet)
+            self.assertRaises(MALFORMED_FRAME_ERRORS, codec.decode, encoded[:-1])
+            self.assertRaises(MALFORMED_FRAME_ERRORS, codec.decode, encoded + b'\x00')
+        batch = b''.join(codec.encodeBatch([codec.encode({'type': 'update', 'data': {'name': 'alice'}})]))
+        self.assertRaises(MALFORMED_FRAME_ERRORS, codec.decode, batch[:-1])
+
+    def testBatch(self):
+        codec = BinaryCodec()
+        packets = [{'type': 'update', 'data': {'revision': i}} for i in range(3)]
+        batch = b''.join(codec.encodeBatch([codec.encode(packet) for packet in packets]))
+        self.assertEqual(codec.decode(batch), {'type': 'batch', 'data': packets})
+
+    def testDecodesViews(self):
+        codec = BinaryCodec()
+        packet = {'type': 'update', 'data': {'revision': 7, 'ops': [[INSERT_TEXT, 0, 0, _text('x')]]}}
+        encoded = codec.encode(packet)
+        buffer = bytearray(b'..' + encoded + b'..')
+        self.assertEqual(codec.decode(memoryview(buffer)[2:-2]), packet)
+        self.assertEqual(codec.decode(bytearray(encoded)), packet)
+
+
+class JsonCodecTest(unittest.TestCase):
+    """
+    The codec of the older clients
+    """
+
+    def testRoundTrip(self):
+        codec = JsonCodec()
+        packet = {'type': 'update', 'data': {'name': 'alice', 'buffer': [_text(u'caf\u00e9')], 'revision': 3}}
+        encoded = codec.encode(packet)
+        self.assertFalse(isBinary(encoded))
+        self.assertEqual(codec.decode(encoded), packet)
+        self.assertEqual(codec.decode(memoryview(bytearray(encoded))), packet)
+
+    def testBatch(self):
+        codec = JsonCodec()
+        packets = [{'type': 'update', 'data': {'revision': i}} for i in range(3)]
+        batch = b''.join(codec.encodeBatch([codec.encode(packet) for packet in packets]))
+        self.assertEqual(codec.decode(batch), {'type': 'batch', 'data': packets})
+
+
+class HelloTest(unittest.TestCase):
+    """
+    The first frame of a connection, with the legacy one holding only the name
+    """
+
+    def testRoundTrip(self):
+        hello = parseHello(createHello('alice', document='notes', token='abc', revision=42))
+        self.assertEqual(hello['name'], 'alice')
+        self.assertEqual(hello['codecs'], [BINARY, JSON])
+        self.assertEqual(hello['document'], 'notes')
+        self.assertEqual((hello['token'], hello['revision']), ('abc', 42))
+        self.assertTrue(isBinary(BinaryCodec().encode({})))
+
+    def testDefaults(self):
+        hello = parseHello(createHello('alice', features=()))
+        self.assertEqual(hello['features'], [])
+        self.assertEqual(hello['document'], DEFAULT_DOCUMENT)
+        self.assertNotIn('token', hello)
+
+    def testLegacyHello(self):
+        hello = parseHello(b'alice')
+        self.assertEqual(hello, {'name': 'alice', 'codecs': [JSON], 'features': [], 'document': DEFAULT_DOCUMENT})
+
+    def testMalformedHello(self):
+        for data in (HELLO_MAGIC + BinaryCodec().encode({'name': 3, 'codecs': []}),
+                     HELLO_MAGIC + BinaryCodec().encode({'name': 'alice', 'codecs': 'binary/1'}),
+                     HELLO_MAGIC + BinaryCodec().encode({'name': 'alice', 'codecs': [], 'document': 1}),
+                     HELLO_MAGIC + BinaryCodec().encode({}),
+                     createHello('alice')[:-3]):
+            self.assertRaises(MALFORMED_FRAME_ERRORS, parseHello, data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+from operations import INSERT_LINES, DELETE_LINES, INSERT_TEXT, DELETE_TEXT, decodeText
+
+# Edit distances above which the diff gives up on minimality and replaces the whole changed region
+MAX_LINE_COST = 1000
+MAX_CHAR_COST = 200
+
+
+def _myers(a, b, maxCost):
+    """
+    Myers' O(ND) difference algorithm
+    :param a: the old sequence
+    :param b: the new sequence
+    :param maxCost: the maximum number of inserted and deleted elements to look for
+    :return: the list of (tag, i1, i2, j1, j2) opcodes turning a into b, tag being 'equal', 'delete' or 'insert',
+             or None if the sequences differ by more than maxCost elements
+    """
+    n, m = len(a), len(b)
+    offset = n + m + 1
+    v = [0] * (2 * offset + 1)
+    trace = []
+    for d in range(min(n + m, maxCost) + 1):
+        # only diagonals -d-1 to d+1 can be read when backtracking from round d
+        trace.append(v[offset - d - 1:offset + d + 2])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _backtrack(trace, n, m)
+    return None
+
+
+def _backtrack(trace, n, m):
+    """
+    Recover the opcodes from the furthest reaching paths recorded by _myers
+    """
+    moves = []
+    x, y = n, m
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        base = d + 1
+        k = x - y
+        if k == -d or (k != d and v[base + k - 1] < v[base + k + 1]):
+            prevK = k + 1
+        else:
+            prevK = k - 1
+        prevX = v[base + prevK]
+        prevY = prevX - prevK
+        while x > prevX and y > prevY:
+            moves.append('equal')
+            x -= 1
+            y -= 1
+        if d > 0:
+            moves.append('delete' if x > prevX else 'insert')
+            x, y = prevX, prevY
+    moves.reverse()
+
+    opcodes = []
+    i = j = 0
+    for move in moves:
+        i2 = i + (move != 'insert')
+        j2 = j + (move != 'delete')
+        if opcodes and opcodes[-1][0] == move:
+            opcodes[-1][2] = i2
+            opcodes[-1][4] = j2
+        else:
+            opcodes.append([move, i, i2, j, j2])
+        i, j = i2, j2
+    return opcodes
+
+
+def _trim(a, b):
+    """
+    Get the lengths of the common prefix and suffix of two sequences
+    """
+    n = min(len(a), len(b))
+    prefix = 0
+    while prefix < n and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < n - prefix and a[len(a) - 1 - suffix] == b[len(b) - 1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+def _hunks(a, b, maxCost):
+    """
+    Get the changed regions between two sequences
+    :return: the list of (i1, i2, j1, j2) regions where a[i1:i2] was replaced by b[j1:j2]
+    """
+    prefix, suffix = _trim(a, b)
+    middleA = a[prefix:len(a) - suffix]
+    middleB = b[prefix:len(b) - suffix]
+    if not middleA and not middleB:
+        return []
+    opcodes = _myers(middleA, middleB, maxCost)
+    if opcodes is None:
+        return [(prefix, prefix + len(middleA), prefix, prefix + len(middleB))]
+
+    # merge adjacent deletions and insertions into replaced regions
+    hunks = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            continue
+        if hunks and hunks[-1][1] == prefix + i1 and hunks[-1][3] == prefix + j1:
+            hunks[-1][1] = prefix + i2
+            hunks[-1][3] = prefix + j2
+        else:
+            hunks.append([prefix + i1, prefix + i2, prefix + j1, prefix + j2])
+    return hunks
+
+
+def diffText(line, old, new):
+    """
+    Create the operations turning one version of a line into another
+    :param line: the 0-based line number
+    :param old: the old text of the line
+    :param new: the new text of the line
+    :return: the list of operations
+    """
+    ops = []
+    # columns count code points, the inserted text keeping the string type of the lines
+    old, oldEncoding = decodeText(old)
+    new, encoding = decodeText(new)
+    if oldEncoding != encoding:
+        # the columns of a line which became valid UTF-8 or stopped being so do not match, it is replaced
+        hunks = [(0, len(old), 0, len(new))]
+    else:
+        hunks = _hunks(old, new, MAX_CHAR_COST)
+    for i1, i2, j1, j2 in hunks:
+        # earlier hunks have already been applied, so new positions are used
+        if i2 > i1:
+            ops.append([DELETE_TEXT, line, j1, i2 - i1])
+        if j2 > j1:
+            text = new[j1:j2]
+            ops.append([INSERT_TEXT, line, j1, text if encoding is None else text.encode(encoding)])
+    return ops
+
+
+def diffLines(old, new, first=0):
+    """
+    Create the operations turning one version of a document into another, diffing lines first and then the
+    characters of the lines replaced one for one
+    :param old: the old list of lines
+    :param new: the new list of lines
+    :param first: the line number of the first line of both lists, when they are a range of the document
+    :return: the list of operations
+    """
+    ops = []
+    for i1, i2, j1, j2 in _hunks(old, new, MAX_LINE_COST):
+        paired = min(i2 - i1, j2 - j1)
+        for p in range(paired):
+            ops.extend(diffText(first + j1 + p, old[i1 + p], new[j1 + p]))
+        if i2 - i1 > paired:
+            ops.append([DELETE_LINES, first + j1 + paired, i2 - i1 - paired])
+        if j2 - j1 > paired:
+            ops.append([INSERT_LINES, first + j1 + paired, new[j1 + paired:j2]])
+    return ops
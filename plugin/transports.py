@@ -0,0 +1,133 @@
+"""
+Transports carrying the frames between the clients and the server: TCP, and Unix domain sockets and socket pairs
+for clients on the same machine as the server, which skip the loopback TCP stack.
+
+An address is a (host, port) tuple for TCP, or the absolute path of a Unix domain socket.
+"""
+import errno
+import os
+import socket
+
+
+class TcpTransport(object):
+    """
+    TCP sockets
+    """
+    __slots__ = ()
+
+    family = socket.AF_INET
+
+    def bind(self, sock, address):
+        sock.bind(address)
+
+    def configure(self, sock):
+        """
+        Set the options of a connected socket
+        :param sock: the socket
+        :return: None
+        """
+        # small frames are not held back waiting for the acknowledgement of the previous ones
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def remove(self, address):
+        pass
+
+
+class UnixTransport(object):
+    """
+    Unix domain sockets, bound to a path
+    """
+    __slots__ = ()
+
+    family = getattr(socket, 'AF_UNIX', None)
+
+    def bind(self, sock, address):
+        if os.path.exists(address):
+            # left behind by a server which did not stop cleanly
+            os.unlink(address)
+        sock.bind(address)
+
+    def configure(self, sock):
+        pass
+
+    def remove(self, address):
+        """
+        Remove the path of a closed listening socket
+        :param address: the path
+        :return: None
+        """
+        try:
+            os.unlink(address)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+TCP = TcpTransport()
+UNIX = UnixTransport()
+
+
+def transportFor(address):
+    """
+    Get the transport of an address
+    :param address: a (host, port) tuple or the path of a Unix domain socket
+    :return: the transport
+    """
+    if isinstance(address, tuple):
+        return TCP
+    if UNIX.family is None:
+        raise socket.error(errno.EAFNOSUPPORT, 'Unix domain sockets are not supported on this platform')
+    return UNIX
+
+
+def transportOf(sock):
+    """
+    Get the transport of a socket
+    :param sock: the socket
+    :return: the transport
+    """
+    return UNIX if UNIX.family is not None and sock.family == UNIX.family else TCP
+
+
+def listen(address, backlog=128):
+    """
+    Create a non-blocking socket listening on an address
+    :param address: the address
+    :param backlog: the maximum number of pending connection requests
+    :return: the listening socket
+    """
+    transport = transportFor(address)
+    sock = socket.socket(transport.family, socket.SOCK_STREAM)
+    try:
+        transport.bind(sock, address)
+        sock.listen(backlog)
+    except socket.error:
+        sock.close()
+        raise
+    sock.setblocking(False)
+    return sock
+
+
+def connect(address):
+    """
+    Open a connection
+    :param address: the address of the server
+    :return: the connected socket
+    """
+    transport = transportFor(address)
+    sock = socket.socket(transport.family, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except socket.error:
+        sock.close()
+        raise
+    transport.configure(sock)
+    return sock
+
+
+def socketPair():
+    """
+    Create a pair of connected sockets, for a client running in the server's process
+    :return: the server's end and the client's end
+    """
+    return socket.socketpair(UNIX.family, socket.SOCK_STREAM)
@@ -1,13 +1,18 @@
 import vim
+from hostServer import startServerProcess, startServerThread
 from iPlatform import *
 
-# The server path
-serverPath = vim.eval('expand("<sfile>:h")') + '/editorServer.py'
-
 class VimPlatform(IPlatform):
     """
     The vim platform
     """
+    def __init__(self):
+        """
+        Initializer
+        """
+        # Id of the vim timer calling the controller, None when stopped
+        self.timer = None
+
     def getApplicationName(self):
         return "TeamEditor"
 
@@ -17,5 +22,21 @@ class VimPlatform(IPlatform):
     def getDefaultPort(self):
         return vim.eval('TeamEditor_default_port')
 
-    def runServer(self, port):
-        vim.command(':silent execute "!python ' + serverPath + ' ' + port + ' &>/dev/null &" | redraw!')
+    def getSendIntervals(self):
+        return float(vim.eval('TeamEditor_min_send_ms')) / 1000, float(vim.eval('TeamEditor_max_send_ms')) / 1000
+
+    def runServer(self, port, unixPath):
+        if vim.eval('TeamEditor_host_mode') == 'thread':
+            return startServerThread(port, unixPath)
+        return startServerProcess(port, unixPath)
+
+    def startTimer(self, interval):
+        if vim.eval('has("timers")') == '0':
+            return False
+        self.timer = vim.eval('timer_start(' + str(int(interval * 1000)) + ', "TeamEditor#Tick", {"repeat": -1})')
+        return True
+
+    def stopTimer(self):
+        if self.timer is not None:
+            vim.command(':call timer_stop(' + self.timer + ')')
+            self.timer = None
@@ -18,7 +18,7 @@ class VimUI(IEditorView):
         vim.current.window.cursor = (y, x)
 
     def setCursorColors(self):
-        vim.command('call SetCursorColors()')
+        vim.command('call TeamEditor#SetCursorColors()')
 
     def getCurrentBuffer(self):
         return vim.current.buffer[:]
@@ -26,6 +26,28 @@ class VimUI(IEditorView):
     def setCurrentBuffer(self, buffer):
         vim.current.buffer[:] = buffer
 
+    def getLines(self, start, end):
+        return vim.current.buffer[start:end]
+
+    def getLineCount(self):
+        return len(vim.current.buffer)
+
+    def replaceLines(self, start, end, lines):
+        vim.current.buffer[start:end] = lines
+
+    def getChangeTick(self):
+        return int(vim.eval('b:changedtick'))
+
+    def watchChanges(self):
+        return vim.eval('TeamEditor#WatchChanges()') == '1'
+
+    def unwatchChanges(self):
+        vim.command('call TeamEditor#UnwatchChanges()')
+
+    def takeChanges(self):
+        return [(int(start) - 1, int(end) - 1, int(added))
+                for start, end, added in vim.eval('TeamEditor#TakeChanges()')]
+
     def printError(self, error):
         print('ERROR: ' + str(error))
 
@@ -42,12 +64,16 @@ class VimUI(IEditorView):
         return 11
 
     def addCursor(self, cursorId, cursorColor, x, y):
-        vim.command(':call matchadd(\'' + str(cursorColor) + '\', \'\%' + str(x) + 'v.\%' + str(y) + 'l\', 10, ' + \
-                    str(cursorId + 3) + ')')
+        self.updateCursors([(cursorId, cursorColor, x, y)])
 
     def removeCursor(self, cursorId):
         vim.command(':call matchdelete(' + str(cursorId + 3) + ')')
 
     def updateCursor(self, cursorId, cursorColor, x, y):
-        self.removeCursor(cursorId)
-        self.addCursor(cursorId, cursorColor, x, y)
\ No newline at end of file
+        self.updateCursors([(cursorId, cursorColor, x, y)])
+
+    def updateCursors(self, cursors):
+        # a single vim call moving every cursor, given as (cursorId, cursorColor, x, y) tuples
+        vim.command(':call TeamEditor#UpdateCursors([' + ','.join('[' + str(cursorId + 3) + ',\'' + str(cursorColor) + '\',' +
+                                                       str(x) + ',' + str(y) + ']'
+                                                       for cursorId, cursorColor, x, y in cursors) + '])')
@@ -0,0 +1,540 @@
+import json
+import sys
+import zlib
+
+from operations import INSERT_LINES, DELETE_LINES, INSERT_TEXT
+
+PY2 = sys.version_info[0] == 2
+
+# Prefix of the first frame of a client announcing its name and supported codecs.
+# Older clients send their bare name instead.
+HELLO_MAGIC = b'\x00TE\x01'
+
+# Codec names, in order of preference
+BINARY = 'binary/1'
+JSON = 'json'
+
+# Version byte starting every binary frame
+BINARY_VERSION = 1
+
+# Kinds of binary frames
+KIND_PACKET = 0
+KIND_BATCH = 1
+
+# Value tags of the binary encoding
+T_NONE = 0
+T_FALSE = 1
+T_TRUE = 2
+T_INT = 3
+T_STR = 4
+T_LIST = 5
+T_DICT = 6
+T_LINES = 7
+T_SESSION = 8
+T_CONST = 9
+T_OPS = 10
+T_ZLINES = 11
+
+# Dictionary keys encoded as integer field ids. Entries may only be appended.
+FIELDS = ['type', 'data', 'message_type', 'name', 'id', 'users', 'user', 'cursor', 'x', 'y', 'buffer', 'start', 'end',
+          'change_y', 'change_x', 'buffer_size', 'updated_cursors', 'codecs', 'ops', 'revision',
+          'features', 'chunk', 'document', 'token', 'resumed', 'backed_up']
+FIELD_IDS = dict((field, i + 1) for i, field in enumerate(FIELDS))
+
+# Packet and message types encoded as integer op codes. Entries may only be appended.
+CONSTANTS = ['message', 'update', 'batch', 'connect_success', 'user_connected', 'user_disconnected', 'resync',
+             'sync_chunk', 'backpressure']
+CONSTANT_IDS = dict((constant, i) for i, constant in enumerate(CONSTANTS))
+
+# Fields whose values are op codes
+CONSTANT_FIELDS = ('type', 'message_type')
+
+# Fields whose lines are compressed
+COMPRESSED_FIELDS = ('chunk',)
+
+# zlib compression level of compressed fields, favouring speed as they are compressed on the event loop
+COMPRESSION_LEVEL = 1
+
+# Optional features announced in the hello
+CHUNKED_SYNC = 'chunked_sync'
+BACKPRESSURE = 'backpressure'
+
+# Document edited by the clients not naming one in their hello
+DEFAULT_DOCUMENT = 'default'
+
+# Packet types refering to users by session id. Users are introduced by name and session id in the others.
+SESSION_PACKET_TYPES = ('update',)
+
+# Errors raised by decoding or handling a malformed frame, which close the connection that sent it
+MALFORMED_FRAME_ERRORS = (ValueError, IndexError, KeyError, TypeError, AttributeError, zlib.error)
+
+if PY2:
+    _stringTypes = (str, unicode)
+    _intTypes = (int, long)
+else:
+    _stringTypes = (str,)
+    _intTypes = (int,)
+
+
+def _asBytes(data):
+    """
+    Convert a received frame, possibly a memoryview of the receive buffer, to bytes
+    """
+    return data.tobytes() if isinstance(data, memoryview) else bytes(data)
+
+
+def _toStr(data):
+    """
+    Convert received bytes to the native string type
+    """
+    return _asBytes(data) if PY2 else _asBytes(data).decode('utf-8')
+
+
+def _toBytes(string):
+    """
+    Convert a string to UTF-8 bytes
+    """
+    if PY2:
+        return string.encode('utf-8') if isinstance(string, unicode) else string
+    return string.encode('utf-8') if isinstance(string, str) else bytes(string)
+
+
+def createHello(name, codecs=(BINARY, JSON), features=(CHUNKED_SYNC, BACKPRESSURE), document=None, token=None,
+                revision=0):
+    """
+    Create the first frame sent by a client
+    :param name: the user name
+    :param codecs: the names of the codecs supported by the client, in order of preference
+    :param features: the optional features supported by the client
+    :param document: the name of the document to be edited, None for the default one
+    :param token: the session token given by the server on a previous connection, to resume that session
+    :param revision: the last revision received on the previous connection, when resuming a session
+    :return: the hello frame
+    """
+    hello = {'name': name, 'codecs': list(codecs), 'features': list(features)}
+    if document is not None:
+        hello['document'] = document
+    if token is not None:
+        hello['token'] = token
+        hello['revision'] = revision
+    return HELLO_MAGIC + BinaryCodec().encode(hello)
+
+
+def parseHello(data):
+    """
+    Parse the first frame sent by a client
+    :param data: the received frame
+    :return: the hello data, with at least 'name', 'codecs', 'features' and 'document'
+    :raise ValueError: if the hello is malformed
+    """
+    data = _asBytes(data)
+    if not data.startswith(HELLO_MAGIC):
+        # older clients only send their name and speak JSON
+        return {'name': _toStr(data), 'codecs': [JSON], 'features': [], 'document': DEFAULT_DOCUMENT}
+    hello = BinaryCodec().decode(data[len(HELLO_MAGIC):])
+    if not isinstance(hello, dict):
+        raise ValueError('Malformed hello')
+    hello.setdefault('features', [])
+    hello.setdefault('document', DEFAULT_DOCUMENT)
+    if not isinstance(hello.get('name'), _stringTypes) or not isinstance(hello['document'], _stringTypes) or \
+            not isinstance(hello.get('codecs'), list) or not isinstance(hello['features'], list):
+        raise ValueError('Malformed hello')
+    return hello
+
+
+def isBinary(data):
+    """
+    Check whether a frame is binary encoded, as JSON frames always start with '{'
+    :param data: the received frame
+    :return: True if binary, False if JSON
+    """
+    return len(data) > 0 and bytearray(data[:1])[0] == BINARY_VERSION
+
+
+class JsonCodec(object):
+    """
+    The JSON encoding, kept for clients that do not support the binary one
+    """
+    __slots__ = ()
+
+    name = JSON
+
+    def encode(self, packet):
+        """
+        Encode a packet
+        :param packet: the packet
+        :return: the encoded packet
+        """
+        return _toBytes(json.dumps(packet))
+
+    def encodeBatch(self, encodedPackets):
+        """
+        Create a batch of already encoded packets
+        :param encodedPackets: the encoded packets
+        :return: the list of buffers making up the batch, sharing the encoded packets
+        """
+        buffers = [b'{"type": "batch", "data": [']
+        for encoded in encodedPackets:
+            buffers.append(encoded)
+            buffers.append(b', ')
+        buffers[-1] = b']}'
+        return buffers
+
+    def decode(self, data):
+        """
+        Decode a packet
+        :param data: the encoded packet
+        :return: the packet
+        """
+        if not PY2:
+            return json.loads(_toStr(data))
+        return self.__toUtf8(json.loads(_asBytes(data)))
+
+    def __toUtf8(self, data):
+        """
+        Encode received data to UTF-8
+        :param data: the data to be encoded
+        :return: the UTF-8 encoded data
+        """
+        if isinstance(data, dict):
+            d2 = {}
+            for key, value in data.iteritems():
+                d2[self.__toUtf8(key)] = self.__toUtf8(value)
+            return d2
+        elif isinstance(data, list):
+            return map(self.__toUtf8, data)
+        elif isinstance(data, unicode):
+            return data.encode('utf-8')
+        else:
+            return data
+
+
+def _writeVarint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _writeString(out, string):
+    data = _toBytes(string)
+    _writeVarint(out, len(data))
+    out.extend(data)
+
+
+def _writeLines(out, lines):
+    _writeVarint(out, len(lines))
+    for line in lines:
+        _writeString(out, line)
+
+
+class BinaryCodec(object):
+    """
+    Compact binary encoding with typed values: integer op codes and field ids, varint numbers,
+    length-prefixed UTF-8 strings and integer session ids instead of repeated user names.
+    Every frame starts with a version byte followed by its kind.
+    """
+    __slots__ = 'idsByName', 'namesById'
+
+    name = BINARY
+
+    def __init__(self):
+        """
+        Initializer
+        """
+        # Session ids of the known users, learnt from the dictionaries introducing them
+        self.idsByName = {}
+        self.namesById = {}
+
+    def addSession(self, sessionId, name):
+        """
+        Register a user's session id
+        :param sessionId: the session id
+        :param name: the user name
+        :return: None
+        """
+        self.idsByName[name] = sessionId
+        self.namesById[sessionId] = name
+
+    def removeSession(self, name):
+        """
+        Forget a user's session id
+        :param name: the user name
+        :return: None
+        """
+        sessionId = self.idsByName.pop(name, None)
+        if sessionId is not None:
+            self.namesById.pop(sessionId, None)
+
+    def encode(self, packet):
+        """
+        Encode a packet
+        :param packet: the packet
+        :return: the encoded packet
+        """
+        out = bytearray((BINARY_VERSION, KIND_PACKET))
+        self.__write(out, packet, None, packet.get('type') in SESSION_PACKET_TYPES)
+        return bytes(out)
+
+    def encodeBatch(self, encodedPackets):
+        """
+        Create a batch of already encoded packets
+        :param encodedPackets: the encoded packets
+        :return: the list of buffers making up the batch, sharing the encoded packets
+        """
+        header = bytearray((BINARY_VERSION, KIND_BATCH))
+        _writeVarint(header, len(encodedPackets))
+        buffers = [bytes(header)]
+        for encoded in encodedPackets:
+            length = bytearray()
+            _writeVarint(length, len(encoded))
+            buffers.append(bytes(length))
+            buffers.append(encoded)
+        return buffers
+
+    def decode(self, data):
+        """
+        Decode a packet in a single pass
+        :param data: the encoded packet
+        :return: the packet
+        """
+        if isinstance(data, bytearray) or (isinstance(data, memoryview) and not PY2):
+            # indexing gives integers, so the frame is read in place
+            buf = data
+        else:
+            buf = bytearray(_asBytes(data))
+        if buf[0] != BINARY_VERSION:
+            raise ValueError('Unsupported binary protocol version ' + str(buf[0]))
+        if buf[1] == KIND_BATCH:
+            count, pos = self.__readVarint(buf, 2)
+            packets = []
+            for i in range(count):
+                length, pos = self.__readVarint(buf, pos)
+                packets.append(self.decode(buf[pos:pos + length]))
+                pos += length
+            packet = {'type': 'batch', 'data': packets}
+        else:
+            packet, pos = self.__read(buf, 2)
+        # slicing past the end does not fail, so a truncated string is only noticed here
+        if pos != len(buf):
+            raise ValueError('Malformed binary frame of ' + str(len(buf)) + ' bytes')
+        return packet
+
+    def __write(self, out, value, field, useSessions):
+        """
+        Append a tagged value
+        :param out: the output buffer
+        :param value: the value
+        :param field: the key of the value in its dictionary, if any
+        :param useSessions: whether user names are replaced by their session id
+        :return: None
+        """
+        if value is None:
+            out.append(T_NONE)
+        elif value is True:
+            out.append(T_TRUE)
+        elif value is False:
+            out.append(T_FALSE)
+        elif isinstance(value, _intTypes):
+            out.append(T_INT)
+            _writeVarint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, _stringTypes):
+            if field in CONSTANT_FIELDS and value in CONSTANT_IDS:
+                out.append(T_CONST)
+                _writeVarint(out, CONSTANT_IDS[value])
+            elif field == 'name' and useSessions and value in self.idsByName:
+                out.append(T_SESSION)
+                _writeVarint(out, self.idsByName[value])
+            else:
+                out.append(T_STR)
+                _writeString(out, value)
+        elif isinstance(value, dict):
+            out.append(T_DICT)
+            _writeVarint(out, len(value))
+            for key, item in value.items():
+                fieldId = FIELD_IDS.get(key)
+                if fieldId is None:
+                    out.append(0)
+                    _writeString(out, key)
+                else:
+                    _writeVarint(out, fieldId)
+                self.__write(out, item, key, useSessions)
+        elif isinstance(value, (list, tuple)):
+            if field == 'ops':
+                self.__writeOps(out, value)
+            elif value and all(isinstance(item, _stringTypes) for item in value):
+                # lines of text, without a tag for every line
+                if field in COMPRESSED_FIELDS:
+                    lines = bytearray()
+                    _writeLines(lines, value)
+                    data = zlib.compress(bytes(lines), COMPRESSION_LEVEL)
+                    out.append(T_ZLINES)
+                    _writeVarint(out, len(data))
+                    out.extend(data)
+                else:
+                    out.append(T_LINES)
+                    _writeLines(out, value)
+            else:
+                out.append(T_LIST)
+                _writeVarint(out, len(value))
+                for item in value:
+                    self.__write(out, item, None, useSessions)
+        else:
+            raise TypeError('Cannot encode ' + repr(value))
+
+    def __writeOps(self, out, ops):
+        """
+        Append edit operations: op code and varint positions, followed by the lines, text or count
+        :param out: the output buffer
+        :param ops: the list of operations
+        :return: None
+        """
+        out.append(T_OPS)
+        _writeVarint(out, len(ops))
+        for op in ops:
+            kind = op[0]
+            out.append(kind)
+            _writeVarint(out, op[1])
+            if kind == INSERT_LINES:
+                _writeVarint(out, len(op[2]))
+                for line in op[2]:
+                    _writeString(out, line)
+            elif kind == DELETE_LINES:
+                _writeVarint(out, op[2])
+            elif kind == INSERT_TEXT:
+                _writeVarint(out, op[2])
+                _writeString(out, op[3])
+            else:
+                _writeVarint(out, op[2])
+                _writeVarint(out, op[3])
+
+    def __readOps(self, buf, pos):
+        """
+        Read edit operations
+        :param buf: the input buffer
+        :param pos: the position following the tag
+        :return: the list of operations and the position following it
+        """
+        count, pos = self.__readVarint(buf, pos)
+        ops = []
+        for i in range(count):
+            kind = buf[pos]
+            line, pos = self.__readVarint(buf, pos + 1)
+            if kind == INSERT_LINES:
+                n, pos = self.__readVarint(buf, pos)
+                lines = []
+                for j in range(n):
+                    length, pos = self.__readVarint(buf, pos)
+                    lines.append(_toStr(buf[pos:pos + length]))
+                    pos += length
+                ops.append([kind, line, lines])
+            elif kind == DELETE_LINES:
+                n, pos = self.__readVarint(buf, pos)
+                ops.append([kind, line, n])
+            elif kind == INSERT_TEXT:
+                col, pos = self.__readVarint(buf, pos)
+                length, pos = self.__readVarint(buf, pos)
+                ops.append([kind, line, col, _toStr(buf[pos:pos + length])])
+                pos += length
+            else:
+                col, pos = self.__readVarint(buf, pos)
+                n, pos = self.__readVarint(buf, pos)
+                ops.append([kind, line, col, n])
+        return ops, pos
+
+    def __readLines(self, buf, pos):
+        """
+        Read lines of text
+        :param buf: the input buffer
+        :param pos: the position following the tag
+        :return: the list of lines and the position following it
+        """
+        count, pos = self.__readVarint(buf, pos)
+        lines = []
+        for i in range(count):
+            length, pos = self.__readVarint(buf, pos)
+            lines.append(_toStr(buf[pos:pos + length]))
+            pos += length
+        return lines, pos
+
+    def __readVarint(self, buf, pos):
+        result = 0
+        shift = 0
+        while True:
+            byte = buf[pos]
+            pos += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result, pos
+            shift += 7
+
+    def __read(self, buf, pos):
+        """
+        Read a tagged value
+        :param buf: the input buffer
+        :param pos: the position of the value's tag
+        :return: the value and the position following it
+        """
+        tag = buf[pos]
+        pos += 1
+        if tag == T_INT:
+            n, pos = self.__readVarint(buf, pos)
+            return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+        if tag == T_STR:
+            length, pos = self.__readVarint(buf, pos)
+            return _toStr(buf[pos:pos + length]), pos + length
+        if tag == T_LINES:
+            return self.__readLines(buf, pos)
+        if tag == T_ZLINES:
+            length, pos = self.__readVarint(buf, pos)
+            lines = bytearray(zlib.decompress(bytes(buf[pos:pos + length])))
+            return self.__readLines(lines, 0)[0], pos + length
+        if tag == T_DICT:
+            count, pos = self.__readVarint(buf, pos)
+            d = {}
+            for i in range(count):
+                fieldId, pos = self.__readVarint(buf, pos)
+                if fieldId:
+                    key = FIELDS[fieldId - 1]
+                else:
+                    length, pos = self.__readVarint(buf, pos)
+                    key = _toStr(buf[pos:pos + length])
+                    pos += length
+                d[key], pos = self.__read(buf, pos)
+            if 'id' in d and 'name' in d:
+                # a user being introduced
+                self.addSession(d['id'], d['name'])
+            return d, pos
+        if tag == T_OPS:
+            return self.__readOps(buf, pos)
+        if tag == T_LIST:
+            count, pos = self.__readVarint(buf, pos)
+            items = []
+            for i in range(count):
+                item, pos = self.__read(buf, pos)
+                items.append(item)
+            return items, pos
+        if tag == T_SESSION:
+            sessionId, pos = self.__readVarint(buf, pos)
+            return self.namesById[sessionId], pos
+        if tag == T_CONST:
+            index, pos = self.__readVarint(buf, pos)
+            return CONSTANTS[index], pos
+        if tag == T_NONE:
+            return None, pos
+        if tag == T_TRUE:
+            return True, pos
+        if tag == T_FALSE:
+            return False, pos
+        raise ValueError('Unknown value tag ' + str(tag))
+
+
+def createCodec(name):
+    """
+    Create a codec
+    :param name: the name of the codec
+    :return: the codec
+    """
+    if name == BINARY:
+        return BinaryCodec()
+    return JsonCodec()